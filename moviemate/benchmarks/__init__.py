@@ -0,0 +1,62 @@
+"""
+    Benchmarks for the moviemate API, run from the moviemate/ directory:
+
+        python -m benchmarks.search --rows 1000000
+
+    Every benchmark works on its own SQLite file (never on db.sqlite3), created
+    with the project migrations and filled with synthetic data.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def setup_django(database_name=None, **overrides):
+    """
+    Configure Django with the project settings on a separate SQLite database and
+    apply the migrations. `overrides` replace settings (e.g. CACHES). Return the database path.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviemate.settings')
+
+    from django.conf import settings
+    if database_name is None:
+        database_name = os.path.join(tempfile.mkdtemp(prefix='moviemate-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = database_name  # Before any connection is opened
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return database_name
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(function, repeat=20, warmup=2):
+    """
+    Call `function` repeat times and return the latencies in milliseconds as
+    {'p50', 'p95', 'mean'}.
+    """
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'mean': statistics.fmean(samples),
+    }
@@ -0,0 +1,127 @@
+"""
+    Throughput of the sync read endpoints through the WSGI handler (a thread per
+    concurrent request, like a threaded WSGI server) against their async variants
+    through the ASGI handler (concurrent tasks on one event loop).
+
+        python -m benchmarks.async_views --requests 400 --concurrency 16
+
+    The response cache is disabled (DummyCache) so every request reaches the database.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import percentile, setup_django
+
+
+def populate(movies=200, platforms=20, reviews_per_movie=10):
+    from django.contrib.auth.models import User
+    from watchlist_app.models import Review, StreamPlatform, WatchList
+
+    users = User.objects.bulk_create([User(username=f'user{number}') for number in range(reviews_per_movie)])
+    platform_objects = StreamPlatform.objects.bulk_create(
+        [StreamPlatform(name=f'Platform {number}', about='About', website='https://example.com') for number in range(platforms)])
+    movie_objects = WatchList.objects.bulk_create(
+        [WatchList(title=f'Movie {number}', storyline='Storyline', platform=platform_objects[number % platforms])
+         for number in range(movies)])
+    Review.objects.bulk_create([Review(review_user=user, rating=1 + number % 5, description='Review', watchlist=movie)
+                                for movie in movie_objects for number, user in enumerate(users)])
+    return movie_objects[0].pk, platform_objects[0].pk
+
+
+def endpoints(movie_id, platform_id):
+    return {
+        'watchlist list': ('/watchlist/list/?page_size=20', '/watchlist/async/list/?page_size=20'),
+        'watchlist detail': (f'/watchlist/{movie_id}/', f'/watchlist/async/{movie_id}/'),
+        'review list': (f'/watchlist/{movie_id}/reviews/', f'/watchlist/async/{movie_id}/reviews/'),
+        'platform list': ('/watchlist/stream/?expand=watchlist', '/watchlist/async/stream/?expand=watchlist'),
+        'platform detail': (f'/watchlist/stream/{platform_id}/', f'/watchlist/async/stream/{platform_id}/'),
+    }
+
+
+def summary(latencies, elapsed):
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'mean': statistics.fmean(latencies),
+    }
+
+
+def run_wsgi(url, requests, concurrency):
+    from django.db import connection
+    from django.test import Client
+
+    def worker(count):
+        client = Client()
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        connection.close()  # Each thread has its own connection
+        return latencies
+
+    shares = [requests // concurrency + (index < requests % concurrency) for index in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = [latency for result in executor.map(worker, shares) for latency in result]
+    return summary(latencies, time.perf_counter() - start)
+
+
+def run_asgi(url, requests, concurrency):
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(requests)])
+        return summary(latencies, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400, help='requests per endpoint and mode')
+    parser.add_argument('--concurrency', type=int, default=16, help='requests in flight')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    setup_django(args.database, CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                 ALLOWED_HOSTS=['testserver'])
+    movie_id, platform_id = populate()
+
+    results = {}
+    for name, (sync_url, async_url) in endpoints(movie_id, platform_id).items():
+        results[name] = {
+            'wsgi': run_wsgi(sync_url, args.requests, args.concurrency),
+            'asgi': run_asgi(async_url, args.requests, args.concurrency),
+        }
+        for mode, result in results[name].items():
+            print(f'{name:17} {mode}  {result["requests_per_second"]:8.1f} req/s  '
+                  f'p50 {result["p50"]:8.2f} ms  p95 {result["p95"]:8.2f} ms')
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'requests': args.requests, 'concurrency': args.concurrency, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+    Synthetic catalog generator: platforms x movies x reviews x users.
+
+    Rows are written with bulk_create and the rating aggregates are computed once at
+    the end with one UPDATE, so a million reviews take seconds, not hours.
+"""
+
+import random
+
+SCALES = {
+    'small': {'platforms': 10, 'movies': 1000, 'users': 200, 'reviews': 5000},
+    'medium': {'platforms': 50, 'movies': 20000, 'users': 2000, 'reviews': 100000},
+    'large': {'platforms': 200, 'movies': 200000, 'users': 20000, 'reviews': 1000000},
+}
+
+PASSWORD = 'benchmark-password'  # Every generated user has it, hashed once
+WORDS = ('star dark night lost city river ocean fire ice storm shadow light blood moon sun king '
+         'queen house garden wild road war peace love story secret island winter summer golden').split()
+
+
+def generate(platforms, movies, users, reviews, seed=42, batch_size=5000):
+    """
+    Fill the database and return a dict with the ids the scenarios need.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+    from django.db.models.functions import Cast, Coalesce
+
+    from watchlist_app.models import Review, StreamPlatform, WatchList
+    from watchlist_app import leaderboards
+    from watchlist_app.ratings import rebuild_platform_counters, rebuild_rating_histograms
+
+    rng = random.Random(seed)
+    reviews = min(reviews, movies * users)  # One review per (movie, user)
+
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([User(username=f'user{number}', email=f'user{number}@example.com', password=password)
+                              for number in range(users)], batch_size=batch_size)
+    admin = User.objects.create(username='bench-admin', email='admin@example.com', password=password,
+                                is_staff=True, is_superuser=True)
+    StreamPlatform.objects.bulk_create([StreamPlatform(name=f'Platform {number}', about='About',
+                                                       website=f'https://platform{number}.example.com')
+                                        for number in range(platforms)], batch_size=batch_size)
+    platform_ids = list(StreamPlatform.objects.values_list('pk', flat=True))
+    user_ids = list(User.objects.filter(is_staff=False).values_list('pk', flat=True))
+
+    for start in range(0, movies, batch_size):
+        WatchList.objects.bulk_create([
+            WatchList(title=' '.join(rng.sample(WORDS, rng.randint(1, 3))).title() + f' {number}',
+                      storyline='Storyline', platform_id=rng.choice(platform_ids))
+            for number in range(start, min(movies, start + batch_size))
+        ])
+    movie_ids = list(WatchList.objects.values_list('pk', flat=True))
+
+    pairs = set()
+    while len(pairs) < reviews:
+        pairs.add((rng.choice(movie_ids), rng.choice(user_ids)))
+    pairs = sorted(pairs)
+    for start in range(0, len(pairs), batch_size):
+        Review.objects.bulk_create([
+            Review(watchlist_id=movie_id, review_user_id=user_id, rating=rng.randint(1, 5), description='Review')
+            for movie_id, user_id in pairs[start:start + batch_size]
+        ])
+
+    # Rating aggregates for every movie in one statement
+    per_movie = Review.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+    count = Coalesce(Subquery(per_movie.annotate(value=Count('pk')).values('value')), 0)
+    total = Coalesce(Subquery(per_movie.annotate(value=Sum('rating')).values('value')), 0)
+    WatchList.objects.update(number_ratings=count, rating_sum=total)
+    WatchList.objects.filter(number_ratings__gt=0).update(
+        avg_rating=Cast(F('rating_sum'), FloatField()) / Cast(F('number_ratings'), FloatField()))
+    WatchList.objects.filter(number_ratings=0).update(avg_rating=Value(0.0))
+    rebuild_platform_counters()
+    rebuild_rating_histograms()
+    leaderboards.rebuild_review_days()  # Every review is from today
+    leaderboards.rollup()
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')  # Planner statistics and the row count estimates of the paginator
+
+    busiest = (Review.objects.values('watchlist').annotate(total=Count('pk')).order_by('-total')
+               .values_list('watchlist', flat=True).first())
+    return {
+        'admin_id': admin.pk,
+        'user_ids': user_ids,
+        'platform_ids': platform_ids,
+        'movie_ids': movie_ids,
+        'busiest_movie_id': busiest or movie_ids[0],
+        'username': User.objects.get(pk=user_ids[0]).username,
+    }
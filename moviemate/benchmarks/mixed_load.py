@@ -0,0 +1,170 @@
+"""
+    Mixed read/write throughput with the development database settings against the
+    production profile (moviemate/settings_production.py).
+
+        python -m benchmarks.mixed_load --threads 8 --seconds 20 --write-ratio 0.2
+
+    'before' runs with moviemate.settings: SQLite with the rollback journal, a new
+    connection per request and DEBUG=True. 'after' runs with
+    moviemate.settings_production: WAL, synchronous=NORMAL, busy_timeout, BEGIN
+    IMMEDIATE, persistent connections and the GETs of watchlist_app read through the
+    'replica' connection. Each profile runs in its own process on its own copy of the
+    synthetic catalog (benchmarks/data.py).
+
+    `--threads` threads call the WSGI handler like a threaded WSGI server, so the
+    connections are opened and closed by request_started/request_finished as in
+    production. Each iteration is a review creation (POST, `--write-ratio` of them)
+    or a GET of the movie list, a movie, its reviews or the platforms. The response
+    cache is a DummyCache so every GET reaches the database, and the throttles have
+    unreachable rates.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import percentile, setup_django
+
+PROFILES = {
+    'before': 'moviemate.settings',
+    'after': 'moviemate.settings_production',
+}
+SCALE = {'platforms': 20, 'movies': 5000, 'users': 500, 'reviews': 20000}
+
+
+def wsgi_call(handler, environ):
+    status = {}
+
+    def start_response(line, headers, exc_info=None):
+        status['code'] = int(line.split()[0])
+
+    response = handler(environ, start_response)
+    try:
+        b''.join(response)
+    finally:
+        response.close()  # request_finished: closes the connection unless it's persistent
+    return status['code']
+
+
+def run(threads, seconds, write_ratio, seed):
+    from django.contrib.auth.models import User
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from watchlist_app.models import StreamPlatform, WatchList
+
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    movie_ids = list(WatchList.objects.values_list('pk', flat=True))
+    platform_ids = list(StreamPlatform.objects.values_list('pk', flat=True))
+    writers = [User.objects.create(username=f'writer{number}') for number in range(threads)]
+    tokens = [f'Bearer {AccessToken.for_user(user)}' for user in writers]
+
+    deadline = time.perf_counter() + seconds
+    results = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        auth = tokens[index]
+        to_review = iter(rng.sample(movie_ids, len(movie_ids)))  # A user reviews a movie once
+        latencies = {'read': [], 'write': []}
+        errors = 0
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                kind = 'write'
+                body = json.dumps({'rating': rng.randint(1, 5), 'description': 'Benchmark'})
+                environ = factory.post(f'/watchlist/{next(to_review)}/review-create/', body,
+                                       content_type='application/json', HTTP_AUTHORIZATION=auth).environ
+            else:
+                kind = 'read'
+                path = rng.choice([
+                    '/watchlist/list/',
+                    f'/watchlist/{rng.choice(movie_ids)}/',
+                    f'/watchlist/{rng.choice(movie_ids)}/reviews/',
+                    f'/watchlist/stream/{rng.choice(platform_ids)}/',
+                ])
+                environ = factory.get(path, HTTP_AUTHORIZATION=auth).environ
+            start = time.perf_counter()
+            code = wsgi_call(handler, environ)
+            elapsed = (time.perf_counter() - start) * 1000
+            if code >= 500:
+                errors += 1
+            else:
+                latencies[kind].append(elapsed)
+        with lock:
+            results.append((latencies, errors))
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    summary = {'seconds': round(elapsed, 1), 'errors_5xx': sum(errors for _, errors in results)}
+    for kind in ('read', 'write'):
+        samples = [latency for latencies, _ in results for latency in latencies[kind]]
+        summary[f'{kind}s_per_second'] = round(len(samples) / elapsed, 1)
+        summary[f'{kind}_p50_ms'] = round(percentile(samples, 50), 1) if samples else None
+        summary[f'{kind}_p99_ms'] = round(percentile(samples, 99), 1) if samples else None
+    summary['requests_per_second'] = round(summary['reads_per_second'] + summary['writes_per_second'], 1)
+    return summary
+
+
+def child(args):
+    """
+    Run one profile in this process, the settings can only be chosen once per process.
+    """
+    database = os.path.join(tempfile.mkdtemp(prefix='moviemate-mixed-'), 'bench.sqlite3')
+    os.environ['DJANGO_SETTINGS_MODULE'] = PROFILES[args.profile]
+    os.environ.setdefault('MOVIEMATE_SECRET_KEY', 'benchmark-secret-key')
+    os.environ['MOVIEMATE_DATABASE_PATH'] = database  # Also the file of the 'replica' connection
+
+    from moviemate import settings as project_settings
+    rest_framework = dict(project_settings.REST_FRAMEWORK)
+    rest_framework['DEFAULT_THROTTLE_RATES'] = {scope: '1000000/s' for scope in rest_framework['DEFAULT_THROTTLE_RATES']}
+    setup_django(database, ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=rest_framework,
+                 CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+    from django.db import connections
+    from benchmarks.data import generate
+    generate(**SCALE)
+    connections.close_all()  # The threads open their own
+
+    print(json.dumps(run(args.threads, args.seconds, args.write_ratio, args.seed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--seconds', type=float, default=20, help='duration of each profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of review creations')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)  # Set for the child processes
+    args = parser.parse_args()
+
+    if args.profile:
+        return child(args)
+
+    results = {}
+    for profile in PROFILES:
+        command = [sys.executable, '-m', 'benchmarks.mixed_load', '--profile', profile, '--threads', str(args.threads),
+                   '--seconds', str(args.seconds), '--write-ratio', str(args.write_ratio), '--seed', str(args.seed)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps({'cpus': os.cpu_count(), 'threads': args.threads, 'write_ratio': args.write_ratio,
+                      'scale': SCALE, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+    Registrations per second per core, legacy path against the current one.
+
+        python -m benchmarks.registration --registrations 40 --concurrency 8
+
+    'before' is the registration path as it was: the password hashed on the request
+    thread, a DRF Token inserted by the post_save receiver and the email uniqueness
+    check scanning auth_user. 'after' is the current code: the hash goes to the
+    bounded executor (requests beyond its queue get a 503), no Token and the email
+    index. Requests go through the WSGI handler from `--concurrency` threads, like a
+    threaded WSGI server; `--existing` users are created first so the email check
+    has a table to search.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import count
+from unittest.mock import patch
+
+from benchmarks import percentile, setup_django
+
+
+def populate(existing):
+    from django.contrib.auth.models import User
+    User.objects.bulk_create([User(username=f'existing{number}', email=f'existing{number}@example.com')
+                              for number in range(existing)], batch_size=5000)
+
+
+def legacy_path(stack):
+    """
+    Put back the serial hashing, the Token receiver and the unindexed email lookup.
+    """
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.db import connection
+    from django.db.models.signals import post_save
+    from rest_framework.authtoken.models import Token
+
+    def create_auth_token(sender, instance=None, created=False, **kwargs):
+        if created:
+            Token.objects.create(user=instance)
+
+    stack.enter_context(patch('user_app.api.serializers.hash_password', make_password))
+    post_save.connect(create_auth_token, sender=settings.AUTH_USER_MODEL, dispatch_uid='bench_auth_token')
+    stack.callback(post_save.disconnect, sender=settings.AUTH_USER_MODEL, dispatch_uid='bench_auth_token')
+    with connection.cursor() as cursor:
+        cursor.execute('DROP INDEX IF EXISTS auth_user_email_idx')
+    stack.callback(lambda: connection.cursor().execute('CREATE INDEX IF NOT EXISTS auth_user_email_idx ON auth_user (email)'))
+
+
+def run(mode, registrations, concurrency, numbers):
+    from django.db import connection
+    from django.test import Client
+
+    def worker(total):
+        client = Client()
+        latencies, rejected = [], 0
+        try:
+            for _ in range(total):
+                number = next(numbers)
+                body = {'username': f'new{number}', 'email': f'new{number}@example.com',
+                        'password': 'a-strong-password', 'password2': 'a-strong-password'}
+                start = time.perf_counter()
+                response = client.post('/account/register/', json.dumps(body), content_type='application/json')
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code == 201:
+                    latencies.append(elapsed)
+                elif response.status_code == 503:
+                    rejected += 1
+                else:
+                    raise RuntimeError(f'{mode}: unexpected {response.status_code} {response.content[:200]}')
+        finally:
+            connection.close()
+        return latencies, rejected
+
+    shares = [registrations // concurrency + (index < registrations % concurrency) for index in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for result in results for latency in result[0]]
+    per_second = len(latencies) / elapsed
+    return {
+        'registered': len(latencies),
+        'rejected_503': sum(result[1] for result in results),
+        'registrations_per_second': round(per_second, 2),
+        'registrations_per_second_per_core': round(per_second / (os.cpu_count() or 1), 2),
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registrations', type=int, default=40, help='registration attempts per mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--existing', type=int, default=100000, help='users created before the run')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    args = parser.parse_args()
+
+    from moviemate import settings as project_settings
+    databases = project_settings.DATABASES
+    databases['default'].setdefault('OPTIONS', {})['timeout'] = 60  # Concurrent INSERTs wait for the write lock
+    setup_django(args.database, DEBUG=False, ALLOWED_HOSTS=['testserver'], DATABASES=databases)
+    populate(args.existing)
+
+    numbers = count()
+    results = {}
+    with ExitStack() as stack:
+        legacy_path(stack)
+        results['before'] = run('before', args.registrations, args.concurrency, numbers)
+    results['after'] = run('after', args.registrations, args.concurrency, numbers)
+
+    print(json.dumps({'cpus': os.cpu_count(), 'concurrency': args.concurrency, 'existing_users': args.existing,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
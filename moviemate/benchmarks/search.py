@@ -0,0 +1,118 @@
+"""
+    ?search= on the watchlist: icontains LIKE scans (DRF SearchFilter) against the
+    FTS5 index and the in-process inverted index, on a synthetic catalog.
+
+        python -m benchmarks.search --rows 1000000 --repeat 20
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks import measure, setup_django
+
+
+WORDS = (
+    'star wars trek dust night day dark knight return empire lost city river ocean '
+    'fire ice storm shadow light last first blood moon sun king queen house garden '
+    'wild road war peace love story secret island mountain winter summer red blue '
+    'black white golden silver iron stone glass heart mind dream ghost machine future'
+).split()
+
+QUERIES = ['star', 'sta', 'dark knight', 'gol', 'winter netflix', 'zzz']
+
+
+def populate(rows, platforms=50, seed=42):
+    """
+    Insert `platforms` platforms and `rows` titles in bulk, the FTS triggers index them on insert.
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    rng = random.Random(seed)
+    now = timezone.now().isoformat()
+    names = ['Netflix', 'Hulu', 'Prime Video', 'Disney Plus', 'HBO Max'] + [f'Platform {n}' for n in range(platforms)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO watchlist_app_streamplatform (name, about, website, created, updated) VALUES (%s, %s, %s, %s, %s)',
+            [(name, '', '', now, now) for name in names[:platforms]],
+        )
+        cursor.execute('SELECT id FROM watchlist_app_streamplatform')
+        platform_ids = [row[0] for row in cursor.fetchall()]
+
+    batch = 20000
+    for start in range(0, rows, batch):
+        values = [
+            (' '.join(rng.sample(WORDS, rng.randint(1, 4))).title()[:50], 'Storyline',
+             rng.choice(platform_ids), True, 0, 0, 0, now, now)
+            for _ in range(min(batch, rows - start))
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO watchlist_app_watchlist (title, storyline, platform_id, active, avg_rating, '
+                'number_ratings, rating_sum, created, updated) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)',
+                values,
+            )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def run(rows, repeat, skip_inverted):
+    from django.db.models import Q
+    from watchlist_app.models import WatchList
+    from watchlist_app.search import FTS5SearchBackend, InvertedIndexSearchBackend
+
+    start = time.perf_counter()
+    populate(rows)
+    print(f'populated {rows} rows in {time.perf_counter() - start:.1f}s')
+
+    base = WatchList.objects.order_by('-created', '-id')
+
+    def like(query):
+        # What filters.SearchFilter builds for search_fields = ['title', 'platform__name']
+        queryset = base
+        for term in query.split():
+            queryset = queryset.filter(Q(title__icontains=term) | Q(platform__name__icontains=term))
+        return queryset
+
+    backends = {'like': like}
+    fts = FTS5SearchBackend()
+    if fts.is_available('default'):
+        backends['fts5'] = lambda query: fts.search(base, query.split()).order_by('search_rank', '-created', '-id')
+    if not skip_inverted:
+        inverted = InvertedIndexSearchBackend()
+        start = time.perf_counter()
+        inverted.ensure_fresh()
+        print(f'inverted index built in {time.perf_counter() - start:.1f}s')
+        backends['inverted'] = lambda query: inverted.search(base, query.split()).order_by('search_rank', '-created', '-id')
+
+    results = {}
+    for query in QUERIES:
+        for name, build in backends.items():
+            # One page of results plus the COUNT(*) of WatchListPagination
+            timing = measure(lambda: (list(build(query)[:4]), build(query).count()), repeat=repeat)
+            results.setdefault(query, {})[name] = timing
+            print(f'{query!r:18} {name:9} p50 {timing["p50"]:9.2f} ms  p95 {timing["p95"]:9.2f} ms')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='number of synthetic titles')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per query and backend')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--skip-inverted', action='store_true', help="don't build the in-process index")
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    database = setup_django(args.database)
+    print(f'database {database}')
+    results = run(args.rows, args.repeat, args.skip_inverted)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'rows': args.rows, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
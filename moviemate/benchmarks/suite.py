@@ -0,0 +1,516 @@
+"""
+    Benchmark suite for every route of watchlist_app/api/urls.py and user_app/api/urls.py.
+
+        python -m benchmarks.suite --scale small --output results.json
+        python -m benchmarks.suite --scale small --baseline benchmarks/baseline.json
+
+    For each scenario it reports latency percentiles (p50/p95/p99), queries per
+    request and the peak Python memory allocated while serving one request
+    (tracemalloc, measured in a separate pass so it doesn't slow the timed one).
+    With --baseline, more queries, or p95/memory above the tolerance, are reported
+    as regressions and the exit status is 1. benchmarks/baseline.json is a small
+    scale run; its query counts hold anywhere, compare latency and memory against
+    a baseline written on the same machine.
+
+    Requests go through the full Django stack (middleware, JWT auth, DRF) with the
+    test client. Throttles get unreachable rates and the response cache is cleared
+    before every request unless --warm-cache is given.
+"""
+
+import argparse
+import json
+import os
+import platform as platform_module
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from itertools import count
+
+from benchmarks import percentile, setup_django
+from benchmarks.data import PASSWORD, SCALES, generate
+
+
+Request = namedtuple('Request', 'method path data content_type headers')
+Scenario = namedtuple('Scenario', 'name route build expect')
+
+SCENARIOS = []
+_unique = count()
+
+
+def scenario(name, route, expect=(200,)):
+    def register(build):
+        SCENARIOS.append(Scenario(name, route, build, expect))
+        return build
+    return register
+
+
+def get(path, query=None, token=None):
+    return Request('get', path, query or {}, None, _auth(token))
+
+
+def send_json(method, path, body, token=None):
+    return Request(method, path, json.dumps(body), 'application/json', _auth(token))
+
+
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+class Context:
+    """
+    Ids of the generated data plus helpers for scenarios that need fresh rows.
+    """
+
+    def __init__(self, ids):
+        self.__dict__.update(ids)
+        self.started = datetime.now(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+        self._tokens = {}
+
+    def token(self, user_id):
+        from django.contrib.auth.models import User
+        from rest_framework_simplejwt.tokens import AccessToken
+        if user_id not in self._tokens:
+            self._tokens[user_id] = str(AccessToken.for_user(User.objects.get(pk=user_id)))
+        return self._tokens[user_id]
+
+    def fresh_user(self):
+        from django.contrib.auth.models import User
+        return User.objects.create(username=f'bench-{next(_unique)}-{time.time_ns()}')
+
+    def fresh_movie(self):
+        from watchlist_app.models import WatchList
+        return WatchList.objects.create(title=f'Fresh movie {next(_unique)}', storyline='Storyline',
+                                        platform_id=self.platform_ids[0])
+
+    def fresh_review(self):
+        from watchlist_app.models import Review
+        return Review.objects.create(review_user=self.fresh_user(), watchlist_id=self.busiest_movie_id,
+                                     rating=3, description='Review')
+
+
+def url(name, *args):
+    from django.urls import reverse
+    return reverse(name, args=args)
+
+
+# -------------- watchlist_app ---------------
+
+@scenario('watchlist list', 'watchlist-list')
+def _(ctx):
+    return get(url('watchlist-list'), {'page_size': 20})
+
+
+@scenario('watchlist list top rated', 'watchlist-list')
+def _(ctx):
+    return get(url('watchlist-list'), {'page_size': 20, 'ordering': '-avg_rating'})
+
+
+@scenario('watchlist list sparse', 'watchlist-list')
+def _(ctx):
+    return get(url('watchlist-list'), {'page_size': 20, 'fields': 'id,title,avg_rating'})
+
+
+@scenario('watchlist similar', 'watchlist-similar')
+def _(ctx):
+    return get(url('watchlist-similar', ctx.busiest_movie_id))
+
+
+@scenario('watchlist create', 'watchlist-list', expect=(201,))
+def _(ctx):
+    body = {'title': f'New movie {next(_unique)}', 'storyline': 'Storyline', 'platform': ctx.platform_ids[0]}
+    return send_json('post', url('watchlist-list'), body, ctx.token(ctx.user_ids[0]))
+
+
+@scenario('watchlist detail', 'watchlist-detail')
+def _(ctx):
+    return get(url('watchlist-detail', ctx.busiest_movie_id))
+
+
+@scenario('watchlist update', 'watchlist-detail')
+def _(ctx):
+    body = {'title': f'Updated movie {next(_unique)}', 'storyline': 'Storyline', 'platform': ctx.platform_ids[0]}
+    return send_json('put', url('watchlist-detail', ctx.movie_ids[-1]), body, ctx.token(ctx.admin_id))
+
+
+@scenario('watchlist delete', 'watchlist-detail', expect=(204,))
+def _(ctx):
+    return send_json('delete', url('watchlist-detail', ctx.fresh_movie().pk), {}, ctx.token(ctx.admin_id))
+
+
+@scenario('watchlist filter', 'watchlist-filter')
+def _(ctx):
+    return get(url('watchlist-filter'), {'page_size': 20, 'page': 3})
+
+
+@scenario('watchlist search', 'watchlist-filter')
+def _(ctx):
+    return get(url('watchlist-filter'), {'search': 'star ni', 'page_size': 20})
+
+
+@scenario('watchlist filter ordered', 'watchlist-filter')
+def _(ctx):
+    return get(url('watchlist-filter'), {'ordering': '-number_ratings', 'page_size': 20})
+
+
+@scenario('watchlist bulk create', 'watchlist-bulk', expect=(201,))
+def _(ctx):
+    batch = next(_unique)
+    body = [{'title': f'Bulk movie {batch}-{number}', 'storyline': 'Storyline', 'platform': ctx.platform_ids[number % len(ctx.platform_ids)]}
+            for number in range(100)]
+    return send_json('post', url('watchlist-bulk'), body, ctx.token(ctx.admin_id))
+
+
+@scenario('watchlist export', 'watchlist-export')
+def _(ctx):
+    return get(url('watchlist-export'), {}, ctx.token(ctx.admin_id))
+
+
+@scenario('platform list', 'streamplatform-list')
+def _(ctx):
+    return get(url('streamplatform-list'))
+
+
+@scenario('platform list expanded', 'streamplatform-list')
+def _(ctx):
+    return get(url('streamplatform-list'), {'expand': 'watchlist', 'watchlist_limit': 10})
+
+
+@scenario('platform list expanded sparse', 'streamplatform-list')
+def _(ctx):
+    return get(url('streamplatform-list'), {'expand': 'watchlist', 'watchlist_limit': 10,
+                                            'fields': 'url,name,watchlist.id,watchlist.title,watchlist.avg_rating'})
+
+
+@scenario('leaderboard top rated', 'watchlist-leaderboard')
+def _(ctx):
+    return get(url('watchlist-leaderboard', 'top-rated'))
+
+
+@scenario('leaderboard trending platform', 'watchlist-leaderboard')
+def _(ctx):
+    from watchlist_app.models import StreamPlatform
+    return get(url('watchlist-leaderboard', 'trending'), {'platform': StreamPlatform.objects.values_list('pk', flat=True).first()})
+
+
+@scenario('platform summary', 'streamplatform-summary')
+def _(ctx):
+    return get(url('streamplatform-summary'))
+
+
+@scenario('platform create', 'streamplatform-list', expect=(201,))
+def _(ctx):
+    body = {'name': f'Platform {next(_unique)}', 'about': 'About', 'website': 'https://example.com'}
+    return send_json('post', url('streamplatform-list'), body, ctx.token(ctx.admin_id))
+
+
+@scenario('platform detail', 'streamplatform-detail')
+def _(ctx):
+    return get(url('streamplatform-detail', ctx.platform_ids[0]), {'expand': 'watchlist'})
+
+
+@scenario('platform update', 'streamplatform-detail')
+def _(ctx):
+    body = {'name': f'Platform {next(_unique)}', 'about': 'About', 'website': 'https://example.com'}
+    return send_json('put', url('streamplatform-detail', ctx.platform_ids[-1]), body, ctx.token(ctx.admin_id))
+
+
+@scenario('platform delete', 'streamplatform-detail', expect=(204,))
+def _(ctx):
+    from watchlist_app.models import StreamPlatform
+    platform = StreamPlatform.objects.create(name='Short lived', about='About', website='https://example.com')
+    return send_json('delete', url('streamplatform-detail', platform.pk), {}, ctx.token(ctx.admin_id))
+
+
+@scenario('api root', 'api-root')
+def _(ctx):
+    return get(url('api-root'))
+
+
+@scenario('review list', 'review-list')
+def _(ctx):
+    return get(url('review-list', ctx.busiest_movie_id))
+
+
+@scenario('review histogram', 'review-histogram')
+def _(ctx):
+    return get(url('review-histogram', ctx.busiest_movie_id))
+
+
+@scenario('review create', 'review-create', expect=(201,))
+def _(ctx):
+    return send_json('post', url('review-create', ctx.busiest_movie_id), {'rating': 4, 'description': 'Good'},
+                     ctx.token(ctx.fresh_user().pk))
+
+
+@scenario('review detail', 'review-detail')
+def _(ctx):
+    from watchlist_app.models import Review
+    return get(url('review-detail', Review.objects.values_list('pk', flat=True).first()))
+
+
+@scenario('review update', 'review-detail')
+def _(ctx):
+    review = ctx.fresh_review()
+    return send_json('put', url('review-detail', review.pk), {'rating': 5, 'description': 'Better'},
+                     ctx.token(review.review_user_id))
+
+
+@scenario('review delete', 'review-detail', expect=(204,))
+def _(ctx):
+    review = ctx.fresh_review()
+    return send_json('delete', url('review-detail', review.pk), {}, ctx.token(review.review_user_id))
+
+
+@scenario('review bulk import', 'review-bulk', expect=(201,))
+def _(ctx):
+    from django.contrib.auth.models import User
+    batch = next(_unique)
+    users = User.objects.bulk_create([User(username=f'bulk-{batch}-{number}-{time.time_ns()}') for number in range(100)])
+    body = [{'watchlist': ctx.busiest_movie_id, 'review_user': user.username, 'rating': 1 + number % 5}
+            for number, user in enumerate(users)]
+    return send_json('post', url('review-bulk'), body, ctx.token(ctx.admin_id))
+
+
+@scenario('review export delta', 'review-export')
+def _(ctx):
+    return get(url('review-export'), {'since': ctx.started}, ctx.token(ctx.admin_id))
+
+
+@scenario('user reviews', 'user-review-detail')
+def _(ctx):
+    return get(url('user-review-detail'), {'username': ctx.username})
+
+
+@scenario('async watchlist list', 'async-watchlist-list')
+def _(ctx):
+    return get(url('async-watchlist-list'), {'page_size': 20})
+
+
+@scenario('async watchlist detail', 'async-watchlist-detail')
+def _(ctx):
+    return get(url('async-watchlist-detail', ctx.busiest_movie_id))
+
+
+@scenario('async review list', 'async-review-list')
+def _(ctx):
+    return get(url('async-review-list', ctx.busiest_movie_id))
+
+
+@scenario('async platform list', 'async-streamplatform-list')
+def _(ctx):
+    return get(url('async-streamplatform-list'))
+
+
+@scenario('async platform detail', 'async-streamplatform-detail')
+def _(ctx):
+    return get(url('async-streamplatform-detail', ctx.platform_ids[0]))
+
+
+# -------------- user_app ---------------
+
+@scenario('register', 'register', expect=(201,))
+def _(ctx):
+    number = f'{next(_unique)}-{time.time_ns()}'
+    body = {'username': f'new-{number}', 'email': f'new-{number}@example.com',
+            'password': 'a-strong-password', 'password2': 'a-strong-password'}
+    return send_json('post', url('register'), body)
+
+
+@scenario('token obtain', 'token_obtain_pair')
+def _(ctx):
+    return send_json('post', url('token_obtain_pair'), {'username': ctx.username, 'password': PASSWORD})
+
+
+@scenario('token refresh', 'token_refresh')
+def _(ctx):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    refresh = RefreshToken.for_user(User.objects.get(pk=ctx.user_ids[0]))  # Rotation may invalidate a reused one
+    return send_json('post', url('token_refresh'), {'refresh': str(refresh)})
+
+
+# -------------- runner ---------------
+
+def route_names():
+    """
+    Names of every route declared by the two API url modules.
+    """
+    from django.urls import URLPattern, URLResolver
+    from user_app.api.urls import urlpatterns as user_patterns
+    from watchlist_app.api.urls import urlpatterns as watchlist_patterns
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                yield pattern.name
+    return set(walk(watchlist_patterns)) | set(walk(user_patterns))
+
+
+def send(client, request):
+    response = getattr(client, request.method)(request.path, data=request.data, content_type=request.content_type,
+                                               headers=request.headers) if request.content_type else \
+        getattr(client, request.method)(request.path, data=request.data, headers=request.headers)
+    if response.streaming:
+        b''.join(response.streaming_content)  # Streaming responses do their work while being consumed
+    return response
+
+
+def run_scenario(item, ctx, iterations, warmup, memory_iterations, warm_cache):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    latencies, statuses = [], set()
+    for iteration in range(warmup + iterations):
+        request = item.build(ctx)
+        if not warm_cache:
+            cache.clear()
+        start = time.perf_counter()
+        response = send(client, request)
+        elapsed = (time.perf_counter() - start) * 1000
+        statuses.add(response.status_code)
+        if iteration >= warmup:
+            latencies.append(elapsed)
+
+    queries, memory = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            request = item.build(ctx)
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                send(client, request)
+                memory.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+            queries.append(len(captured))
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'route': item.route,
+        'method': item.build(ctx).method.upper(),
+        'statuses': sorted(statuses),
+        'ok': statuses <= set(item.expect),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': sum(latencies) / len(latencies),
+        'queries': sorted(queries)[len(queries) // 2],
+        'queries_max': max(queries),
+        'memory_kib': sorted(memory)[len(memory) // 2],
+    }
+
+
+def compare(results, baseline, tolerance, min_latency_ms=1.0, min_memory_kib=64):
+    """
+    Return the regressions of `results` against a stored run. Latency and memory need to
+    grow by more than `tolerance` and the absolute floor, any extra query counts.
+    """
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        if current['queries'] > before['queries']:
+            regressions.append(f'{name}: queries {before["queries"]} -> {current["queries"]}')
+        if current['p95'] > before['p95'] * (1 + tolerance) and current['p95'] - before['p95'] > min_latency_ms:
+            regressions.append(f'{name}: p95 {before["p95"]:.2f} -> {current["p95"]:.2f} ms')
+        if (current['memory_kib'] > before['memory_kib'] * (1 + tolerance)
+                and current['memory_kib'] - before['memory_kib'] > min_memory_kib):
+            regressions.append(f'{name}: memory {before["memory_kib"]:.0f} -> {current["memory_kib"]:.0f} KiB')
+    return regressions
+
+
+def metadata(args, scale):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    import django
+    return {
+        'scale': scale,
+        'iterations': args.iterations,
+        'warm_cache': args.warm_cache,
+        'commit': commit,
+        'python': platform_module.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform_module.machine(),
+        'date': datetime.now(dt_timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for name in ('platforms', 'movies', 'users', 'reviews'):
+        parser.add_argument(f'--{name}', type=int, help=f'override the number of {name} of the scale')
+    parser.add_argument('--iterations', type=int, default=30, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per scenario first')
+    parser.add_argument('--memory-iterations', type=int, default=5, help='requests of the memory/queries pass')
+    parser.add_argument('--only', help='run the scenarios whose name contains this text')
+    parser.add_argument('--warm-cache', action='store_true', help="don't clear the response cache between requests")
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth of p95 and memory')
+    args = parser.parse_args()
+
+    from moviemate import settings as project_settings
+    rest_framework = dict(project_settings.REST_FRAMEWORK)
+    rest_framework['DEFAULT_THROTTLE_RATES'] = {scope: '1000000/s' for scope in rest_framework['DEFAULT_THROTTLE_RATES']}
+    setup_django(args.database, DEBUG=False, ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=rest_framework,
+                 SIMILAR_TITLES_PATH=os.path.join(tempfile.mkdtemp(prefix='moviemate-bench-'), 'similar.bin'))
+
+    scale = dict(SCALES[args.scale])
+    scale.update({name: getattr(args, name) for name in scale if getattr(args, name) is not None})
+    start = time.perf_counter()
+    ctx = Context(generate(**scale))
+    from watchlist_app.recommendations import build_similar_titles
+    build_similar_titles(full=True)
+    print(f'generated {scale} in {time.perf_counter() - start:.1f}s')
+
+    uncovered = sorted(route_names() - {item.route for item in SCENARIOS})
+    if uncovered:
+        print(f'WARNING routes without a scenario: {", ".join(uncovered)}')
+
+    results = {}
+    for item in SCENARIOS:
+        if args.only and args.only not in item.name:
+            continue
+        result = results[item.name] = run_scenario(item, ctx, args.iterations, args.warmup,
+                                                   args.memory_iterations, args.warm_cache)
+        flag = '' if result['ok'] else f'  UNEXPECTED STATUS {result["statuses"]}'
+        print(f'{item.name:26} {result["method"]:6} p50 {result["p50"]:8.2f}  p95 {result["p95"]:8.2f}  '
+              f'p99 {result["p99"]:8.2f} ms  {result["queries"]:3} queries  {result["memory_kib"]:8.1f} KiB{flag}')
+
+    output = {'meta': metadata(args, scale), 'uncovered_routes': uncovered, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(output, handle, indent=2, sort_keys=True)
+
+    failed = [name for name, result in results.items() if not result['ok']]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if not regressions:
+            print('No regressions against the baseline.')
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+    In-process request histograms for RequestMetricsMiddleware and the /metrics/ endpoint.
+
+    Every (view, method) pair gets histograms for total time, DB time, serializer time,
+    render time, queries and response size with fixed buckets, so recording is a few
+    additions under a lock and memory doesn't grow with the traffic. Views are labelled
+    by URL name, never by path, to keep the number of series bounded.
+
+    The numbers are per process: behind several workers each one answers /metrics/
+    with its own share of the traffic.
+"""
+
+import json
+import threading
+from bisect import bisect_left
+from ipaddress import ip_address
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+
+DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+HISTOGRAMS = {
+    'request_duration_ms': DURATION_BUCKETS_MS,
+    'db_duration_ms': DURATION_BUCKETS_MS,
+    'serialize_duration_ms': DURATION_BUCKETS_MS,
+    'render_duration_ms': DURATION_BUCKETS_MS,
+    'queries': QUERY_BUCKETS,
+    'response_bytes': SIZE_BUCKETS,
+}
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, `counts[i]` holds the values <= buckets[i] (last one is +Inf).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, method, status, values, n_plus_one):
+        """
+        `values` maps the names of HISTOGRAMS to the measurements of one request,
+        missing names (e.g. no render for a streaming response) are skipped.
+        """
+        with self._lock:
+            entry = self._views.get((view, method))
+            if entry is None:
+                entry = self._views[(view, method)] = {
+                    'histograms': {name: Histogram(buckets) for name, buckets in HISTOGRAMS.items()},
+                    'statuses': {},
+                    'n_plus_one': 0,
+                }
+            for name, value in values.items():
+                entry['histograms'][name].observe(value)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            entry['n_plus_one'] += n_plus_one
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                f'{method} {view}': {
+                    'statuses': {str(status): count for status, count in entry['statuses'].items()},
+                    'n_plus_one': entry['n_plus_one'],
+                    **{name: {'count': histogram.count, 'sum': round(histogram.sum, 3),
+                              'buckets': {str(bound): total for bound, total in histogram.cumulative()}}
+                       for name, histogram in entry['histograms'].items()},
+                }
+                for (view, method), entry in sorted(self._views.items())
+            }
+
+    def as_prometheus(self):
+        """
+        Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            items = sorted(self._views.items())
+            for name in HISTOGRAMS:
+                lines.append(f'# TYPE moviemate_{name} histogram')
+                for (view, method), entry in items:
+                    labels = f'view="{view}",method="{method}"'
+                    histogram = entry['histograms'][name]
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'moviemate_{name}_bucket{{{labels},le="{bound}"}} {total}')
+                    lines.append(f'moviemate_{name}_sum{{{labels}}} {histogram.sum:.3f}')
+                    lines.append(f'moviemate_{name}_count{{{labels}}} {histogram.count}')
+            lines.append('# TYPE moviemate_responses_total counter')
+            for (view, method), entry in items:
+                for status, count in sorted(entry['statuses'].items()):
+                    lines.append(f'moviemate_responses_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines.append('# TYPE moviemate_n_plus_one_total counter')
+            for (view, method), entry in items:
+                lines.append(f'moviemate_n_plus_one_total{{view="{view}",method="{method}"}} {entry["n_plus_one"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def is_local_request(request):
+    """
+    Loopback addresses, settings.INTERNAL_IPS and staff users may read the metrics.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    try:
+        if ip_address(address).is_loopback:
+            return True
+    except ValueError:
+        pass
+    if address in getattr(settings, 'INTERNAL_IPS', ()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    Aggregated request histograms, Prometheus text by default or JSON with ?format=json.
+    """
+    if not is_local_request(request):
+        raise Http404  # Don't advertise the endpoint
+    if request.GET.get('format') == 'json':
+        return HttpResponse(json.dumps(registry.as_dict(), indent=2), content_type='application/json')
+    return HttpResponse(registry.as_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,205 @@
+"""
+    Per-request instrumentation.
+
+    Every database connection gets an execute wrapper (record_query) that counts the
+    queries and their time into the metrics of the current request, found through a
+    context variable. The async views run their queries in sync_to_async threads with
+    their own connections, the context variable follows them there, so their queries
+    are counted too. The middleware also collects the serializer time (see `timed`)
+    and the render time of DRF responses. The numbers go out as a
+    Server-Timing header, which browsers show in the network panel, and into the
+    histograms of moviemate.metrics served at /metrics/.
+
+    The same SQL statement run many times in one request is the signature of an N+1
+    (e.g. one platform query per movie when `platform_name` isn't select_related):
+    those requests get an `n-plus-one` Server-Timing entry and a warning in the
+    'moviemate.middleware' logger with the statement.
+
+    The cost per request is a few perf_counter() calls per query and a dict update,
+    cheap enough to leave on in production. Queries of streaming responses run after
+    the middleware has returned and aren't counted.
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from moviemate.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Measurements of one request, also the execute wrapper of its connections.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = {}
+        self.phases = {}
+        self._depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def duplicates(self, threshold):
+        """
+        Return [(count, sql)] of the statements run at least `threshold` times, most repeated first.
+        """
+        return sorted(((count, sql) for sql, count in self.statements.items() if count >= threshold), reverse=True)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, records into the metrics of the request running the query.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_wrapper(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def wrap_new_connection(sender, connection, **kwargs):
+    # Connections are per thread, e.g. the ones opened by the async ORM's sync_to_async threads
+    install_wrapper(connection)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time spent in the block, minus its queries, to `phase` of the current
+    request. Nested blocks (e.g. nested serializers) are counted once by the outermost.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._depth:
+        yield
+        return
+    metrics._depth += 1
+    start, db_start = perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics._depth -= 1
+        metrics.add_phase(phase, perf_counter() - start - (metrics.db_time - db_start))
+
+
+class RequestMetricsMiddleware:
+    """
+    Put it right after SecurityMiddleware so the total includes the other middleware.
+    Sync and async: under ASGI the async views are served without a hop to a thread.
+
+    settings:
+        METRICS_SERVER_TIMING          send the Server-Timing header (default True)
+        METRICS_N_PLUS_ONE_THRESHOLD   repeats of one statement flagged as N+1 (default 5)
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', True)
+        self.n_plus_one_threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    @staticmethod
+    def start():
+        for connection in connections.all():
+            install_wrapper(connection)  # Opened before this module was loaded, connection_created already fired
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), perf_counter()
+
+    def finish(self, request, response, metrics, total):
+        duplicates = metrics.duplicates(self.n_plus_one_threshold)
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else '<unmatched>'
+        for count, sql in duplicates:
+            logger.warning('Possible N+1 in %s %s: %d times %s', request.method, view, count, sql)
+
+        values = {
+            'request_duration_ms': total * 1000,
+            'db_duration_ms': metrics.db_time * 1000,
+            'queries': metrics.queries,
+        }
+        for phase in ('serialize', 'render'):
+            if phase in metrics.phases:
+                values[f'{phase}_duration_ms'] = metrics.phases[phase] * 1000
+        if not response.streaming:
+            values['response_bytes'] = len(response.content)
+        registry.record(view, request.method, response.status_code, values, len(duplicates))
+
+        if self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(values, metrics, duplicates)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns, time it up to the post render callback
+        metrics = _current.get()
+        if metrics is not None:
+            start = perf_counter()
+            response.add_post_render_callback(lambda rendered: metrics.add_phase('render', perf_counter() - start))
+        return response
+
+    @staticmethod
+    def server_timing_header(values, metrics, duplicates):
+        entries = [f'db;dur={values["db_duration_ms"]:.2f};desc="{metrics.queries} queries"']
+        for phase in ('serialize', 'render'):
+            if f'{phase}_duration_ms' in values:
+                entries.append(f'{phase};dur={values[f"{phase}_duration_ms"]:.2f}')
+        entries.append(f'total;dur={values["request_duration_ms"]:.2f}')
+        if 'response_bytes' in values:
+            entries.append(f'size;desc="{values["response_bytes"]} bytes"')
+        if duplicates:
+            entries.append(f'n-plus-one;desc="{duplicates[0][0]} identical statements"')
+        return ', '.join(entries)
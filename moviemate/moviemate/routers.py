@@ -0,0 +1,85 @@
+"""
+    Read/write splitting for the production profile (moviemate/settings_production.py).
+
+    ReplicaPinMiddleware marks the GET/HEAD requests handled by the views of
+    REPLICA_APPS and ReadReplicaRouter sends their reads to the DATABASE_REPLICA_ALIAS
+    connection; everything else, and every write, goes to 'default'.
+
+    A replica may lag behind the primary, so a client that has just written is pinned
+    to the primary for REPLICA_PIN_SECONDS: its next GETs read its own writes. Clients
+    are told apart by their Authorization header or, without one, their address; the
+    pins live in the default cache, which must be shared by the workers (e.g. Redis)
+    for a pin to follow the client to another process.
+"""
+
+import hashlib
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_PREFIX = 'db-pin:'
+
+_read_alias = ContextVar('read_alias', default=None)  # Set by the middleware for the requests that may use the replica
+
+
+class ReadReplicaRouter:
+    """
+    Reads of the marked requests go to the replica, the rest of the traffic to 'default'.
+    Migrations only run on 'default', the replica is a copy of it.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Same data on both connections
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """
+    settings:
+        DATABASE_REPLICA_ALIAS   connection of the reads (default 'replica', the router is off without it)
+        REPLICA_APPS             apps whose views read from the replica (default ('watchlist_app',))
+        REPLICA_PIN_SECONDS      time a client reads from the primary after a write (default 5)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica')
+        self.apps = tuple(getattr(settings, 'REPLICA_APPS', ('watchlist_app',)))
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        self.enabled = self.alias in settings.DATABASES
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_read_alias_token', None)
+            if token is not None:
+                _read_alias.reset(token)
+        if self.enabled and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            cache.set(self.pin_key(request), True, self.pin_seconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return None
+        if view_func.__module__.split('.')[0] not in self.apps:
+            return None
+        if cache.get(self.pin_key(request)):
+            return None  # Wrote a moment ago, the replica may not have it yet
+        request._read_alias_token = _read_alias.set(self.alias)
+        return None
+
+    @staticmethod
+    def pin_key(request):
+        client = request.headers.get('Authorization') or request.META.get('REMOTE_ADDR', '')
+        return PIN_PREFIX + hashlib.md5(client.encode('utf-8')).hexdigest()
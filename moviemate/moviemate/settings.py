@@ -42,10 +42,12 @@ INSTALLED_APPS = [
     'django_filters',  # Django filters for filtering querysets
     'rest_framework_simplejwt.token_blacklist',
     'watchlist_app',  # Custom app for movie management
+    'user_app',  # Registration, JWT login/logout and their migrations and commands
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'moviemate.middleware.RequestMetricsMiddleware',  # Server-Timing header, N+1 warnings and the /metrics/ histograms
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -132,7 +134,8 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticated', # Default permission class to require authentication for all API views
         # 'rest_framework.authentication.BasicAuthentication', # Basic authentication (not recommended for production)
         # 'rest_framework.authentication.TokenAuthentication',  # Token authentication for REST Framework
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # 'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user_app.api.authentication.CachedJWTAuthentication',  # JWTAuthentication with the token and user cached by jti
     ),
     # 'DEFAULT_THROTTLE_CLASSES': [
     #     'rest_framework.throttling.AnonRateThrottle',
@@ -145,6 +148,10 @@ REST_FRAMEWORK = {
         'review-list': '10/day',  # Custom throttle rate for review listing
         'review-detail': '3/day',  # Custom throttle rate for review detail
     },
+    'DEFAULT_RENDERER_CLASSES': [
+        'watchlist_app.api.renderers.FastJSONRenderer',  # JSONRenderer's JSON, encoded with orjson when installed (float spelling and NaN differ)
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     # 'PAGE_SIZE': 3
 }
@@ -155,4 +162,41 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,  # Enable token rotation
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),  # Set access token lifetime to 30 minutes
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
-}
\ No newline at end of file
+    "TOKEN_OBTAIN_SERIALIZER": "user_app.api.serializers.ClaimsTokenObtainPairSerializer",  # Tokens with the is_staff claim
+    "TOKEN_REFRESH_SERIALIZER": "user_app.api.serializers.ClaimsTokenRefreshSerializer",
+}
+
+# JWT authentication (user_app/api/authentication.py)
+JWT_AUTH_CACHE_SIZE = 10000  # Verified tokens kept in each process
+JWT_AUTH_STATELESS = False  # True builds request.user from the token claims, without loading the user
+JWT_BLACKLIST_FILTER_CAPACITY = 100000  # Blacklisted jtis in the Bloom filter before it's rebuilt bigger (user_app/api/blacklist.py)
+JWT_BLACKLIST_FILTER_SYNC_INTERVAL = 30  # Seconds between reads of the rows blacklisted by other processes
+
+# Full-text search backend for ?search= on the watchlist (watchlist_app/search.py).
+# FTS5 falls back to the in-process inverted index when the FTS5 table doesn't exist.
+WATCHLIST_SEARCH_BACKEND = 'watchlist_app.search.FTS5SearchBackend'
+
+# Per-process memory cache, fine for runserver. The response cache needs a cache shared by the workers
+# (watchlist_app/api/caching.py, CACHE_TIMEOUT), `check --deploy` rejects this one: see settings_production.py
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Encoded JSON of the watchlist and platform rows kept in each process (watchlist_app/api/caching.py), 0 disables it
+JSON_FRAGMENT_CACHE_SIZE = 10000
+
+# Top-K similar titles per movie, built by `manage.py build_similar_titles` and mapped by the workers (watchlist_app/recommendations.py)
+SIMILAR_TITLES_PATH = BASE_DIR / 'similar_titles.bin'
+SIMILAR_TITLES_K = 20
+
+# Leaderboards (watchlist_app/leaderboards.py), `manage.py rollup_leaderboards` after changing them
+LEADERBOARD_PRIOR_MEAN = 3.0  # Rating of a movie without reviews
+LEADERBOARD_PRIOR_WEIGHT = 10  # Reviews it takes to move halfway from the prior to the movie's own mean
+LEADERBOARD_TRENDING_HALF_LIFE_DAYS = 7
+LEADERBOARD_BUCKET_DAYS = 28  # Daily buckets kept, a review counts 1/16 of a new one at the end of the window
+
+# Request instrumentation (moviemate/middleware.py)
+METRICS_SERVER_TIMING = True
+METRICS_N_PLUS_ONE_THRESHOLD = 5  # Times the same SQL statement may run in one request before it's flagged as N+1
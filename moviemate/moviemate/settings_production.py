@@ -0,0 +1,92 @@
+"""
+Production settings for moviemate: DJANGO_SETTINGS_MODULE=moviemate.settings_production
+
+Everything not set here comes from moviemate/settings.py. The secrets and hosts are
+read from the environment:
+
+    MOVIEMATE_SECRET_KEY      required
+    MOVIEMATE_ALLOWED_HOSTS   comma separated, e.g. "api.example.com,localhost"
+    MOVIEMATE_DATABASE_PATH   SQLite file of the primary (default db.sqlite3)
+    MOVIEMATE_REPLICA_PATH    SQLite file of a replica (e.g. LiteFS/Litestream), default
+                              the primary file through a second, read-only connection
+    MOVIEMATE_REDIS_URL       shared cache for the response cache and the replica pins
+    MOVIEMATE_CACHE_DIR       without Redis, directory of a file cache shared by the
+                              workers of this host (default <tmp>/moviemate-cache)
+
+The database runs in WAL mode: readers no longer wait for the writer (and the other
+way round), busy_timeout makes a second writer wait for the lock instead of failing
+with "database is locked", and synchronous=NORMAL only syncs at checkpoints, which
+is durable in WAL mode except for the last transactions on a power loss. Writes start
+with BEGIN IMMEDIATE so a read that turns into a write can't deadlock on the upgrade.
+"""
+
+import os
+import tempfile
+
+from moviemate.settings import *  # noqa: F401,F403
+
+DEBUG = False  # With DEBUG every query is also kept in connection.queries
+
+SECRET_KEY = os.environ['MOVIEMATE_SECRET_KEY']
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('MOVIEMATE_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+DATABASE_PATH = os.environ.get('MOVIEMATE_DATABASE_PATH', str(BASE_DIR / 'db.sqlite3'))  # noqa: F405
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': 600,  # One connection per worker thread, reused between requests
+        'CONN_HEALTH_CHECKS': True,  # A reused connection is checked before the request that gets it
+        'OPTIONS': {
+            'init_command': (f'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; '
+                             f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};'),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('MOVIEMATE_REPLICA_PATH', DATABASE_PATH),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # journal_mode is a property of the file, set by the primary; query_only refuses writes
+            'init_command': f'PRAGMA query_only=ON; PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};',
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Reads of the watchlist_app GETs on the replica, a client that just wrote reads the primary (moviemate/routers.py)
+DATABASE_ROUTERS = ['moviemate.routers.ReadReplicaRouter']
+DATABASE_REPLICA_ALIAS = 'replica'
+REPLICA_APPS = ('watchlist_app',)
+REPLICA_PIN_SECONDS = 5
+
+MIDDLEWARE = [*MIDDLEWARE]  # noqa: F405
+MIDDLEWARE.insert(MIDDLEWARE.index('moviemate.middleware.RequestMetricsMiddleware') + 1,
+                  'moviemate.routers.ReplicaPinMiddleware')
+
+# The response cache invalidates through tag versions that every worker must see (watchlist_app/api/caching.py),
+# a per-process LocMemCache would keep serving stale responses from the workers that didn't handle the write
+if os.environ.get('MOVIEMATE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['MOVIEMATE_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',  # Shared by the processes of one host only
+            'LOCATION': os.environ.get('MOVIEMATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'moviemate-cache')),
+        },
+    }
+
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
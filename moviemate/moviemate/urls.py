@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from moviemate.metrics import metrics_view
+
 # from watchlist_app import urls as watchlist_urls
 
 urlpatterns = [
@@ -24,4 +26,5 @@ urlpatterns = [
     path('watchlist/', include('watchlist_app.api.urls')), # Para agregar una url de otra app (modulo), se usa include que espera un archivo urls.py dentro de la app pasar como str
     # path('api-auth/', include('rest_framework.urls')),  # Para la autenticación de la API de Django REST Framework (temporal para pruebas, no es recomendable usarlo en producción)
     path('account/', include('user_app.api.urls')),  # Include the user app URLs for user management
+    path('metrics/', metrics_view, name='metrics'),  # Request histograms, only for local addresses and staff
 ]
@@ -0,0 +1,206 @@
+"""
+    JWT authentication without a database round trip on every request.
+
+    CachedJWTAuthentication keeps the verified token and the resolved user in a bounded
+    in-process LRU keyed by the token `jti`. An entry lives until the token expires; a
+    hit only compares the raw token with the cached one, so neither the signature
+    check nor the `SELECT ... FROM auth_user` run again. Saving or deleting a user
+    (deactivation, staff changes, login) evicts its entries in this process.
+
+    With settings.JWT_AUTH_STATELESS the user isn't loaded at all: request.user is a
+    TokenUser built from the `user_id` and `is_staff` claims, which is all that
+    IsAdminOrReadOnly and IsReviewUserOrReadOnly need. The claims are stamped by
+    ClaimsRefreshToken at login and refreshed from the database on every token refresh,
+    so a change reaches the API within ACCESS_TOKEN_LIFETIME. A deactivated user can't
+    refresh, but keeps the access token already issued until it expires.
+
+    The cache is per process and `QuerySet.update()` doesn't send signals: deactivate
+    users with save() and, with several workers, expect the other processes to notice
+    when the token expires.
+"""
+
+import json
+import threading
+import time
+from base64 import urlsafe_b64decode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from user_app.api.blacklist import blacklist_filter
+
+
+def add_user_claims(token, user):
+    """
+    Claims the stateless authentication reads instead of the user row.
+    """
+    token['is_staff'] = user.is_staff
+    return token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user claims, copied to its access tokens, and checked
+    against the blacklist through the in-memory filter of user_app.api.blacklist.
+    """
+
+    user = None  # Set by ClaimsTokenRefreshSerializer, which has already loaded it
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+    @property
+    def access_token(self):
+        if self.token is not None:
+            # Token sent back for a refresh: the claims may be stale, the rotated token gets them too
+            user = self.user
+            if user is None:
+                user = get_user_model().objects.filter(
+                    **{api_settings.USER_ID_FIELD: self.payload.get(api_settings.USER_ID_CLAIM)}
+                ).only('is_staff').first()
+            if user is not None:
+                add_user_claims(self, user)
+        return super().access_token
+
+    def outstand(self):
+        if self.user is None:
+            return super().outstand()
+        # RefreshToken.outstand without loading the user again
+        return OutstandingToken.objects.get_or_create(jti=self.payload[api_settings.JTI_CLAIM], defaults={
+            'user': self.user,
+            'created_at': self.current_time,
+            'token': str(self),
+            'expires_at': datetime_from_epoch(self.payload['exp']),
+        })
+
+    def check_blacklist(self):
+        # The Bloom filter answers the common "not blacklisted" case without the query
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+class TokenCache:
+    """
+    Thread safe LRU of jti -> (raw token, validated token, user, expiry timestamp).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, jti, raw_token, now):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            if entry[0] != raw_token or entry[3] <= now:
+                # Another token with the same jti is never trusted, an expired one is validated again
+                self._remove(jti)
+                return None
+            self._entries.move_to_end(jti)
+            return entry
+
+    def set(self, jti, raw_token, validated_token, user, expires):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        with self._lock:
+            if jti in self._entries:
+                self._remove(jti)
+            self._entries[jti] = (raw_token, validated_token, user, expires)
+            self._by_user.setdefault(user_id, set()).add(jti)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for jti in list(self._by_user.get(user_id, ())):
+                self._remove(jti)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, jti):
+        entry = self._entries.pop(jti)
+        user_id = entry[1].get(api_settings.USER_ID_CLAIM)
+        jtis = self._by_user.get(user_id)
+        if jtis is not None:
+            jtis.discard(jti)
+            if not jtis:
+                del self._by_user[user_id]
+
+
+token_cache = TokenCache(getattr(settings, 'JWT_AUTH_CACHE_SIZE', 10000))
+
+
+def unverified_jti(raw_token):
+    """
+    Read the jti of a raw token without checking it, only to look up the cache.
+    """
+    try:
+        payload = raw_token.split(b'.')[1]
+        return json.loads(urlsafe_b64decode(payload + b'=' * (-len(payload) % 4))).get(api_settings.JTI_CLAIM)
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with the verified tokens and their users cached by jti,
+    or without user lookups at all when settings.JWT_AUTH_STATELESS is set.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stateless = getattr(settings, 'JWT_AUTH_STATELESS', False)
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        now = time.time()
+        jti = unverified_jti(raw_token)
+        entry = token_cache.get(jti, raw_token, now) if jti else None
+        if entry is not None:
+            return entry[2], entry[1]
+
+        validated_token = self.get_validated_token(raw_token)
+        user = self.get_user(validated_token)
+        if validated_token.get(api_settings.JTI_CLAIM) == jti and jti:
+            token_cache.set(jti, raw_token, validated_token, user, validated_token['exp'])
+        return user, validated_token
+
+    def get_user(self, validated_token):
+        if self.stateless:
+            if api_settings.USER_ID_CLAIM not in validated_token:
+                return super().get_user(validated_token)  # Raises the usual "no recognizable user" error
+            return TokenUser(validated_token)
+        return super().get_user(validated_token)
+
+
+def evict_user_tokens(sender, instance, **kwargs):
+    # Deactivation, staff changes or deletion: the next request resolves the user again
+    token_cache.evict_user(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+post_save.connect(evict_user_tokens, sender=settings.AUTH_USER_MODEL, dispatch_uid='evict_user_tokens_save')
+post_delete.connect(evict_user_tokens, sender=settings.AUTH_USER_MODEL, dispatch_uid='evict_user_tokens_delete')
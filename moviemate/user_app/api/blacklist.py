@@ -0,0 +1,137 @@
+"""
+    In-memory front for the refresh token blacklist.
+
+    simplejwt checks every refresh token against BlacklistedToken with a join on
+    OutstandingToken. Almost every token refreshed is *not* blacklisted, so each
+    process keeps a Bloom filter of the blacklisted jtis: a miss proves the token is
+    clean without touching the database, a hit (real or a ~0.1% false positive)
+    falls back to simplejwt's query.
+
+    The front must never miss a blacklisted jti. Blacklisting adds the jti to the filter
+    of this process and to the default cache until the token expires, where the other
+    processes find it; every SYNC_INTERVAL seconds each process also reads the rows
+    blacklisted since its last sync, including those written without signals (e.g.
+    bulk_create). With several processes the default cache must be shared, as for the
+    response cache.
+
+    Pruned tokens stay in the filter as harmless false positives until it outgrows its
+    capacity and is rebuilt from the table.
+"""
+
+import math
+import threading
+import time
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+KEY_PREFIX = 'token-blacklist:'
+SYNC_ID_OVERLAP = 1000  # Ids are taken at INSERT but seen at COMMIT, a late commit can land below the last id read
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for `capacity` items at `error_rate` false positives, no false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions out of two 64-bit halves of one digest
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+    def add(self, item, new=True):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += new
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    Process-wide Bloom filter of the blacklisted jtis, kept in sync with the table.
+    """
+
+    def __init__(self, capacity, error_rate, sync_interval):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = None
+        self.last_id = 0
+        self.synced_at = 0.0
+
+    def add(self, jti):
+        with self._lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def might_contain(self, jti):
+        """
+        False only when `jti` is certainly not blacklisted.
+        """
+        with self._lock:
+            self._sync()
+            if jti in self.bloom:
+                return True
+        return cache.get(KEY_PREFIX + jti) is not None  # Blacklisted by another process since the last sync
+
+    def _sync(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self.synced_at < self.sync_interval:
+            return
+
+        if self.bloom is None or self.bloom.count > self.bloom.capacity:
+            rows = BlacklistedToken.objects.values_list('id', 'token__jti')
+            capacity = self.initial_capacity
+            total = rows.count()
+            while capacity < total * 2:
+                capacity *= 2
+            self.bloom = BloomFilter(capacity, self.error_rate)
+            self.last_id = 0
+        else:
+            rows = BlacklistedToken.objects.filter(id__gt=self.last_id - SYNC_ID_OVERLAP).values_list('id', 'token__jti')
+
+        seen = self.last_id
+        for row_id, jti in rows.order_by('id').iterator(chunk_size=2000):
+            self.bloom.add(jti, new=row_id > seen)  # The overlap is added again, not counted again
+            self.last_id = max(self.last_id, row_id)
+        self.synced_at = now
+
+
+blacklist_filter = BlacklistFilter(
+    capacity=getattr(settings, 'JWT_BLACKLIST_FILTER_CAPACITY', 100000),
+    error_rate=getattr(settings, 'JWT_BLACKLIST_FILTER_ERROR_RATE', 0.001),
+    sync_interval=getattr(settings, 'JWT_BLACKLIST_FILTER_SYNC_INTERVAL', 30),
+)
+
+
+def blacklisted(sender, instance, created, **kwargs):
+    if not created:
+        return
+    token = instance.token
+    blacklist_filter.add(token.jti)
+    remaining = (token.expires_at - timezone.now()).total_seconds()
+    if remaining > 0:
+        # Before the commit: a rolled back blacklist only costs a database check
+        cache.set(KEY_PREFIX + token.jti, 1, timeout=math.ceil(remaining))
+
+
+post_save.connect(blacklisted, sender=BlacklistedToken, dispatch_uid='token_blacklist_filter')
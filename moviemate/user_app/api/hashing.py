@@ -0,0 +1,86 @@
+"""
+    Bounded executor for password hashing.
+
+    PBKDF2 at Django's default 1,000,000 iterations takes ~0.5s of CPU per password.
+    hashlib releases the GIL while it runs, so the work can go to a small pool of
+    threads: at most PASSWORD_HASHING_WORKERS hashes run at once per process and
+    PASSWORD_HASHING_QUEUE more may wait. Beyond that `hash_password` raises
+    HashingBusy (503 with Retry-After) right away, so a signup spike is turned away
+    instead of piling up in the server.
+
+    It only caps concurrency: the request thread still waits on the future, so each
+    signup holds its worker for the queueing plus the hash, the pool doesn't free it.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many registrations in progress, try again shortly.'
+    default_code = 'hashing_busy'
+
+    def __init__(self, detail=None, code=None, wait=1):
+        super().__init__(detail, code)
+        self.wait = wait  # DRF's exception handler turns it into a Retry-After header
+
+
+class PasswordHasher:
+    """
+    ThreadPoolExecutor with a limit on running plus queued hashes.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._slots.release())
+        return future
+
+    def _get_executor(self):
+        # Created on first use, a forking server must not inherit the threads
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='password-hashing')
+        return self._executor
+
+
+password_hasher = PasswordHasher(
+    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1,
+    max_pending=getattr(settings, 'PASSWORD_HASHING_QUEUE', None) or 2 * (os.cpu_count() or 1),
+)
+
+
+def hash_password(password):
+    """
+    make_password on the bounded executor, raises HashingBusy when it is full.
+    Blocks the calling thread until the hash is done.
+    """
+    return password_hasher.submit(make_password, password).result()
+
+
+def set_password(user, raw_password):
+    """
+    user.set_password with the hash from the bounded executor. Keeps `_password` so
+    save() runs password_changed on the validators, like set_password does.
+    """
+    user.password = hash_password(raw_password)
+    user._password = raw_password
@@ -1,6 +1,13 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from user_app.api.authentication import ClaimsRefreshToken
+from user_app.api.hashing import set_password
 
 class RegistrationUserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(
@@ -30,7 +37,41 @@ class RegistrationUserSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"password": "Passwords do not match."})
         
         user = User(**validated_data)
-        user.set_password(password)
+        set_password(user, password)  # set_password en el executor acotado (503 si está lleno)
         user.save()
         
-        return user
\ No newline at end of file
+        return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Login returning tokens with the claims of the stateless authentication (is_staff).
+    """
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that stamps the current claims of the user on the new tokens.
+    """
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # TokenRefreshSerializer.validate, with the user it loads handed to the token for its claims
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id:
+            refresh.user = get_user_model().objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).first()
+            if refresh.user is None or not jwt_settings.USER_AUTHENTICATION_RULE(refresh.user):
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
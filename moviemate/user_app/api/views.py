@@ -2,8 +2,8 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework_simplejwt.tokens import RefreshToken
 
+from user_app.api.authentication import ClaimsRefreshToken
 from user_app.api.serializers import RegistrationUserSerializer
 # from user_app import models
 
@@ -29,7 +29,7 @@ class RegistrationView(APIView):
             # data['token'] = token
             
             # Token JWT
-            token = RefreshToken.for_user(user)
+            token = ClaimsRefreshToken.for_user(user)  # Incluye los claims (is_staff) de la autenticación stateless
             data['token'] = {
                 'refresh': str(token),
                 'access': str(token.access_token)
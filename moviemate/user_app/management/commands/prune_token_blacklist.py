@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+
+class Command(BaseCommand):
+    help = ('Delete expired outstanding refresh tokens and their blacklist entries in batches '
+            '(an expired token is rejected without them).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='tokens deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='seconds to wait between batches, lets other writers in on SQLite')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        last_id = 0
+        tokens = blacklisted = 0
+        while True:
+            # Walking the primary key: expired tokens are the oldest ones, no index on expires_at is needed
+            ids = list(OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=now)
+                       .order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                _, deleted = OutstandingToken.objects.filter(id__in=ids).delete()  # Cascades to BlacklistedToken
+            tokens += deleted.get('token_blacklist.OutstandingToken', 0)
+            blacklisted += deleted.get('token_blacklist.BlacklistedToken', 0)
+            last_id = ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f'Deleted {tokens} expired outstanding tokens and {blacklisted} blacklist entries.')
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index for the UniqueValidator on the registration email, auth_user.email has none
+    and every signup scanned the whole table. auth.User isn't ours, so it's plain SQL.
+
+    It was watchlist_app 0015, IF NOT EXISTS skips it on databases that already ran that one.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS auth_user_email_idx',
+        ),
+    ]
@@ -2,9 +2,18 @@ from django.db import models
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+
+
+def uses_token_authentication():
+    return any(issubclass(authentication, TokenAuthentication)
+               for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
-    if created:
+    # Con JWT el Token de DRF no se usa, crearlo sería un INSERT más en cada registro
+    if created and uses_token_authentication():
         Token.objects.create(user=instance)
\ No newline at end of file
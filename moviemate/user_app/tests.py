@@ -1,8 +1,29 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from uuid import uuid4
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from user_app.api.authentication import CachedJWTAuthentication, ClaimsRefreshToken, token_cache
+from user_app.api.blacklist import BloomFilter, blacklist_filter
+from user_app.api.hashing import PasswordHasher
 
 # from rest_framework_simplejwt.tokens import RefreshToken
 
@@ -63,11 +84,155 @@ class LoginRefreshTestCase(APITestCase):
             'password': 'testpassword'
         }, format='json').data['refresh'] # Get the refresh token from the login response
         
-        response = self.client.post(reverse('token_refresh'), {'refresh': token}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('token_refresh'), {'refresh': token}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('access', response.data) # Check if new access token is returned in the response
+        # The user is loaded once, for the active check, the claims and the outstanding token
+        self.assertEqual(sum('FROM "auth_user"' in query['sql'] for query in queries), 1)
         
         
         
         
 
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    """
+    Verified tokens are served from the cache until the user changes.
+    """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(username='testuser')
+        self.token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_cached_user(self):
+        with CaptureQueriesContext(connection) as first:
+            user, _ = self.authenticate(self.token)
+        with CaptureQueriesContext(connection) as second:
+            cached, _ = self.authenticate(self.token)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 0)
+        self.assertEqual(cached, user)
+
+    def test_deactivated_user(self):
+        self.authenticate(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token)
+
+    def test_same_jti_other_signature(self):
+        self.authenticate(self.token)
+        header, payload, signature = self.token.split('.')
+        with self.assertRaises(InvalidToken):
+            self.authenticate(f'{header}.{payload}.{signature[::-1]}')
+
+    @override_settings(JWT_AUTH_STATELESS=True)
+    def test_stateless_user(self):
+        self.user.is_staff = True
+        self.user.save()
+        token = self.client.post(reverse('token_refresh'), {'refresh': str(ClaimsRefreshToken.for_user(self.user))},
+                                 format='json').data['access']  # The refresh stamps the new is_staff
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = self.authenticate(token)
+        self.assertEqual(len(queries), 0)
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_staff)
+
+
+class TokenBlacklistTestCase(APITestCase):
+    """
+    Blacklisted refresh tokens are rejected, the clean ones are checked without queries.
+    """
+
+    def setUp(self):
+        cache.clear()
+        blacklist_filter.reset()
+        self.user = User.objects.create(username='testuser')
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        jtis = [uuid4().hex for _ in range(1000)]
+        for jti in jtis:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in jtis))
+        false_positives = sum(uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 50)  # ~0.1% expected
+
+    def test_blacklisted_token_rejected(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        refresh.blacklist()
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_blacklisted_by_another_process(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        ClaimsRefreshToken(str(refresh))  # Loads the filter
+        # Rows written without the signal are found by the periodic sync
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=refresh['jti']))])
+        ClaimsRefreshToken(str(refresh))  # Not seen before the next sync
+        blacklist_filter.synced_at -= blacklist_filter.sync_interval
+        with self.assertRaises(TokenError):
+            ClaimsRefreshToken(str(refresh))
+
+    def test_clean_token_skips_database(self):
+        first, second = ClaimsRefreshToken.for_user(self.user), ClaimsRefreshToken.for_user(self.user)
+        ClaimsRefreshToken(str(first))
+        with CaptureQueriesContext(connection) as queries:
+            ClaimsRefreshToken(str(second))
+        self.assertEqual(len(queries), 0)
+
+    def test_prune(self):
+        expired = ClaimsRefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+        live = ClaimsRefreshToken.for_user(self.user)
+        live.blacklist()
+
+        call_command('prune_token_blacklist', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(BlacklistedToken.objects.get().token.jti, live['jti'])
+
+
+class RegistrationHashingTestCase(APITestCase):
+    """
+    Registration hashes on the bounded executor and skips the unused DRF Token.
+    """
+
+    data = {'username': 'testuser', 'email': 'test@mail.com', 'password': 'testpassword', 'password2': 'testpassword'}
+
+    def test_register(self):
+        response = self.client.post(reverse('register'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(User.objects.get(username='testuser').check_password('testpassword'))
+        self.assertFalse(Token.objects.exists())
+
+    def test_password_changed(self):
+        with patch('django.contrib.auth.base_user.password_validation.password_changed') as password_changed:
+            response = self.client.post(reverse('register'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        password_changed.assert_called_once_with('testpassword', User.objects.get(username='testuser'))
+
+    def test_busy(self):
+        hasher = PasswordHasher(max_workers=1, max_pending=0)
+        release = threading.Event()
+        running = hasher.submit(release.wait)
+        try:
+            with patch('user_app.api.hashing.password_hasher', hasher):
+                response = self.client.post(reverse('register'), self.data, format='json')
+        finally:
+            release.set()
+            running.result()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(User.objects.exists())
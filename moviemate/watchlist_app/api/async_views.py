@@ -0,0 +1,138 @@
+"""
+    Async variants of the public read endpoints, for deployments under ASGI (moviemate/asgi.py).
+
+    DRF views are sync, under ASGI Django runs each of them in a thread. These views
+    are plain Django async views that reuse the configuration of their DRF
+    counterpart (`view_class`: queryset, filters, serializer, pagination, cache tags)
+    and read through the async ORM, so the event loop isn't blocked waiting on the
+    database. The JSON they return is the same as the sync endpoint's.
+
+    Requests are anonymous (no JWT lookup, these endpoints are public reads) and the
+    response is always JSON.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from watchlist_app.api.caching import cache_response
+from watchlist_app.api.pagination import WatchListCursorPagination
+from watchlist_app.api.renderers import FastJSONRenderer
+from watchlist_app.api.serializers import WatchListSerializer
+from watchlist_app.api.views import WatchListView, WatchDetailView, ReviewListView, StreamPlatformView
+from watchlist_app.models import WatchList
+
+
+class AsyncReadView(View):
+    """
+    Base async GET view configured by the DRF view in `view_class`.
+    """
+    view_class = None
+    view_initkwargs = {}
+    renderer_class = FastJSONRenderer
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request, authenticators=[])  # Anonymous, the user would be a sync DB lookup
+        self.view = self.view_class(request=request, args=args, kwargs=kwargs, format_kwarg=None, **self.view_initkwargs)
+        self.view.headers = {}
+        try:
+            self.view.check_permissions(request)
+            if self.view.get_throttles():
+                await sync_to_async(self.view.check_throttles)(request)  # The throttle buckets live in the database
+            response = await self.read(request, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            response = self.view.handle_exception(exc)
+        return self.render(response)
+
+    async def read(self, request, *args, **kwargs):
+        raise NotImplementedError('read() must be implemented.')
+
+    def render(self, response):
+        """
+        Turn the DRF Response into a rendered HttpResponse. A DRF Response would be
+        rendered by Django in a thread (sync_to_async), that's the hop these views avoid.
+        """
+        renderer = self.renderer_class()
+        content = b'' if response.data is None else renderer.render(response.data, renderer.media_type)
+        content_type = renderer.media_type if renderer.charset is None else f'{renderer.media_type}; charset={renderer.charset}'
+        rendered = HttpResponse(content, status=response.status_code, content_type=content_type)
+        for header, value in response.items():
+            if header.lower() != 'content-type':
+                rendered[header] = value
+        return rendered
+
+
+class AsyncWatchListView(AsyncReadView):
+    view_class = WatchListView
+
+    @cache_response('watchlist')
+    async def read(self, request):
+        serializer = WatchListSerializer(context={'request': request})
+        movies = serializer.values_queryset(WatchList.objects.all())
+        paginator = WatchListCursorPagination()
+        page = await paginator.apaginate_queryset(movies, request, view=self.view)
+        return paginator.get_paginated_response(serializer.values_representation(page))
+
+
+class AsyncWatchDetailView(AsyncReadView):
+    view_class = WatchDetailView
+
+    @cache_response('watchlist:{pk}')
+    async def read(self, request, pk):
+        try:
+            movie = await WatchListSerializer(context={'request': request}).optimize_queryset(WatchList.objects.all()).aget(pk=pk)
+        except WatchList.DoesNotExist:
+            return Response({'error': 'Movie not found'}, status=404)
+        return Response(WatchListSerializer(movie, context={'request': request}).data)
+
+
+class AsyncGenericListView(AsyncReadView):
+    """
+    List of a generic DRF view: its filter_queryset, paginator and serializer.
+    """
+
+    async def read(self, request, *args, **kwargs):
+        queryset = self.view.filter_queryset(self.view.get_queryset())
+        serializer = self.view.get_serializer()
+        if self.view.serialize_values and serializer.can_serialize_values():
+            page = await self.view.paginator.apaginate_queryset(serializer.values_queryset(queryset), request, view=self.view)
+            return self.view.get_paginated_response(serializer.values_representation(page))
+        page = await self.view.paginator.apaginate_queryset(queryset, request, view=self.view)
+        serializer = self.view.get_serializer(page, many=True)
+        return self.view.get_paginated_response(serializer.data)
+
+
+class AsyncReviewListView(AsyncGenericListView):
+    view_class = ReviewListView
+
+    @cache_response('reviews:{pk}')
+    async def read(self, request, *args, **kwargs):
+        return await super().read(request, *args, **kwargs)
+
+
+class AsyncStreamPlatformListView(AsyncGenericListView):
+    view_class = StreamPlatformView
+    view_initkwargs = {'action': 'list'}
+
+    @cache_response('platform')
+    async def read(self, request, *args, **kwargs):
+        return await super().read(request, *args, **kwargs)
+
+
+class AsyncStreamPlatformDetailView(AsyncReadView):
+    view_class = StreamPlatformView
+    view_initkwargs = {'action': 'retrieve'}
+
+    @cache_response('platform:{pk}')
+    async def read(self, request, pk):
+        queryset = self.view.filter_queryset(self.view.get_queryset())
+        try:
+            platform = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')  # Like get_object_or_404
+        self.view.check_object_permissions(request, platform)
+        return Response(self.view.get_serializer(platform).data)
@@ -0,0 +1,295 @@
+"""
+    Response cache for the read-heavy catalog endpoints.
+
+    Cached entries are keyed by the request path, the query parameters, the rendered
+    format and the current version of every tag the response depends on (e.g.
+    'watchlist:3', 'platform'). Model signals bump the versions of the affected tags
+    (see watchlist_app.signals), so invalidation never has to find the old keys: they
+    stop being read and expire on their own.
+
+    The same key doubles as the ETag, and Last-Modified comes from the newest
+    created/updated value in the payload, so conditional requests are answered with a
+    304 before any serialization work.
+
+    Below the responses, `fragment_cache` keeps the encoded JSON of the catalog rows in
+    each process, so a page that misses the response cache is mostly joined from rows
+    encoded by earlier responses.
+
+    The tag versions must live in a cache shared by every worker, see CACHE_TIMEOUT.
+    `manage.py check --deploy` fails with a per-process backend (watchlist_app.E001).
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from inspect import iscoroutinefunction
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.utils.cache import patch_vary_headers
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from watchlist_app.api.renderers import Fragment, dumps
+
+
+CACHE_ALIAS = 'default'
+TAG_PREFIX = 'response-tag:'
+KEY_PREFIX = 'response:'
+# Seconds a cached response lives. Invalidation bumps the tag versions in the CACHE_ALIAS cache,
+# only the processes sharing that cache see it: with a per-process backend (LocMemCache, Django's
+# default) a write only invalidates the worker that handled it and the other workers keep serving
+# the old bodies, ETags and 304s for up to CACHE_TIMEOUT. Fine for runserver, production needs
+# Redis or another shared backend (moviemate/settings_production.py).
+CACHE_TIMEOUT = 300
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get(CACHE_ALIAS, {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_BACKENDS:
+        return [checks.Error(
+            f'The response cache uses the per-process {backend.rsplit(".", 1)[-1]}, '
+            'writes would only invalidate the responses cached by the worker that handled them.',
+            hint=f'Point CACHES[{CACHE_ALIAS!r}] to a cache shared by the workers, e.g. Redis (MOVIEMATE_REDIS_URL).',
+            id='watchlist_app.E001',
+        )]
+    return []
+
+
+def get_tag_versions(tags):
+    """
+    Return {tag: version} for the given tags, versions are invalidation timestamps.
+    Unknown tags start at the current time.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = {TAG_PREFIX + tag: tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+async def aget_tag_versions(tags):
+    """
+    get_tag_versions for async views.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = {TAG_PREFIX + tag: tag for tag in tags}
+    found = await cache.aget_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def invalidate(*tags):
+    """
+    Bump the version of the given tags, every cached response depending on them becomes stale.
+    Inside a transaction the tags are bumped again on commit, so a response cached
+    while the transaction was still open doesn't survive it.
+    """
+    def bump():
+        caches[CACHE_ALIAS].set_many({TAG_PREFIX + tag: time.time() for tag in tags}, timeout=None)
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+class FragmentCache:
+    """
+    Thread safe LRU of (namespace, model label, pk) -> (row values, Fragment), kept in
+    each process. An entry is only used while the row read from the database still
+    has the values it was encoded from, so a row written by another process is
+    encoded again. The post_save/post_delete receivers drop the entries of the row.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_row = {}
+        self._lock = threading.Lock()
+
+    def represent(self, rows, namespace, label, represent):
+        """
+        Return the serialized `rows` (values() dicts with an 'id') as Fragments, in order.
+        `represent(rows)` serializes the rows that aren't cached.
+        """
+        rows = list(rows)
+        keys = [(namespace, label, row['id']) for row in rows]
+        values = [tuple(row.values()) for row in rows]
+        fragments = [None] * len(rows)
+        with self._lock:
+            for index, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == values[index]:
+                    self._entries.move_to_end(key)
+                    fragments[index] = entry[1]
+
+        missing = [index for index, fragment in enumerate(fragments) if fragment is None]
+        if missing:
+            for index, data in zip(missing, represent([rows[index] for index in missing])):
+                fragments[index] = Fragment(data, dumps(data))
+            with self._lock:
+                for index in missing:
+                    self._set(keys[index], values[index], fragments[index])
+        return fragments
+
+    def evict(self, label, pk):
+        with self._lock:
+            for key in list(self._by_row.get((label, pk), ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_row.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _set(self, key, values, fragment):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (values, fragment)
+        self._by_row.setdefault(key[1:], set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._by_row.get(key[1:])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_row[key[1:]]
+
+
+fragment_cache = FragmentCache(getattr(settings, 'JSON_FRAGMENT_CACHE_SIZE', 10000))
+
+
+def _last_modified(data, versions):
+    """
+    Newest created/updated value of the serialized objects, or the newest tag version
+    when that's later (e.g. an object was deleted).
+    """
+    items = data.get('results', [data]) if isinstance(data, dict) else data
+    timestamps = list(versions.values())
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for field in ('updated', 'created'):
+            value = item.get(field)
+            parsed = parse_datetime(value) if isinstance(value, str) else None
+            if parsed is not None:
+                timestamps.append(parsed.timestamp())
+                break
+    return int(max(timestamps)) if timestamps else None
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return last_modified is not None and if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _finalize(response, etag, last_modified, cache_status):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['X-Cache'] = cache_status
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _cache_key(request, versions):
+    accepted = getattr(request, 'accepted_media_type', '')
+    raw_key = '|'.join([
+        request.build_absolute_uri('/'),  # The data holds absolute links (url, next/previous) for this scheme and host
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        accepted,
+        *[f'{tag}={version!r}' for tag, version in sorted(versions.items())],
+    ])
+    return hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+
+
+def _early_not_modified(request, etag):
+    if request.headers.get('If-None-Match') and _not_modified(request, etag, None):
+        # The ETag only changes when a tag is invalidated, no need to look at the data
+        return _finalize(Response(status=status.HTTP_304_NOT_MODIFIED), etag, None, 'HIT')
+    return None
+
+
+def _respond(request, response, entry, etag, cache_status):
+    if _not_modified(request, etag, entry['last_modified']):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    return _finalize(response, etag, entry['last_modified'], cache_status)
+
+
+def cache_response(*tags, timeout=CACHE_TIMEOUT):
+    """
+    Cache the data of a GET handler, sync or async.
+
+    `tags` are formatted with the URL kwargs, e.g. cache_response('watchlist:{pk}').
+    Permissions and throttles still run (they run before the handler).
+    """
+    def decorator(handler):
+        if iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_wrapper(view, request, *args, **kwargs):
+                versions = await aget_tag_versions([tag.format(**kwargs) for tag in tags])
+                digest = _cache_key(request, versions)
+                etag = quote_etag(digest)
+                early = _early_not_modified(request, etag)
+                if early is not None:
+                    return early
+
+                cache = caches[CACHE_ALIAS]
+                entry = await cache.aget(KEY_PREFIX + digest)
+                if entry is None:
+                    response = await handler(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    entry = {'data': response.data, 'last_modified': _last_modified(response.data, versions)}
+                    await cache.aset(KEY_PREFIX + digest, entry, timeout)
+                    return _respond(request, response, entry, etag, 'MISS')
+                return _respond(request, Response(entry['data']), entry, etag, 'HIT')
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            versions = get_tag_versions([tag.format(**kwargs) for tag in tags])
+            digest = _cache_key(request, versions)
+            etag = quote_etag(digest)
+            early = _early_not_modified(request, etag)
+            if early is not None:
+                return early
+
+            cache = caches[CACHE_ALIAS]
+            entry = cache.get(KEY_PREFIX + digest)
+            if entry is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                entry = {'data': response.data, 'last_modified': _last_modified(response.data, versions)}
+                cache.set(KEY_PREFIX + digest, entry, timeout)
+                return _respond(request, response, entry, etag, 'MISS')
+            return _respond(request, Response(entry['data']), entry, etag, 'HIT')
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+"""
+    Sparse fieldsets: ?fields= and ?exclude= choose the keys of a response.
+
+    `?fields=id,title,avg_rating` renders only those fields and `?exclude=storyline`
+    everything but storyline. Nested serializers take dotted names, e.g.
+    `/stream/?expand=watchlist&fields=name,watchlist.title`.
+
+    The fields are removed from the serializer before it plans its query, so
+    EagerLoadingMixin only selects their columns and skips the JOINs, prefetches
+    and annotations of the relations that aren't rendered (no platform JOIN without
+    platform_name, no COUNT subquery without watchlist_count).
+
+    Only reads are pruned: a serializer with data validates and returns every field.
+"""
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_fieldset(value):
+    """
+    'id,title,watchlist.title' -> {'id': {}, 'title': {}, 'watchlist': {'title': {}}}
+    """
+    tree = {}
+    for name in (value or '').split(','):
+        node = tree
+        for part in name.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def select_columns(columns, request, query_param='fields'):
+    """
+    The `columns` named by ?fields= (all of them without it), in their original order.
+    """
+    names = parse_fieldset(request.query_params.get(query_param))
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValidationError({query_param: [f'Unknown field {", ".join(unknown)}, expected {", ".join(columns)}.']})
+    return [column for column in columns if not names or column in names]
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin that drops the fields not requested with ?fields= or excluded with
+    ?exclude=. Place it before EagerLoadingMixin so the query plan sees the remaining fields.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or 'data' in kwargs:
+            return
+        include = parse_fieldset(request.query_params.get(self.fields_query_param))
+        exclude = parse_fieldset(request.query_params.get(self.exclude_query_param))
+        if include or exclude:
+            self.apply_fieldset(include, exclude)
+
+    def apply_fieldset(self, include, exclude, prefix=''):
+        """
+        Remove the fields left out by the `include` and `exclude` trees (see parse_fieldset).
+        """
+        known = set(self.fields) | set(getattr(self, 'expandable_fields', ()))  # Expandable ones may be popped later
+        for query_param, names in ((self.fields_query_param, include), (self.exclude_query_param, exclude)):
+            unknown = [prefix + name for name in names if name not in known]
+            if unknown:
+                raise ValidationError({query_param: [f'Unknown field {", ".join(unknown)}.']})
+
+        for name in list(self.fields):
+            if (include and name not in include) or (name in exclude and not exclude[name]):
+                self.fields.pop(name)
+                continue
+            nested_include, nested_exclude = include.get(name, {}), exclude.get(name, {})
+            if not (nested_include or nested_exclude):
+                continue
+            field = self.fields[name]
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if not isinstance(nested, SparseFieldsetsMixin):
+                query_param = self.fields_query_param if nested_include else self.exclude_query_param
+                raise ValidationError({query_param: [f'{prefix}{name} has no nested fields.']})
+            nested.apply_fieldset(nested_include, nested_exclude, prefix=f'{prefix}{name}.')
@@ -0,0 +1,40 @@
+from rest_framework import filters
+
+from watchlist_app.search import get_search_backend, tokenize
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter with the same ?search= contract, answered by the full-text index
+    (watchlist_app.search) instead of icontains LIKE scans over `search_fields`.
+    Results are ordered by relevance, then by the view ordering.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not any(tokenize(term) for term in terms):
+            return queryset  # Terms without any word character match everything
+        queryset = get_search_backend(queryset.db).search(queryset, terms)
+        return queryset.order_by('search_rank', *queryset.query.order_by)
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter for one of the indexed `ordering_fields` at a time, with `id` as
+    tiebreak so equal values (e.g. unrated titles) keep a stable order across pages.
+
+    Without ?ordering= the queryset keeps its own ordering (relevance when searching,
+    the view default otherwise). Keyset cursor pagination reads the same ordering.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params:
+            return None
+        fields = [param.strip() for param in params.split(',')]
+        ordering = self.remove_invalid_fields(queryset, fields, view, request)[:1]  # Only one sort key has an index
+        if not ordering:
+            return None
+        if ordering[0].lstrip('-') not in ('id', 'pk'):
+            ordering.append(('-' if ordering[0].startswith('-') else '') + 'id')
+        return ordering
@@ -0,0 +1,63 @@
+from django.db import IntegrityError, transaction
+
+from rest_framework import status
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+
+from watchlist_app.api.parsers import NDJSONParser
+
+
+class EagerLoadingViewMixin:
+    """
+    Mixin for generic views whose serializer uses EagerLoadingMixin.
+    The filtered queryset gets the select_related/prefetch_related/only() plan
+    declared by the serializer, so list and detail endpoints avoid N+1 queries.
+    Lists whose serializer can render values() rows skip the model instances.
+    """
+    serialize_values = True  # False keeps the instances, e.g. for a serializer with side effects
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        if hasattr(serializer, 'optimize_queryset'):
+            queryset = serializer.optimize_queryset(queryset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        if not (self.serialize_values and hasattr(serializer, 'can_serialize_values')
+                and serializer.can_serialize_values()):
+            return super().list(request, *args, **kwargs)
+
+        queryset = serializer.values_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.values_representation(page))
+        return Response(serializer.values_representation(queryset))
+
+
+class BulkCreateViewMixin:
+    """
+    POST a JSON array or an NDJSON stream of rows to a serializer whose list class is
+    a BulkListSerializer. The valid rows are written in one transaction by
+    `perform_bulk_create`, the invalid ones come back by index in 'errors'.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)  # Only fails when the body isn't a list of rows
+        try:
+            with transaction.atomic():
+                instances = self.perform_bulk_create(serializer) if serializer.validated_data else []
+        except IntegrityError:
+            # Rows checked against the database are no longer valid, e.g. a concurrent import
+            return Response({'error': 'The batch conflicts with concurrent writes, send it again.'},
+                            status=status.HTTP_409_CONFLICT)
+
+        errors = [{'index': index, 'errors': detail} for index, detail in sorted(serializer.row_errors.items())]
+        data = {'created': len(instances), 'ids': [instance.pk for instance in instances], 'errors': errors}
+        return Response(data, status=status.HTTP_201_CREATED if instances or not errors else status.HTTP_400_BAD_REQUEST)
+
+    def perform_bulk_create(self, serializer):
+        return serializer.save()
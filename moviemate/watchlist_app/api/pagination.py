@@ -1,4 +1,110 @@
-from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination, CursorPagination
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime
+from functools import partial
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination, CursorPagination, Cursor
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_row_count(queryset):
+    """
+    Return the row count the database statistics hold for the table behind an
+    unfiltered queryset, or None when there is no cheap estimate.
+    """
+    if queryset.query.where or queryset.query.distinct or queryset.query.is_sliced:
+        return None
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Filled by ANALYZE, the first number of each stat is the number of rows
+            try:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            except DatabaseError:  # sqlite_stat1 only exists after the first ANALYZE
+                return None
+            counts = [int(row[0].split()[0]) for row in cursor.fetchall() if row[0]]
+            return max(counts) if counts else None
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+    return None
+
+
+class UncountedPage(Page):
+    """
+    Page that knows if there is a next page without knowing the total count.
+    """
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountModePaginator(Paginator):
+    """
+    Django paginator that can skip or estimate the COUNT(*) query.
+
+    count_mode:
+        'exact'    always run COUNT(*) (Django's default behaviour)
+        'estimate' use the table statistics for unfiltered querysets bigger than estimate_threshold
+        'none'     never count, fetch one extra row to know if there is a next page
+    """
+    def __init__(self, object_list, per_page, count_mode='exact', estimate_threshold=10000, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_mode = count_mode
+        self.estimate_threshold = estimate_threshold
+        self.known_pages = 1
+
+    @cached_property
+    def count(self):
+        if self.count_mode == 'none':
+            return None
+        if self.count_mode == 'estimate' and hasattr(self.object_list, 'query'):
+            estimate = estimate_row_count(self.object_list)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+    @cached_property
+    def num_pages(self):
+        if self.count_mode != 'none':
+            return super().num_pages
+        return self.known_pages  # Without a count only the pages up to the next one are known
+
+    def validate_number(self, number):
+        if self.count_mode != 'none':
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage(self.error_messages['invalid_page'])
+        if number < 1:
+            raise InvalidPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        if self.count_mode != 'none':
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])  # One extra row tells if there is a next page
+        if not rows and number > 1:
+            raise InvalidPage(self.error_messages['no_results'])
+        has_next = len(rows) > self.per_page
+        self.known_pages = number + has_next
+        return UncountedPage(rows[:self.per_page], number, self, has_next)
 
 
 class WatchListPagination(PageNumberPagination):
@@ -9,7 +115,26 @@ class WatchListPagination(PageNumberPagination):
     page_size_query_param = 'page_size'  # Allow clients to set the page size via query parameter
     max_page_size = 20  # Maximum number of items per page allowed by the client
     page_query_param = 'page'  # Query parameter for the page number
-    last_page_strings = 'end'  # String to indicate the last page in the response
+    last_page_strings = ('end',)  # Strings to indicate the last page in the response (must be a tuple)
+    count_mode = 'estimate'  # 'exact', 'estimate' (table statistics on big unfiltered tables) or 'none'
+    estimate_count_threshold = 10000  # Below this many rows an exact COUNT(*) is cheap enough
+    count_query_param = 'count'  # ?count=false skips the COUNT(*) query
+
+    def get_count_mode(self, request):
+        if request.query_params.get(self.count_query_param, '').lower() in ('false', '0', 'no'):
+            return 'none'
+        return self.count_mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(CountModePaginator, count_mode=self.get_count_mode(request),
+                                              estimate_threshold=self.estimate_count_threshold)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_page_number(self, request, paginator):
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings and paginator.count is None:
+            raise NotFound('The last page is not available without a count.')
+        return super().get_page_number(request, paginator)
 
 
 class WatchListLimitOffsetPagination(LimitOffsetPagination):
@@ -20,15 +145,195 @@ class WatchListLimitOffsetPagination(LimitOffsetPagination):
     max_limit = 20  # Maximum number of items per page allowed by the client
     limit_query_param = 'limit'  # Query parameter for the limit
     offset_query_param = 'offset'  # Query parameter for the offset
-    
-    
-class WatchListCursorPagination(CursorPagination):
+
+
+class KeysetCursorPagination(CursorPagination):
     """
-    Custom pagination class for watchlist view using cursor-based pagination.
+    Cursor pagination on a composite key, e.g. ('-created', '-id').
+
+    DRF's CursorPagination only seeks on the first ordering field and falls back to
+    an OFFSET for ties. Here the cursor stores the values of every ordering field of
+    the last row and the next page is a row-value comparison:
+    created <= c AND (created < c OR (created = c AND id < i)), which an index on the
+    ordering fields answers without OFFSET, so every page costs the same as the first one.
+    The ordering fields must not be nullable.
     """
     page_size = 4  # Default number of items per page
     page_size_query_param = 'page_size'  # Allow clients to set the page size via query parameter
     max_page_size = 20  # Maximum number of items per page allowed by the client
     cursor_query_param = 'cursor'  # Query parameter for the cursor
-    ordering = '-created'  # Default ordering for the items
-    
+    ordering = ('-created', '-id')  # Default ordering for the items, the last field must be unique
+    # The view can choose another ordering with an OrderingFilter in its filter_backends (e.g. ?ordering=-avg_rating)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            # Unique tiebreak in the same direction as the main sort
+            ordering = ordering + (('-' if ordering[0].startswith('-') else '') + 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset for async views, the page is fetched with the async ORM.
+        """
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([item async for item in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the (lazy) queryset of the requested page plus one row, or None without pagination.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model  # decode_cursor converts the position with its fields
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor.reverse)
+
+        if self.reverse:
+            queryset = queryset.order_by(*[self._invert(field) for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._seek_filter(self.cursor.position, self.reverse))
+        queryset = self.select_ordering_columns(queryset)
+        return queryset[:self.page_size + 1]  # One extra row tells if there is another page
+
+    def select_ordering_columns(self, queryset):
+        """
+        Add the ordering fields to the columns of a values() or only() queryset, the cursor
+        is built from them even when the response leaves them out (e.g. ?fields=id,title).
+        """
+        names = [field.lstrip('-') for field in self.ordering]
+        query = queryset.query
+        if query.values_select:
+            selected = (*query.values_select, *query.annotation_select)
+            missing = [name for name in names if name not in selected]
+            return queryset.values(*selected, *missing) if missing else queryset
+        loaded, deferred = query.deferred_loading
+        if loaded and not deferred:
+            missing = [name for name in names if name not in loaded]
+            return queryset.only(*loaded, *missing) if missing else queryset
+        return queryset
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.has_next = self.has_previous = False
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')))
+            position = payload['p']
+            if not isinstance(position, list) or payload.get('o') != list(self.ordering):
+                raise ValueError  # A cursor only seeks within the ordering it was created for
+            if len(position) != len(self.ordering) or None in position:
+                raise ValueError  # The ordering fields aren't nullable
+            # clean() also runs the range validators, an id past the column's range would fail in the query
+            position = [self._ordering_field(field).clean(value, None) for field, value in zip(self.ordering, position)]
+            return Cursor(offset=0, reverse=bool(payload.get('r')), position=position)
+        except (TypeError, ValueError, OverflowError, KeyError, DjangoValidationError):  # 1e400 is inf, int(inf) overflows
+            raise NotFound(self.invalid_cursor_message)
+
+    def _ordering_field(self, field):
+        name = field.lstrip('-')
+        return self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+
+    def encode_cursor(self, cursor):
+        payload = {'p': cursor.position, 'o': list(self.ordering)}
+        if cursor.reverse:
+            payload['r'] = 1
+        encoded = b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()  # Full precision, the filter parses it back
+            position.append(value)
+        return position
+
+    def _seek_filter(self, position, reverse):
+        """
+        Build a >= x AND ((a > x) OR (a = x AND b > y) ...) for the ordering, flipped for
+        reverse cursors. The leading range on the first field lets the database seek
+        the index instead of OR-ing index scans and sorting the result.
+        """
+        seek = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            seek |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') != reverse else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & seek
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+
+class WatchListCursorPagination(KeysetCursorPagination):
+    """
+    Custom pagination class for watchlist view using cursor-based pagination.
+    """
+    ordering = ('-created', '-id')  # Default ordering for the items
+
+
+class ReviewCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the review lists, newest first.
+    """
+    ordering = ('-created', '-id')
+
+
+class StreamPlatformCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the streaming platforms, newest first.
+    """
+    ordering = ('-created', '-id')
@@ -0,0 +1,31 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline delimited JSON (one object per line) parsed into a list.
+    A line that isn't valid JSON is kept as its text, so the serializer reports it
+    as an invalid row instead of failing the whole stream.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        try:
+            for line in stream:
+                line = line.decode(encoding).strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    rows.append(line)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f'NDJSON parse error - {exc}')
+        return rows
@@ -31,5 +31,6 @@ class IsReviewUserOrReadOnly(permissions.BasePermission):
             return True
         
         # Allow write access only to the user who created the review
-        return obj.review_user == request.user
+        # Se comparan los ids: no carga el review_user y funciona con el TokenUser de la autenticación stateless
+        return obj.review_user_id == request.user.pk
 
@@ -0,0 +1,104 @@
+"""
+    JSON rendering with a faster encoder and pre-encoded rows.
+
+    FastJSONRenderer writes the JSON of DRF's JSONRenderer with the default settings
+    (compact, UTF-8, U+2028/U+2029 escaped) but encodes with orjson when it is
+    installed. Without orjson, or for what orjson can't reproduce (indentation for
+    the browsable API, ensure_ascii, ints over 64 bits, non-string keys), it falls
+    back to the standard library, which gives the same bytes.
+
+    With orjson the output parses to the same values but isn't always byte for byte
+    equal: floats may be spelled differently (1e16 instead of 1e+16, 0.00001 instead
+    of 1e-05) and NaN/Infinity are written as null, where JSONRenderer raises
+    ValueError. Finding them would mean walking every response, so they are let
+    through, the models don't store non-finite floats.
+
+    A Fragment is a serialized row (a dict) that carries its own encoded JSON. The
+    lists of fragments of a response (see watchlist_app.api.caching.fragment_cache)
+    are written by joining the cached bytes instead of encoding every value again.
+"""
+
+import json
+from uuid import uuid4
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard library gives the same JSON
+    orjson = None
+
+
+if orjson is not None:
+    # Dates go through DRF's encoder ('Z' instead of '+00:00'), dataclasses aren't JSON for DRF either
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def dumps(data, encoder_class=JSONEncoder):
+    """
+    data -> compact UTF-8 JSON bytes, the JSON of JSONRenderer with the default settings.
+    Non-finite floats are null with orjson instead of an error (see the module docstring).
+    """
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data, default=encoder_class().default, option=ORJSON_OPTIONS)
+        except TypeError:  # orjson.JSONEncodeError, e.g. an int over 64 bits or a non-string key
+            pass
+        else:
+            # JSONRenderer escapes the JavaScript line terminators
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    content = json.dumps(data, cls=encoder_class, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+class Fragment(dict):
+    """
+    Serialized row with its JSON already encoded in `encoded`. It stays a dict for the
+    code reading response.data, which must not change it.
+    """
+
+    def __init__(self, data, encoded):
+        super().__init__(data)
+        self.encoded = encoded
+
+
+def is_fragment_list(value):
+    return isinstance(value, list) and value and all(isinstance(item, Fragment) for item in value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson and pre-encoded fragments, see the module docstring.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Lists of fragments (the response or a value of it, e.g. the page 'results') are
+        # replaced by a placeholder string and joined into the encoded envelope
+        if is_fragment_list(data):
+            return self.join(data)
+        joined = {}
+        if isinstance(data, dict) and any(is_fragment_list(value) for value in data.values()):
+            envelope = {}
+            for key, value in data.items():
+                if is_fragment_list(value):
+                    placeholder = f'fragments-{uuid4().hex}'
+                    joined[f'"{placeholder}"'.encode()] = self.join(value)
+                    value = placeholder
+                envelope[key] = value
+            data = envelope
+
+        content = dumps(data, self.encoder_class)
+        for placeholder, fragments in joined.items():
+            content = content.replace(placeholder, fragments, 1)
+        return content
+
+    @staticmethod
+    def join(fragments):
+        return b'[' + b','.join(fragment.encoded for fragment in fragments) + b']'
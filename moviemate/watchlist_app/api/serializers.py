@@ -1,20 +1,420 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Length
+from django.utils import timezone
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
+from moviemate.middleware import timed
+
+from watchlist_app.api.caching import fragment_cache
+from watchlist_app.api.fieldsets import SparseFieldsetsMixin
 from watchlist_app.models import WatchList, StreamPlatform, Review
 
 
 
+# -------------- query optimization ---------------
+
+class EagerLoadingMixin:
+    """
+    Mixin for model serializers that knows which relations and columns its fields read.
+
+    `optimize_queryset` applies select_related, prefetch_related and only() so that
+    serializing a list runs a fixed number of queries regardless of the row count.
+    Fields whose source can't be inferred (e.g. SerializerMethodField) declare the
+    ORM paths they read in `Meta.query_hints`, or an expression computed by the
+    database in `Meta.annotations` (the method then returns the annotation as is).
+
+    Read-only lists can skip the model instances: `values_queryset` reads the rows
+    with values() and `values_representation` builds the same dicts as
+    to_representation with accessors compiled once per serializer class. Fields that
+    read a related object declare the column holding their output in
+    `Meta.value_sources`. A serializer with a field that can't be compiled (e.g. a
+    nested list) answers False to `can_serialize_values()`.
+
+    `to_representation` is timed as the 'serialize' phase of the request metrics.
+    """
+    _values_plans = {}  # (serializer class, field names) -> [(name, key, converter)] or None
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+    def optimize_queryset(self, queryset, parent_field=None):
+        """
+        Return `queryset` with the eager loading needed by the serializer fields.
+        `parent_field` is the FK back to the parent when used inside a Prefetch.
+        """
+        model = queryset.model
+        hints = getattr(self.Meta, 'query_hints', {})
+        annotations = self.get_annotations()
+        select_related, prefetches = set(), []
+        columns = {model._meta.pk.name}
+        restrict_columns = True
+
+        if parent_field:
+            columns.add(parent_field)
+
+        for name, field in self.fields.items():
+            if field.write_only or name in annotations:
+                continue
+
+            if name in hints:
+                for lookup in hints[name]:
+                    plan = self._plan_lookup(model, lookup.split('__'), field)
+                    if plan is None:
+                        restrict_columns = False
+                        continue
+                    columns.update(plan[0])
+                    select_related.update(plan[1])
+                continue
+
+            if isinstance(field, serializers.ListSerializer) and isinstance(field.child, EagerLoadingMixin):
+                # A nested field is named after the relation, its source may be the Prefetch to_attr
+                relation_name = field.source if self._is_model_field(model, field.source) else name
+                relation = model._meta.get_field(relation_name)
+                child_queryset = field.child.optimize_queryset(
+                    relation.related_model._default_manager.all(),
+                    parent_field=relation.field.name,
+                )
+                child_queryset = self.get_prefetch_queryset(name, child_queryset)
+                to_attr = field.source if field.source != relation_name else None
+                prefetches.append(Prefetch(relation_name, queryset=child_queryset, to_attr=to_attr))
+                continue
+
+            if field.source == '*':
+                # HyperlinkedIdentityField only needs the pk, anything else is unknown
+                if not isinstance(field, serializers.HyperlinkedIdentityField):
+                    restrict_columns = False
+                continue
+
+            plan = self._plan_lookup(model, field.source_attrs, field)
+            if plan is None:
+                restrict_columns = False
+                continue
+            columns.update(plan[0])
+            select_related.update(plan[1])
+            prefetches.extend(plan[2])
+
+        # The parent object is attached by the prefetch, joining it again is wasted work
+        select_related.discard(parent_field)
+
+        if select_related:
+            queryset = queryset.select_related(*sorted(select_related))
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        if restrict_columns:
+            queryset = queryset.only(*sorted(columns))
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+    def get_prefetch_queryset(self, field_name, queryset):
+        """
+        Hook to order or bound the queryset prefetched for a nested many=True field.
+        """
+        return queryset
+
+    def get_annotations(self):
+        """
+        Return the `Meta.annotations` of the fields the serializer renders.
+        """
+        annotations = getattr(self.Meta, 'annotations', {})
+        return {name: annotations[name] for name, field in self.fields.items()
+                if name in annotations and not field.write_only}
+
+    # values() fast path
+
+    def can_serialize_values(self):
+        return self.get_values_plan() is not None
+
+    def values_queryset(self, queryset):
+        """
+        Return `queryset` as values() rows with the columns and annotations of the readable fields.
+        """
+        plan = self.get_values_plan()
+        annotations = self.get_annotations()
+        columns = [self.Meta.model._meta.pk.name] + [key for name, key, converter in plan if name not in annotations]
+        return queryset.prefetch_related(None).values(*dict.fromkeys(columns), **annotations)
+
+    def values_representation(self, rows):
+        """
+        values() rows -> the list of dicts to_representation would return for the instances.
+        With `Meta.cache_fragments` the dicts are Fragments that keep their encoded JSON in
+        the fragment cache, while the row keeps the same values.
+        """
+        with timed('serialize'):
+            if not getattr(self.Meta, 'cache_fragments', False) or not fragment_cache.max_size:
+                return self.represent_rows(rows)
+            return fragment_cache.represent(rows, self.get_fragment_namespace(), self.Meta.model._meta.label,
+                                            self.represent_rows)
+
+    def represent_rows(self, rows):
+        plan = [(name, key, converter(self) if isinstance(converter, FieldConverter) else converter)
+                for name, key, converter in self.get_values_plan()]
+        return [{name: None if row[key] is None else (converter(row[key]) if converter else row[key])
+                 for name, key, converter in plan}
+                for row in rows]
+
+    def get_fragment_namespace(self):
+        """
+        Cached rows are shared by the serializers with the same class and fields and, for
+        the hyperlinks, the same URL base.
+        """
+        plan = self.get_values_plan()
+        namespace = (type(self), *[name for name, key, converter in plan])
+        request = self.context.get('request')
+        if request is not None and any(isinstance(converter, LinkConverter) for name, key, converter in plan):
+            namespace += (request.build_absolute_uri('/'), getattr(request, 'version', None), self.context.get('format'))
+        return namespace
+
+    def get_values_plan(self):
+        """
+        Return [(field name, values() key, converter or None)], compiled once per class and set
+        of fields, or None when a field can only be rendered from an instance.
+        """
+        cache_key = (type(self), tuple(self.fields))
+        try:
+            return self._values_plans[cache_key]
+        except KeyError:
+            pass
+        plan = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            compiled = self._compile_field(name, field)
+            if compiled is None:
+                plan = None
+                break
+            plan.append((name, *compiled))
+        self._values_plans[cache_key] = plan
+        return plan
+
+    def _compile_field(self, name, field):
+        """
+        Return (values() key, converter) reproducing field.to_representation(field.get_attribute(instance)).
+        """
+        model = self.Meta.model
+        if name in getattr(self.Meta, 'annotations', {}):
+            return name, None
+        if name in getattr(self.Meta, 'value_sources', {}):
+            return self.Meta.value_sources[name], None
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            key = model._meta.pk.name if field.lookup_field == 'pk' else field.lookup_field
+            return key, LinkConverter(name)
+        if field.source == '*' or isinstance(field, (serializers.BaseSerializer, serializers.FileField)):
+            return None  # Needs the instance, a nested serializer or the request
+
+        attrs = field.source_attrs
+        for index, attr in enumerate(attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            last = index == len(attrs) - 1
+            if not model_field.is_relation:
+                return ('__'.join(attrs), PLAIN_CONVERSIONS.get(type(field), FieldConverter(name))) if last else None
+            if not (model_field.many_to_one or (model_field.one_to_one and model_field.concrete)):
+                return None
+            if last:
+                # The FK column gives the pk a PrimaryKeyRelatedField renders
+                if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                    return None
+                return '__'.join(attrs), None
+            if model_field.null:
+                return None  # DRF skips the field when the relation is empty, values() would give None
+            model = model_field.related_model
+        return None
+
+    @staticmethod
+    def _is_model_field(model, name):
+        try:
+            model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    @staticmethod
+    def _plan_lookup(model, attrs, field):
+        """
+        Translate a chain of attributes into (columns, select_related, prefetches).
+        Return None when the chain doesn't map onto model fields.
+        """
+        path = []
+        joins = set()
+        for index, attr in enumerate(attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            path.append(attr)
+            lookup = '__'.join(path)
+            last = index == len(attrs) - 1
+
+            if not model_field.is_relation:
+                return ({lookup}, joins, []) if last else None
+
+            if model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+                if last:
+                    # A PrimaryKeyRelatedField reads the FK column, anything else needs the object
+                    if not (isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization()):
+                        joins.add(lookup)
+                    return {lookup}, joins, []
+                joins.add(lookup)
+                model = model_field.related_model
+                continue
+
+            # Reverse and many-to-many relations can only be prefetched
+            if last and not joins:
+                return set(), set(), [lookup]
+            return None
+        return None
+
+
+# DRF fields whose to_representation is a plain type conversion of the column value
+PLAIN_CONVERSIONS = {
+    serializers.CharField: str,
+    serializers.URLField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+}
+
+
+class FieldConverter:
+    """
+    Converter of the values() plan taken from the field of each serializer, the plan
+    outlives the serializer instance (and its request) it was compiled from.
+    """
+
+    def __init__(self, field_name):
+        self.field_name = field_name
+
+    def __call__(self, serializer):
+        return serializer.fields[self.field_name].to_representation
+
+
+class LinkConverter(FieldConverter):
+    """
+    Converter of a HyperlinkedIdentityField. The URL depends on the request, so it is
+    reversed once per response with a placeholder pk and each row only fills in its own pk.
+    """
+    placeholder = '__pk__'  # Matched by the router's [^/.]+ lookup pattern
+
+    def __call__(self, serializer):
+        field = serializer.fields[self.field_name]
+        row = lambda value: SimpleNamespace(**{'pk': value, field.lookup_field: value})  # Only what get_url reads
+        try:
+            url = field.to_representation(row(self.placeholder))
+        except ImproperlyConfigured:
+            url = None
+        if url is None or url.count(self.placeholder) != 1:
+            # The lookup pattern rejects the placeholder, reverse every row
+            return lambda value: field.to_representation(row(value))
+        prefix, suffix = url.split(self.placeholder)
+        return lambda pk: f'{prefix}{pk}{suffix}'
+
+
+# -------------- bulk writes ---------------
+
+class PreloadedRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField that, inside a BulkListSerializer, is resolved from the objects
+    the list loaded with one query per batch instead of one query per row.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = getattr(self.parent.parent, 'preloaded', None)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[self.field_name][str(data)]
+        except (KeyError, TypeError):
+            self.fail('does_not_exist', slug_name=self.slug_field, value=str(data))
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer for bulk imports: invalid rows are reported by index in `row_errors`
+    instead of failing the whole batch, and the valid rows are written with bulk_create.
+    bulk_create sends no signals, the caller handles what the signals would do.
+    """
+    batch_size = 500  # Rows per INSERT statement
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='not_a_list')
+
+        self.preload(data)
+        self.row_errors = {}
+        rows = {}
+        for index, item in enumerate(data):
+            try:
+                rows[index] = self.child.run_validation(item)
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+        for index, detail in self.validate_rows(rows).items():
+            del rows[index]
+            self.row_errors[index] = detail
+        return list(rows.values())
+
+    def preload(self, data):
+        """
+        Load the objects of every PreloadedRelatedField of the child with one query per field.
+        """
+        self.preloaded = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, PreloadedRelatedField) or field.read_only:
+                continue
+            values = {str(row[name]) for row in data if isinstance(row, dict) and row.get(name) is not None}
+            objects = field.get_queryset().filter(**{f'{field.slug_field}__in': values})
+            self.preloaded[name] = {str(getattr(obj, field.slug_field)): obj for obj in objects}
+
+    def validate_rows(self, rows):
+        """
+        Hook for checks across rows ({index: validated row}), return {index: errors} of the rejected ones.
+        """
+        return {}
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create([model(**attrs) for attrs in validated_data], batch_size=self.batch_size)
+
+
+class ReviewBulkListSerializer(BulkListSerializer):
+
+    def validate_rows(self, rows):
+        # The (watchlist, review_user) constraint, checked with one query for the whole batch
+        existing = set(Review.objects.filter(
+            watchlist__in={row['watchlist'] for row in rows.values()},
+            review_user__in={row['review_user'] for row in rows.values()},
+        ).values_list('watchlist_id', 'review_user_id'))
+        errors = {}
+        for index, row in rows.items():
+            pair = (row['watchlist'].pk, row['review_user'].pk)
+            if pair in existing:
+                errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: ['This user has already reviewed this movie.']}
+            existing.add(pair)  # Also rejects duplicates inside the batch
+        return errors
+
+
 # -------------- serializers.modelserializer ---------------
 
-class ReviewSerializer(serializers.ModelSerializer):
-    review_user = serializers.StringRelatedField(read_only=True)  # Use StringRelatedField to return the string representation of the related user 
-    
+class ReviewSerializer(SparseFieldsetsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    review_user = serializers.StringRelatedField(read_only=True)  # Use StringRelatedField to return the string representation of the related user
+
     class Meta:
         model = Review
         # fields = '__all__'
         exclude = ['watchlist']  # Exclude the WatchList field to avoid circular reference
+        query_hints = {'review_user': ['review_user__username']}  # str(user) only reads the username
+        value_sources = {'review_user': 'review_user__username'}  # str(user) is the username
 
-class WatchListSerializer(serializers.ModelSerializer):
+class WatchListSerializer(SparseFieldsetsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     # reviews = ReviewSerializer(many=True, read_only=True)  # Nested serializer to include related reviews
     
     # How to add a custom field to the serializer
@@ -25,16 +425,24 @@ class WatchListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = WatchList
-        fields = '__all__'  # Incluye todos los campos del modelo Movie en la serialización
+        # fields = '__all__'  # Incluye todos los campos del modelo Movie en la serialización
         # También se puede especificar una lista de campos específicos o excluir algunos campos
         # fields = ['id', 'name', 'description']  # Especifica los campos del modelo que se incluirán en la serialización
-        # exclude = ['active']
+        # Todos los campos menos el histograma (ReviewHistogramView) y los puntajes de los leaderboards (LeaderboardView)
+        exclude = WatchList.histogram_fields + WatchList.leaderboard_fields
+        # Cada respuesta puede reducirse con ?fields=id,title,avg_rating o ?exclude= (watchlist_app.api.fieldsets)
+        read_only_fields = ['avg_rating', 'number_ratings', 'rating_sum']  # Maintained by watchlist_app.ratings from the reviews
+        annotations = {'len_title': Length('title')}  # Computed by the database, in characters like len()
+        cache_fragments = True  # Encoded rows kept while the row doesn't change (watchlist_app.api.caching.fragment_cache)
 
     def get_len_title(self, obj):
         """
         Custom method to return the length of the name field.
         """
-        return len(obj.title)
+        len_title = getattr(obj, 'len_title', None)  # Annotated by optimize_queryset
+        if len_title is None:
+            len_title = len(obj.title)
+        return len_title
 
     # Se pueden añadir validaciones personalizadas para los campos del modelo
     def validate(self, data):
@@ -50,10 +458,41 @@ class WatchListSerializer(serializers.ModelSerializer):
             return value   
         
         
+class WatchListBulkSerializer(WatchListSerializer):
+    """
+    WatchListSerializer for the bulk endpoint, platforms are loaded once per batch.
+    """
+    platform = PreloadedRelatedField(slug_field='pk', queryset=StreamPlatform.objects.all())
+
+    class Meta(WatchListSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+
+class ReviewImportSerializer(serializers.ModelSerializer):
+    """
+    Historic reviews from partners: the movie by id and the author by username.
+    """
+    watchlist = PreloadedRelatedField(slug_field='pk', queryset=WatchList.objects.all())
+    review_user = PreloadedRelatedField(slug_field='username', queryset=User.objects.all())
+    created = serializers.DateTimeField(required=False)  # The original date, now when missing (Review.created is read-only elsewhere)
+
+    class Meta:
+        model = Review
+        fields = ['id', 'watchlist', 'review_user', 'rating', 'description', 'active', 'created']
+        validators = []  # The unique (watchlist, review_user) check runs once per batch in ReviewBulkListSerializer
+        list_serializer_class = ReviewBulkListSerializer
+
+    def validate_created(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError('The review date is in the future.')  # Would sit in the trending buckets ahead of time
+        return value
+
+
 # class StreamPlatformSerializer(serializers.ModelSerializer):
-class StreamPlatformSerializer(serializers.HyperlinkedModelSerializer): # HyperlinkedModelSerializer represents relations as hyperlinks instead of primary keys
+class StreamPlatformSerializer(SparseFieldsetsMixin, EagerLoadingMixin, serializers.HyperlinkedModelSerializer): # HyperlinkedModelSerializer represents relations as hyperlinks instead of primary keys
     
-    watchlist = WatchListSerializer(many=True, read_only=True)  # Nested serializer to include related watchlist items return all fields
+    watchlist = WatchListSerializer(many=True, read_only=True, source='top_watchlist')  # Nested top titles (prefetched to top_watchlist), only with ?expand=watchlist
+    watchlist_count = serializers.SerializerMethodField()  # Total number of titles, the nested list may be truncated
     # watchlist = serializers.StringRelatedField(many=True, read_only=True)  # Use StringRelatedField to return the string representation of the related watchlist items
     # watchlist = serializers.PrimaryKeyRelatedField(many=True, read_only=True)  # PrimaryKeyRelatedField to return the primary keys of the related watchlist items
     # watchlist = serializers.HyperlinkedRelatedField(
@@ -67,7 +506,75 @@ class StreamPlatformSerializer(serializers.HyperlinkedModelSerializer): # Hyperl
         fields = '__all__'  # Include all fields from the StreamPlatform model
         # fields = ['id', 'name', 'about', 'website']  # Specify the fields to include in the serialization
         # exclude = ['created']  # Exclude the created field from the serialization
+        read_only_fields = ['active_titles', 'number_ratings', 'rating_sum', 'avg_rating']  # Maintained by watchlist_app.ratings
+        cache_fragments = True  # Encoded rows kept while the row doesn't change (watchlist_app.api.caching.fragment_cache)
+        annotations = {
+            # Correlated COUNT over the platform_id index instead of a JOIN + GROUP BY over every column
+            'watchlist_count': Coalesce(Subquery(WatchList.objects.filter(platform=OuterRef('pk')).order_by()
+                                                 .values('platform').annotate(count=Count('pk')).values('count')), 0),
+        }
+
+    expandable_fields = ['watchlist']  # Nested fields only rendered when requested with ?expand=
+    watchlist_limit_query_param = 'watchlist_limit'  # Allow clients to set how many titles are nested per platform
+    default_watchlist_limit = 5  # Default number of titles nested per platform
+    max_watchlist_limit = 20  # Maximum number of titles nested per platform allowed by the client
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.get_expand()
+        for field_name in self.expandable_fields:
+            if field_name not in expand:
+                self.fields.pop(field_name, None)
+
+    def get_expand(self):
+        """
+        Return the set of nested fields requested with ?expand=watchlist.
+        """
+        request = self.context.get('request')
+        if request is None:
+            return set()
+        return {name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()}
+
+    def get_watchlist_limit(self):
+        """
+        Return the number of titles nested per platform, bounded by max_watchlist_limit.
+        """
+        request = self.context.get('request')
+        try:
+            limit = int(request.query_params[self.watchlist_limit_query_param])
+        except (AttributeError, KeyError, ValueError):
+            return self.default_watchlist_limit
+        return min(max(limit, 1), self.max_watchlist_limit)
+
+    def get_watchlist_count(self, obj):
+        count = getattr(obj, 'watchlist_count', None)  # Annotated by optimize_queryset
+        if count is None:
+            count = obj.watchlist.count()
+        return count
+
+    def get_prefetch_queryset(self, field_name, queryset):
+        if field_name == 'watchlist':
+            # Top-N per platform, Django turns the slice into a ROW_NUMBER() window per platform
+            return queryset.order_by('-avg_rating', '-number_ratings', 'id')[:self.get_watchlist_limit()]
+        return super().get_prefetch_queryset(field_name, queryset)
 
+    def to_representation(self, instance):
+        if 'watchlist' in self.fields and not hasattr(instance, 'top_watchlist'):
+            # Instances that didn't come from optimize_queryset (e.g. just created)
+            instance.top_watchlist = list(self.get_prefetch_queryset('watchlist', instance.watchlist.all()))
+        return super().to_representation(instance)
+
+
+
+class StreamPlatformSummarySerializer(SparseFieldsetsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    """
+    Compact platform: the maintained counters only, no nested or counted titles.
+    """
+
+    class Meta:
+        model = StreamPlatform
+        fields = ['id', 'name', 'active_titles', 'number_ratings', 'avg_rating', 'created', 'updated']  # created is the cursor position
+        read_only_fields = fields
 
 
 # -------------- serializers.serializer ---------------
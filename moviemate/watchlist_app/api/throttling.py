@@ -1,8 +1,102 @@
-from rest_framework.throttling import UserRateThrottle
+from django.db import connections, transaction
+from rest_framework.throttling import SimpleRateThrottle, UserRateThrottle, ScopedRateThrottle
 
+from watchlist_app.models import ThrottleBucket
 
 
-class ReviewCreateThrottle(UserRateThrottle):
+def take_token(key, capacity, refill_rate, now, using='default'):
+    """
+    Refill the bucket of `key` for the time elapsed since its last check (refill_rate
+    tokens per second, at most `capacity`) and take one token if there is one.
+    Return (allowed, tokens left).
+
+    On SQLite >= 3.35 and PostgreSQL this is a single INSERT ... ON CONFLICT DO UPDATE
+    ... RETURNING, atomic without locks held across round trips.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql' or (connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)):
+        return _take_token_upsert(connection, key, capacity, refill_rate, now)
+    return _take_token_locked(key, capacity, refill_rate, now, using)
+
+
+def _take_token_upsert(connection, key, capacity, refill_rate, now):
+    qn = connection.ops.quote_name
+    table = qn(ThrottleBucket._meta.db_table)
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    # Every SET expression reads the old row, excluded is the row we tried to insert
+    refill = (f'{least}(%s, {table}.{qn("tokens")} + '
+              f'{greatest}(excluded.{qn("updated")} - {table}.{qn("updated")}, 0) * %s)')
+    sql = (
+        f'INSERT INTO {table} ({qn("key")}, {qn("tokens")}, {qn("updated")}, {qn("allowed")}) '
+        f'VALUES (%s, %s, %s, %s) '
+        f'ON CONFLICT ({qn("key")}) DO UPDATE SET '
+        f'{qn("tokens")} = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END, '
+        f'{qn("allowed")} = {refill} >= 1, '
+        f'{qn("updated")} = excluded.{qn("updated")} '
+        f'RETURNING {qn("allowed")}, {qn("tokens")}'
+    )
+    params = [key, capacity - 1, now, True] + [capacity, refill_rate] * 4
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        allowed, tokens = cursor.fetchone()
+    return bool(allowed), tokens
+
+
+def _take_token_locked(key, capacity, refill_rate, now, using):
+    """
+    Same as the upsert with a row lock, for databases without ON CONFLICT ... RETURNING.
+    """
+    with transaction.atomic(using=using):
+        bucket, created = (ThrottleBucket.objects.using(using).select_for_update()
+                           .get_or_create(key=key, defaults={'tokens': capacity, 'updated': now}))
+        tokens = min(capacity, bucket.tokens + max(now - bucket.updated, 0) * refill_rate)
+        bucket.allowed = tokens >= 1
+        bucket.tokens = tokens - 1 if bucket.allowed else tokens
+        bucket.updated = now
+        bucket.save(using=using)
+    return bucket.allowed, bucket.tokens
+
+
+class TokenBucketRateThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle whose state is a token bucket in the database instead of a
+    list of request timestamps in the cache.
+
+    A rate of 'N/period' is a bucket of N tokens refilled at N per period: the same
+    long-run rate and burst as DRF's sliding window, with constant-size state per key,
+    one round trip per check and the same limit across every worker process.
+    """
+    throttle_database = 'default'  # Database alias that holds the buckets
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.refill_rate = self.num_requests / self.duration
+        allowed, self.tokens = take_token(self.key, self.num_requests, self.refill_rate,
+                                          self.timer(), using=self.throttle_database)
+        return allowed
+
+    def wait(self):
+        """
+        Seconds until the bucket holds a whole token again.
+        """
+        if self.tokens >= 1:
+            return None
+        return (1 - self.tokens) / self.refill_rate
+
+
+class ScopedTokenBucketThrottle(ScopedRateThrottle, TokenBucketRateThrottle):
+    """
+    ScopedRateThrottle (rate from the view's throttle_scope) on the shared token buckets.
+    """
+
+
+class ReviewCreateThrottle(UserRateThrottle, TokenBucketRateThrottle):
     """
     Custom throttle class to limit the number of requests a user can make.
     """
@@ -10,8 +104,8 @@ class ReviewCreateThrottle(UserRateThrottle):
     # rate = '10/minute'  # Limit to 10 requests per minute per user
 
 
-class ReviewListThrottle(UserRateThrottle):
+class ReviewListThrottle(UserRateThrottle, TokenBucketRateThrottle):
     """
     Custom throttle class to limit the number of requests a user can make.
     """
-    scope = 'review-list'
\ No newline at end of file
+    scope = 'review-list'
@@ -2,12 +2,16 @@ from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
 
+from watchlist_app.api import async_views  # Variantes async de las lecturas públicas (ASGI)
+
 # from watchlist_app.api.views import movie_list, movie_detail
-from watchlist_app.api.views import (WatchListView, WatchDetailView, 
+from watchlist_app.api.views import (WatchListView, WatchDetailView, SimilarTitlesView, LeaderboardView,
                                      StreamPlatformListView, StreamPlatformDetailView, 
-                                     ReviewListView, ReviewDetailView,
+                                     ReviewListView, ReviewDetailView, ReviewHistogramView,
                                      ReviewCreateView, StreamPlatformView,
-                                     UserReviewView, WatchListFilterView)
+                                     UserReviewView, WatchListFilterView,
+                                     WatchListBulkCreateView, ReviewBulkCreateView,
+                                     WatchListExportView, ReviewExportView)
 
 
 
@@ -23,7 +27,11 @@ urlpatterns = [
     # Para los names de las vistas, se recomienda usar el formato 'modelname-<action>' para evitar conflictos con otras aplicaciones
     path('list/', WatchListView.as_view(), name='watchlist-list'), #path espera tener una vista
     path('<int:pk>/', WatchDetailView.as_view(), name='watchlist-detail'),  # <int:pk> es un parámetro de la URL que se pasará a la vista
+    path('<int:pk>/similar/', SimilarTitlesView.as_view(), name='watchlist-similar'),  # Títulos similares según las reviews
+    path('leaderboard/<slug:board>/', LeaderboardView.as_view(), name='watchlist-leaderboard'),  # top-rated y trending, ?platform=
     path('list-filter/', WatchListFilterView.as_view(), name='watchlist-filter'),  # Filter view for watchlist
+    path('bulk/', WatchListBulkCreateView.as_view(), name='watchlist-bulk'),  # JSON array or NDJSON catalog import
+    path('export/', WatchListExportView.as_view(), name='watchlist-export'),  # Streaming NDJSON/CSV export
     
     # path('stream/', StreamPlatformListView.as_view(), name='StreamPlatform-list'),
     # path('stream/<int:pk>/', StreamPlatformDetailView.as_view(), name='streamplatform-detail'),
@@ -32,12 +40,21 @@ urlpatterns = [
     # path('review/', ReviewListView.as_view(), name='review-list'),
     # path('review/<int:pk>/', ReviewDetailView.as_view(), name='review-detail'),
     path('<int:pk>/reviews/', ReviewListView.as_view(), name='review-list'),
+    path('<int:pk>/reviews/histogram/', ReviewHistogramView.as_view(), name='review-histogram'),  # Distribución 1-5, mediana y percentiles
     path('<int:pk>/review-create/', ReviewCreateView.as_view(), name='review-create'),
     path('review/<int:pk>/', ReviewDetailView.as_view(), name='review-detail'),
+    path('reviews/bulk/', ReviewBulkCreateView.as_view(), name='review-bulk'),  # JSON array or NDJSON review import
+    path('reviews/export/', ReviewExportView.as_view(), name='review-export'),  # Streaming NDJSON/CSV export
     # User-specific review detail view using path parameter
     # path('reviews/<str:username>/', UserReviewView.as_view(), name='user-review-detail'),
     
     # user User-specific detail view using query parameter
     path('reviews/', UserReviewView.as_view(), name='user-review-detail'),
-    
+
+    # Async read endpoints, same responses as the sync ones without blocking a worker under ASGI
+    path('async/list/', async_views.AsyncWatchListView.as_view(), name='async-watchlist-list'),
+    path('async/<int:pk>/', async_views.AsyncWatchDetailView.as_view(), name='async-watchlist-detail'),
+    path('async/<int:pk>/reviews/', async_views.AsyncReviewListView.as_view(), name='async-review-list'),
+    path('async/stream/', async_views.AsyncStreamPlatformListView.as_view(), name='async-streamplatform-list'),
+    path('async/stream/<int:pk>/', async_views.AsyncStreamPlatformDetailView.as_view(), name='async-streamplatform-detail'),
 ]
\ No newline at end of file
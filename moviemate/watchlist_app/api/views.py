@@ -1,3 +1,5 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 
 from rest_framework.response import Response
@@ -7,31 +9,59 @@ from rest_framework import status
 from rest_framework.views import APIView # Cambia api_view por APIView para usar clases en lugar de funciones
 from rest_framework import generics  # Importa generics si deseas usar vistas genéricas
 from rest_framework import viewsets  # Importa viewsets si deseas usar vistas basadas en conjuntos de vistas
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly  # Importa permisos para controlar el acceso a las vistas
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle, ScopedRateThrottle  # Importa throttling para limitar la tasa de solicitudes
-from rest_framework import filters
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly  # Importa permisos para controlar el acceso a las vistas
+from rest_framework.throttling import UserRateThrottle, AnonRateThrottle  # Importa throttling para limitar la tasa de solicitudes
+from rest_framework_simplejwt.models import TokenUser  # request.user de la autenticación stateless
 
 #Django-filter
 from django_filters.rest_framework import DjangoFilterBackend  # Importa DjangoFilterBackend para filtrar resultados en las vistas
 
-from watchlist_app.models import WatchList, StreamPlatform, Review
+from watchlist_app import ratings  # Agregados incrementales de ratings (suma y conteo)
+from watchlist_app import leaderboards  # Top rated y trending mantenidos con las reviews
+from watchlist_app import recommendations  # Títulos similares precalculados en un archivo mapeado en memoria
+from watchlist_app.models import RATING_VALUES, WatchList, StreamPlatform, Review
 from watchlist_app.api.serializers import (WatchListSerializer, StreamPlatformSerializer, 
-                                           ReviewSerializer)
+                                           ReviewSerializer, WatchListBulkSerializer, ReviewImportSerializer,
+                                           StreamPlatformSummarySerializer)
 from watchlist_app.api.permissions import IsAdminOrReadOnly, IsReviewUserOrReadOnly  # Importa permisos personalizados
-from watchlist_app.api.throttling import ReviewCreateThrottle, ReviewListThrottle
-from watchlist_app.api.pagination import WatchListPagination  # Importa la paginación personalizada
+from watchlist_app.api.throttling import ReviewCreateThrottle, ScopedTokenBucketThrottle  # Token buckets compartidos en la base de datos
+from watchlist_app.api.pagination import (WatchListPagination, WatchListCursorPagination,  # Importa la paginación personalizada
+                                          ReviewCursorPagination, StreamPlatformCursorPagination)
+from watchlist_app.api.caching import cache_response  # Cache de respuestas invalidado por señales de los modelos
+from watchlist_app.api.mixins import EagerLoadingViewMixin, BulkCreateViewMixin  # Eager loading del serializer e importaciones en bloque
+from watchlist_app.signals import invalidate_watchlists, invalidate_reviews  # bulk_create no envía señales
+from watchlist_app.api.exporting import export_response  # Exportaciones NDJSON/CSV en streaming
+from watchlist_app.api.filters import FullTextSearchFilter, StableOrderingFilter  # ?search= full-text y ?ordering= indexado
 
 # --------------- views basadas en clases ---------------
 
 #  ********* Views usando Django Rest Framework's viewsets ********
 
-class StreamPlatformView(viewsets.ModelViewSet): # Con este tipo de vista, puedes manejar las operaciones CRUD de manera mucho mas sencilla
+class StreamPlatformView(EagerLoadingViewMixin, viewsets.ModelViewSet): # Con este tipo de vista, puedes manejar las operaciones CRUD de manera mucho mas sencilla
     """
     view to handle the streaming plaforms using ModelViewSet.
     """
     permission_classes = [IsAdminOrReadOnly]  # Permite que solo los administradores puedan modificar o eliminar objetos, los usuarios autenticados pueden ver los detalles
     queryset = StreamPlatform.objects.all()  # Define el queryset para obtener todos los objetos StreamPlatform
     serializer_class = StreamPlatformSerializer  # Define el serializer a usar
+    pagination_class = StreamPlatformCursorPagination  # Paginación keyset sobre (created, id)
+
+    @cache_response('platform')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('platform:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, serializer_class=StreamPlatformSummarySerializer)
+    @cache_response('platform')
+    def summary(self, request, *args, **kwargs):
+        """
+        /stream/summary/: title count and rating of every platform from the maintained counters.
+        """
+        return super().list(request, *args, **kwargs)
     
 
 
@@ -67,23 +97,78 @@ class StreamPlatformView(viewsets.ModelViewSet): # Con este tipo de vista, puede
 
 #  ********* Views usando Django Rest Framework's generics views *********
 
-class WatchListFilterView(generics.ListCreateAPIView):
-    queryset = WatchList.objects.all()  # Define el queryset para obtener todos los objetos WatchList
+class WatchListFilterView(EagerLoadingViewMixin, generics.ListCreateAPIView):
+    queryset = WatchList.objects.order_by('-created', '-id')  # Define el queryset para obtener todos los objetos WatchList (orden estable para paginar)
     serializer_class = WatchListSerializer  # Define el serializer a usar
     # permission_classes = [IsAuthenticated]  # Permite que solo los usuarios autenticados puedan acceder a esta vista
     # throttle_classes = [ReviewListThrottle]
-    filter_backends = [filters.SearchFilter]  # Permite buscar en los resultados usando SearchFilter
-    search_fields = ['title','platform__name']  # Permite buscar por el campo title y por el nombre de la plataforma asociada
-    ordering_fields = ['avg_rating']  # Permite ordenar los resultados por avg_rating y number_ratings
+    filter_backends = [FullTextSearchFilter, StableOrderingFilter]  # Busca con el índice full-text y ordena con ?ordering=
+    search_fields = ['title','platform__name']  # Campos indexados: el title y el nombre de la plataforma asociada
+    ordering_fields = ['avg_rating', 'number_ratings', 'created']  # Cada orden tiene su índice (campo, id) en WatchList.Meta
     pagination_class = WatchListPagination
     
     
 
-class UserReviewView(generics.ListAPIView):
+class WatchListBulkCreateView(BulkCreateViewMixin, generics.GenericAPIView):
+    """
+    Bulk catalog import from partners: a JSON array or NDJSON stream of movies.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = WatchListBulkSerializer
+
+    def perform_bulk_create(self, serializer):
+        movies = serializer.save()  # bulk_create en lotes de BulkListSerializer.batch_size
+        ratings.add_titles(movies)  # bulk_create no envía señales, los contadores de las plataformas se suman aquí
+        invalidate_watchlists(movies)
+        return movies
+
+
+class ReviewBulkCreateView(BulkCreateViewMixin, generics.GenericAPIView):
+    """
+    Bulk import of historic reviews: a JSON array or NDJSON stream of reviews.
+    """
+    permission_classes = [IsAdminUser]  # Crea reviews en nombre de otros usuarios
+    serializer_class = ReviewImportSerializer
+
+    def perform_bulk_create(self, serializer):
+        reviews = serializer.save()
+        ratings.add_ratings(reviews)  # Un UPDATE por película, no uno por review
+        platforms = ratings.watchlist_platforms(reviews)  # Las películas ya cargadas por el serializer, sin consulta
+        invalidate_reviews(set(platforms), set(platforms.values()))
+        return reviews
+
+
+
+class ReviewExportView(APIView):
+    """
+    Streaming export of the reviews for analytics, ?output=ndjson|csv and ?since=<watermark>.
+    """
+    permission_classes = [IsAdminUser]
+    columns = ['id', 'watchlist_id', 'review_user__username', 'rating', 'description', 'active', 'created', 'updated']
+
+    def get(self, request):
+        return export_response(Review.objects.all(), self.columns, request, 'reviews')  # El username llega en el mismo JOIN
+
+
+class WatchListExportView(APIView):
+    """
+    Streaming export of the catalog for analytics, ?output=ndjson|csv and ?since=<watermark>.
+    """
+    permission_classes = [IsAdminUser]
+    columns = ['id', 'title', 'storyline', 'platform_id', 'platform__name', 'active', 'avg_rating',
+               'number_ratings', 'created', 'updated']
+
+    def get(self, request):
+        return export_response(WatchList.objects.all(), self.columns, request, 'watchlist')
+
+
+
+class UserReviewView(EagerLoadingViewMixin, generics.ListAPIView):
     """
     View to handle the list of reviews created by a specific user.
     """
     serializer_class = ReviewSerializer  # Define el serializer a usar
+    pagination_class = ReviewCursorPagination  # Paginación keyset sobre (created, id)
     # permission_classes = [IsAuthenticated]  # Permite que solo los usuarios autenticados puedan acceder a esta vista
     # throttle_classes = [ReviewListThrottle]  # Limita la tasa de solicitudes para la lista de reviews
     
@@ -114,47 +199,104 @@ class ReviewCreateView(generics.CreateAPIView):
         movie = WatchList.objects.get(pk=pk)  # Obtiene el objeto WatchList asociado al pk
         
         user = self.request.user  # Obtiene el usuario que está haciendo la solicitud
-        review_queryset = Review.objects.filter(watchlist=movie, review_user=user)  # Filtra las reviews por el watchlist y el usuario
-        if review_queryset.exists():
-            raise ValidationError("You have already reviewed this movie.")
-        
-        if movie.number_ratings == 0:
-            movie.avg_rating = serializer.validated_data['rating'] # Si es la primera review, establece el avg_rating al rating de la nueva review
-        else:
-            movie.avg_rating = (movie.avg_rating + serializer.validated_data['rating']) / (movie.number_ratings + 1)
-            
-        movie.number_ratings += 1  # Incrementa el número de ratings
-        
-        movie.save()  # Guarda el objeto WatchList actualizado
+        # Con la autenticación stateless request.user es un TokenUser sin fila, se guarda solo el id
+        owner = {'review_user_id': user.pk} if isinstance(user, TokenUser) else {'review_user': user}
         
-        serializer.save(watchlist=movie, review_user=user)  # Guarda la nueva review asociada al watchlist
+        # La review y el agregado del rating (señal count_review) se guardan en la misma transacción,
+        # el UPDATE con F() evita perder ratings cuando llegan reviews concurrentes.
+        # El UniqueConstraint (watchlist, review_user) rechaza la review duplicada en el mismo INSERT,
+        # sin hacer antes una consulta exists()
+        try:
+            with transaction.atomic():
+                serializer.save(watchlist=movie, **owner)  # Guarda la nueva review asociada al watchlist
+        except IntegrityError:
+            raise ValidationError("You have already reviewed this movie.")
 
-class ReviewListView(generics.ListAPIView):
+class ReviewListView(EagerLoadingViewMixin, generics.ListAPIView):
     """
     View to handle the list and creation of reviews.
     """
     # Para obtener solo las reviews de una pelicula especifica debemos hacer override del método get_queryset
     # queryset = Review.objects.all()  # Define el queryset para obtener todos los objetos Review
     serializer_class = ReviewSerializer  # Define el serializer a usar
+    pagination_class = ReviewCursorPagination  # Paginación keyset sobre (created, id)
     # permission_classes = [IsAuthenticated]  # Permite que solo los usuarios autenticados puedan acceder a esta vista
     # throttle_classes = [ReviewListThrottle]
     filter_backends = [DjangoFilterBackend]  # Permite filtrar los resultados usando DjangoFilterBackend
     filterset_fields = ['review_user__username','active','rating']  # Permite filtrar las reviews por el campo rating
     
+    @cache_response('reviews:{pk}')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_queryset(self):
         pk = self.kwargs.get('pk')  # Obtiene el pk de la URL
         return Review.objects.filter(watchlist=pk)  # Filtra las reviews por el watchlist asociado al pk
     
-class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ReviewHistogramView(APIView):
+    """
+    Distribution of the ratings of a movie from its histogram columns, with the median
+    and the percentiles of ?percentiles= (default 25,50,75,90).
+    """
+    default_percentiles = (25, 50, 75, 90)
+
+    @cache_response('reviews:{pk}')
+    def get(self, request, pk):
+        try:
+            percentiles = self.get_percentiles(request)
+        except ValueError:
+            return Response({'error': 'percentiles must be numbers between 0 and 100.'}, status=status.HTTP_400_BAD_REQUEST)
+        counts = WatchList.objects.filter(pk=pk).values_list(*WatchList.histogram_fields).first()  # Una fila, sin leer las reviews
+        if counts is None:
+            return Response({'error': 'Movie not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        histogram = dict(zip(RATING_VALUES, counts))
+        total = sum(counts)
+        return Response({
+            'watchlist': pk,
+            'number_ratings': total,
+            'avg_rating': sum(rating * count for rating, count in histogram.items()) / total if total else 0.0,
+            'histogram': {str(rating): count for rating, count in histogram.items()},
+            'median': ratings.histogram_median(histogram),
+            'percentiles': {f'{percent:g}': ratings.histogram_percentile(histogram, percent) for percent in percentiles},
+        })
+
+    def get_percentiles(self, request):
+        value = request.query_params.get('percentiles')
+        if not value:
+            return self.default_percentiles
+        percentiles = [float(percent) for percent in value.split(',')]
+        if not all(0 < percent <= 100 for percent in percentiles):  # NaN también queda fuera
+            raise ValueError(value)
+        return percentiles
+
+class ReviewDetailView(EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     View to handle the details of a specific review.
     """
     queryset = Review.objects.all()  # Define el queryset para obtener todos los objetos Review
     serializer_class = ReviewSerializer  # Define el serializer a usar
     permission_classes = [IsReviewUserOrReadOnly]
-    throttle_classes = [ScopedRateThrottle]  # Limita la tasa de solicitudes para usuarios autenticados y anónimos
+    throttle_classes = [ScopedTokenBucketThrottle]  # Limita la tasa de solicitudes para usuarios autenticados y anónimos (compartido entre workers)
     throttle_scope = 'review-detail'  # Define el scope para la tasa de solicitudes
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Lee la fila guardada (no la instancia en memoria) con bloqueo, las señales aplican la diferencia exacta
+            self.lock_review(serializer.instance)
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            self.lock_review(instance)
+            instance.delete()  # uncount_review quita el rating, created: el bucket diario del trending
+
+    @staticmethod
+    def lock_review(instance):
+        stored = Review.objects.select_for_update().values_list('watchlist_id', 'rating', 'created').get(pk=instance.pk)
+        instance.watchlist_id, instance.created = stored[0], stored[2]  # Ya leídos, evita cargar los campos diferidos en las señales
+        instance._stored_review = stored  # Las señales no vuelven a leerla
+
 
 #  ********* Views usando Django Rest Framework's mixins y generics *********
 
@@ -192,11 +334,16 @@ class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 class WatchListView(APIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
+    filter_backends = [StableOrderingFilter]  # Solo lo usa la paginación keyset para leer ?ordering=
+    ordering_fields = ['avg_rating', 'number_ratings', 'created']  # p. ej. ?ordering=-avg_rating para los mejor valorados
     
+    @cache_response('watchlist')
     def get(self, request):
-        movies = WatchList.objects.all()
-        serializer = WatchListSerializer(movies, many=True)  # Serializa la lista de películas
-        return Response(serializer.data)  # Devuelve la respuesta con los datos serializados
+        serializer = WatchListSerializer(context={'request': request})  # request: ?fields= y ?exclude=
+        movies = serializer.values_queryset(WatchList.objects.all())  # Filas de values() con la plataforma y len_title en la misma consulta, sin instancias
+        paginator = WatchListCursorPagination()  # APIView no pagina por si sola, se usa la paginación keyset directamente
+        page = paginator.paginate_queryset(movies, request, view=self)
+        return paginator.get_paginated_response(serializer.values_representation(page))  # Devuelve la respuesta con los datos serializados y los enlaces next/previous
     
     def post(self, request):
         serializer = WatchListSerializer(data=request.data)
@@ -210,13 +357,14 @@ class WatchListView(APIView):
 class WatchDetailView(APIView):
     permission_classes = [IsAdminOrReadOnly]  # Permite que solo los administradores puedan modificar o eliminar objetos, los usuarios autenticados pueden ver los detalles
     
+    @cache_response('watchlist:{pk}')
     def get(self, request, pk):
         try:
-            movie = WatchList.objects.get(pk=pk)  # Obtiene el objeto Movie por su clave primaria (pk)
+            movie = WatchListSerializer(context={'request': request}).optimize_queryset(WatchList.objects.all()).get(pk=pk)  # Obtiene el objeto Movie por su clave primaria (pk)
         except WatchList.DoesNotExist:
             return Response({'error': 'Movie not found'}, status=status.HTTP_404_NOT_FOUND)  # Devuelve un error si la película no existe
 
-        serializer = WatchListSerializer(movie)  # Serializa el objeto Movie
+        serializer = WatchListSerializer(movie, context={'request': request})  # Serializa el objeto Movie
         return Response(serializer.data)  # Devuelve la respuesta con los datos serializados
     
     def put(self, request, pk):
@@ -241,13 +389,78 @@ class WatchDetailView(APIView):
         
         
         
+class LeaderboardView(APIView):
+    """
+    Top rated (Bayesian average) or trending (reviews decayed by age) titles, overall
+    or of a ?platform=, read from the first ?limit= entries of the board's index.
+    """
+    default_limit = 10
+    max_limit = 100
+
+    @cache_response('watchlist')
+    def get(self, request, board):
+        if board not in leaderboards.BOARDS:
+            return Response({'error': f'Unknown leaderboard, expected one of {", ".join(leaderboards.BOARDS)}.'},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+            platform_id = request.query_params.get('platform')
+            platform_id = None if platform_id is None else int(platform_id)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            return Response({'error': f'limit and platform must be numbers, limit between 1 and {self.max_limit}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        field = leaderboards.BOARDS[board]
+        serializer = WatchListSerializer(context={'request': request})
+        rows = serializer.values_queryset(leaderboards.board_queryset(board, platform_id)).annotate(score=F(field))[:limit]
+        rows = list(rows)  # Un recorrido de k entradas del índice (platform,) puntaje, id
+        results = [{**movie, 'score': leaderboards.board_score(board, row['score'])}
+                   for movie, row in zip(serializer.values_representation(rows), rows)]
+        return Response({'board': board, 'platform': platform_id, 'results': results})
+
+
+class SimilarTitlesView(APIView):
+    """
+    "People who liked this also liked": the titles closest to a movie in the reviews,
+    from the file built by build_similar_titles. ?limit= up to SIMILAR_TITLES_K (default 10).
+    """
+    default_limit = 10
+
+    def get(self, request, pk):
+        index = recommendations.get_index()
+        if index is None:
+            return Response({'error': 'Similar titles are not available yet.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            limit = int(request.query_params.get('limit', min(self.default_limit, index.k)))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= index.k:
+            return Response({'error': f'limit must be between 1 and {index.k}.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not WatchList.objects.filter(pk=pk).exists():
+            return Response({'error': 'Movie not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        neighbours = index.neighbours(pk, limit)  # Búsqueda binaria en el archivo mapeado, sin leer las reviews
+        serializer = WatchListSerializer(context={'request': request})
+        rows = list(serializer.values_queryset(WatchList.objects.filter(pk__in=[movie_id for movie_id, score in neighbours])))
+        movies = {row['id']: movie for movie, row in zip(serializer.values_representation(rows), rows)}  # Con ?fields= sin id
+        results = [{**movies[movie_id], 'similarity': round(score, 4)}
+                   for movie_id, score in neighbours if movie_id in movies]  # Borradas desde el último build
+        return Response({'watchlist': pk, 'results': results})
+
+
 class StreamPlatformListView(APIView):
     """
     View to handle the streaming plaforms.
     """
     
     def get(self, request):
-        platforms = StreamPlatform.objects.all()  # Obtiene todos los objetos StreamPlatform de la base de datos
+        serializer = StreamPlatformSerializer(context={'request': request})
+        if serializer.can_serialize_values():  # Sin ?expand=watchlist las filas de values() bastan
+            platforms = serializer.values_queryset(StreamPlatform.objects.all())
+            return Response(serializer.values_representation(platforms), status=status.HTTP_200_OK)
+        platforms = serializer.optimize_queryset(StreamPlatform.objects.all())  # Obtiene los StreamPlatform con el conteo y el top de watchlist (?expand=watchlist) precargados
         serializer = StreamPlatformSerializer(platforms, many=True, context={'request': request})  # Serializa la lista de StreamPlatform, context es para incluir el request en los enlaces de HyperlinkedRelatedField
         return Response(serializer.data, status=status.HTTP_200_OK)  # Devuelve la respuesta con los datos serializados
     
@@ -266,7 +479,7 @@ class StreamPlatformDetailView(APIView):
     
     def get(self, request, pk):
         try:
-            platform = StreamPlatform.objects.get(pk=pk)
+            platform = StreamPlatformSerializer(context={'request': request}).optimize_queryset(StreamPlatform.objects.all()).get(pk=pk)
         except StreamPlatform.DoesNotExist:
             return Response({'error': 'Movie not found'}, status=status.HTTP_404_NOT_FOUND)  # Devuelve un error si la StreamPlatform no existe
 
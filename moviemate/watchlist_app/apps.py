@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WatchlistAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'watchlist_app'
+
+    def ready(self):
+        from watchlist_app import signals  # noqa: F401  Connects the cache invalidation receivers
@@ -0,0 +1,130 @@
+"""
+    Top rated and trending leaderboards, overall and per StreamPlatform.
+
+    Both boards are indexed columns of WatchList, so a board is the first k entries
+    of an index (WatchList.Meta.indexes) instead of a sort of the whole table:
+
+    - bayesian_rating: (C * m + rating_sum) / (C + number_ratings) with the prior mean
+      m = LEADERBOARD_PRIOR_MEAN and weight C = LEADERBOARD_PRIOR_WEIGHT. A movie
+      needs many good reviews to beat the prior, a single 5-star review doesn't.
+      watchlist_app.ratings recomputes it in the UPDATE of the rating aggregates.
+    - trending_score: the movie's reviews of the last LEADERBOARD_BUCKET_DAYS, each
+      weighted by 2 ** -(age in days / LEADERBOARD_TRENDING_HALF_LIFE_DAYS).
+      Weighting every review by 2 ** ((day - TRENDING_EPOCH) / half-life) instead
+      gives the same order at any time, so a review only adds its weight once and
+      the scores never have to be decayed. The API divides by today's weight.
+
+    The reviews per movie and day are counted in ReviewDay buckets in the same
+    transaction as the review. `rollup_leaderboards` runs daily: it drops the
+    buckets that left the window and recomputes the trending scores from the rest.
+    It also recomputes the Bayesian ratings after a change of the prior.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from watchlist_app.models import Review, ReviewDay, WatchList
+
+# The weights double every half-life, a float holds about 1000 of them (19 years with the default 7 days).
+# Moving the epoch means running `rollup_leaderboards` right after the deploy.
+TRENDING_EPOCH = datetime.date(2026, 1, 1)
+
+BOARDS = {
+    'top-rated': 'bayesian_rating',
+    'trending': 'trending_score',
+}
+
+
+def bayesian(rating_sum, number_ratings):
+    """
+    Bayesian average as an expression of the rating sum and count (expressions or F()).
+    The prior weight is positive, so there's no division by zero without ratings.
+    """
+    weight = float(settings.LEADERBOARD_PRIOR_WEIGHT)
+    return ((Cast(rating_sum, FloatField()) + Value(weight * settings.LEADERBOARD_PRIOR_MEAN))
+            / (Cast(number_ratings, FloatField()) + Value(weight)))
+
+
+def review_day(created=None):
+    return timezone.localdate(created) if created else timezone.localdate()
+
+
+def first_bucket_day(today=None):
+    return (today or timezone.localdate()) - datetime.timedelta(days=settings.LEADERBOARD_BUCKET_DAYS - 1)
+
+
+def trending_weight(day):
+    return 2.0 ** ((day - TRENDING_EPOCH).days / settings.LEADERBOARD_TRENDING_HALF_LIFE_DAYS)
+
+
+def count_reviews(watchlist_id, day, delta):
+    """
+    Add `delta` reviews to the bucket of a movie and day, return the change of its trending_score.
+    Days already out of the window don't count (the rollup dropped their buckets).
+    """
+    if day < first_bucket_day():
+        return 0.0
+    if not ReviewDay.objects.filter(watchlist_id=watchlist_id, day=day).update(reviews=F('reviews') + delta):
+        if delta < 0:
+            return 0.0  # Reviews written around the buckets, nothing to take back
+        try:
+            with transaction.atomic():  # Savepoint, a concurrent first review of the day creates the bucket
+                ReviewDay.objects.create(watchlist_id=watchlist_id, day=day, reviews=delta)
+        except IntegrityError:
+            ReviewDay.objects.filter(watchlist_id=watchlist_id, day=day).update(reviews=F('reviews') + delta)
+    return delta * trending_weight(day)
+
+
+def board_queryset(board, platform_id=None):
+    """
+    Active titles in leaderboard order, served from the (platform,) score, id index.
+    """
+    field = BOARDS[board]
+    queryset = WatchList.objects.filter(active=True)
+    if platform_id is not None:
+        queryset = queryset.filter(platform_id=platform_id)
+    return queryset.order_by(f'-{field}', '-id')
+
+
+def board_score(board, value, today=None):
+    """
+    Score shown for a leaderboard entry: the Bayesian rating, or the decayed number of reviews as of today.
+    """
+    if board == 'trending':
+        return value / trending_weight(today or timezone.localdate())
+    return value
+
+
+def rebuild_review_days(review_model=Review, review_day_model=ReviewDay, today=None):
+    """
+    Recount the buckets of the window from the reviews.
+    """
+    review_day_model.objects.all().delete()
+    days = (review_model.objects.filter(created__date__gte=first_bucket_day(today))
+            .annotate(day=TruncDate('created')).order_by()
+            .values('watchlist_id', 'day').annotate(reviews=Count('pk')))
+    review_day_model.objects.bulk_create([review_day_model(**row) for row in days], batch_size=1000)
+
+
+def rollup(watchlist_model=WatchList, review_day_model=ReviewDay, today=None):
+    """
+    Drop the buckets out of the window, recompute trending_score from the rest and
+    bayesian_rating from the rating aggregates. Return the number of buckets dropped.
+    """
+    dropped, _ = review_day_model.objects.filter(day__lt=first_bucket_day(today)).delete()
+
+    # One weight per day of the window, the score of every movie in a single UPDATE
+    days = review_day_model.objects.order_by('day').values_list('day', flat=True).distinct()
+    weighted = Sum(Case(*[When(day=day, then=Cast(F('reviews'), FloatField()) * Value(trending_weight(day)))
+                          for day in days], default=Value(0.0), output_field=FloatField()))
+    buckets = review_day_model.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+    watchlist_model.objects.update(
+        trending_score=Coalesce(Subquery(buckets.annotate(total=weighted).values('total')), Value(0.0)),
+        bayesian_rating=bayesian(F('rating_sum'), F('number_ratings')),
+    )
+    return dropped
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from watchlist_app import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Build the similar titles file served by /watchlist/<pk>/similar/. Incremental by default: '
+            'only the titles touched by the reviews written since the last build are recomputed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='recompute every title')
+        parser.add_argument('--k', type=int, default=None, help='neighbours per title, defaults to SIMILAR_TITLES_K')
+        parser.add_argument('--batch-size', type=int, default=256, help='titles per sparse product (NumPy/SciPy)')
+        parser.add_argument('--path', default=None, help='output file, defaults to SIMILAR_TITLES_PATH')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = recommendations.build_similar_titles(options['path'], options['k'], options['full'],
+                                                      options['batch_size'])
+        engine = 'NumPy/SciPy' if recommendations.np is not None else 'Python'
+        self.stdout.write(f"{'Full' if result['full'] else 'Incremental'} build ({engine}): recomputed "
+                          f"{result['recomputed']} of {result['titles']} titles in {time.perf_counter() - start:.2f}s.")
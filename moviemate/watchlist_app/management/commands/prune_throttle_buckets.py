@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from watchlist_app.models import ThrottleBucket
+
+
+class Command(BaseCommand):
+    help = 'Delete throttle buckets idle long enough to be full again (a full bucket is the same as no bucket).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=None,
+                            help='idle seconds, defaults to the longest period in DEFAULT_THROTTLE_RATES')
+
+    def handle(self, *args, **options):
+        max_age = options['older_than']
+        if max_age is None:
+            # A bucket refills completely within its rate period
+            rates = [rate for rate in api_settings.DEFAULT_THROTTLE_RATES.values() if rate]
+            max_age = max((SimpleRateThrottle.parse_rate(None, rate)[1] for rate in rates), default=86400)
+        deleted, _ = ThrottleBucket.objects.filter(updated__lt=time.time() - max_age).delete()
+        self.stdout.write(f'Deleted {deleted} throttle buckets idle for more than {max_age:g}s.')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from watchlist_app.models import StreamPlatform
+from watchlist_app.ratings import platform_counter_mismatches, rebuild_platform_counters
+
+
+class Command(BaseCommand):
+    help = 'Check the StreamPlatform counters (titles, ratings, mean) against the titles and rebuild the wrong ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="only report the platforms that drifted, fail if there are any")
+        parser.add_argument('--all', action='store_true', help='rebuild every platform, not only the drifted ones')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = platform_counter_mismatches()
+            for row in mismatches:
+                self.stdout.write(
+                    f"{row['pk']} {row['name']}: titles {row['active_titles']} (expected {row['expected_active_titles']}), "
+                    f"ratings {row['number_ratings']} (expected {row['expected_number_ratings']}), "
+                    f"sum {row['rating_sum']} (expected {row['expected_rating_sum']})"
+                )
+            if options['verify']:
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} platforms have wrong counters.')
+                self.stdout.write('All platform counters are correct.')
+                return
+
+            platforms = StreamPlatform.objects.all()
+            if not options['all']:
+                platforms = platforms.filter(pk__in=[row['pk'] for row in mismatches])
+            rebuilt = rebuild_platform_counters(platforms)
+        self.stdout.write(f'Rebuilt the counters of {rebuilt} platforms.')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from watchlist_app import leaderboards
+
+
+class Command(BaseCommand):
+    help = ('Daily rollup of the leaderboards: drop the review buckets out of the trending window and '
+            'recompute the trending scores and Bayesian ratings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-buckets', action='store_true',
+                            help='recount the daily buckets from the reviews first')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['rebuild_buckets']:
+                leaderboards.rebuild_review_days()
+            dropped = leaderboards.rollup()
+        self.stdout.write(f'Dropped {dropped} expired buckets and recomputed the leaderboards.')
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:24
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """
+    Recompute rating_sum, number_ratings and avg_rating from the existing reviews.
+    """
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    Review = apps.get_model('watchlist_app', 'Review')
+
+    WatchList.objects.update(rating_sum=0, number_ratings=0, avg_rating=0)
+    totals = Review.objects.values('watchlist').annotate(total=Sum('rating'), count=Count('id')).order_by()
+    for row in totals:
+        WatchList.objects.filter(pk=row['watchlist']).update(
+            rating_sum=row['total'],
+            number_ratings=row['count'],
+            avg_rating=row['total'] / row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0006_rename_activbe_review_active_watchlist_avg_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0007_watchlist_rating_sum'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='watchlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='watchlist_app.watchlist'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['watchlist', 'rating', 'active'], name='review_watchlist_rating_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('watchlist', 'review_user'), name='review_unique_watchlist_user'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0008_review_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='review_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['watchlist', '-created', '-id'], name='review_watchlist_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['review_user', '-created', '-id'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created', '-id'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='streamplatform',
+            index=models.Index(fields=['-created', '-id'], name='platform_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-created', '-id'], name='watchlist_created_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+from django.db import DatabaseError, migrations
+
+
+FTS_TABLE = 'watchlist_app_watchlist_fts'
+
+CREATE_SQL = [
+    # Index of the searchable text, rowid is the WatchList id.
+    # prefix='2 3' keeps extra indexes so short prefix queries ("st"*, "sta"*) don't scan the vocabulary
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, platform_name, tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""INSERT INTO {FTS_TABLE}(rowid, title, platform_name)
+        SELECT w.id, w.title, p.name FROM watchlist_app_watchlist w
+        JOIN watchlist_app_streamplatform p ON p.id = w.platform_id""",
+]
+
+# Migrations that rebuild watchlist_app_watchlist on SQLite (most AlterFields) have to
+# drop these first (the table rename fails while a trigger references it) and create them again
+TRIGGERS_SQL = [
+    f"""CREATE TRIGGER watchlist_fts_insert AFTER INSERT ON watchlist_app_watchlist BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, platform_name) VALUES (
+            new.id, new.title, (SELECT name FROM watchlist_app_streamplatform WHERE id = new.platform_id));
+    END""",
+    # Only when the searchable columns are written, rating updates don't touch the index
+    f"""CREATE TRIGGER watchlist_fts_update AFTER UPDATE OF title, platform_id ON watchlist_app_watchlist BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title,
+            platform_name = (SELECT name FROM watchlist_app_streamplatform WHERE id = new.platform_id)
+        WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER watchlist_fts_delete AFTER DELETE ON watchlist_app_watchlist BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER streamplatform_fts_update AFTER UPDATE OF name ON watchlist_app_streamplatform BEGIN
+        UPDATE {FTS_TABLE} SET platform_name = new.name
+        WHERE rowid IN (SELECT id FROM watchlist_app_watchlist WHERE platform_id = new.id);
+    END""",
+]
+
+DROP_TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS streamplatform_fts_update',
+    'DROP TRIGGER IF EXISTS watchlist_fts_delete',
+    'DROP TRIGGER IF EXISTS watchlist_fts_update',
+    'DROP TRIGGER IF EXISTS watchlist_fts_insert',
+]
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Some builds load FTS5 without the compile option, ask for the module itself
+        try:
+            cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+        except DatabaseError:  # pragma_module_list needs SQLite 3.30
+            return False
+        return cursor.fetchone() is not None
+
+
+def create_fts(apps, schema_editor):
+    """
+    Create the FTS5 index on SQLite builds that have it, other databases use
+    the in-process index of watchlist_app.search.
+    """
+    if not fts5_available(schema_editor):
+        return
+    for sql in CREATE_SQL + TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_TRIGGERS_SQL + [f'DROP TABLE IF EXISTS {FTS_TABLE}']:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0010_streamplatform_updated_watchlist_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:43
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+fts = import_module('watchlist_app.migrations.0011_watchlist_fts')
+
+
+def fill_null_ratings(apps, schema_editor):
+    """
+    avg_rating and number_ratings become NOT NULL (keyset ordering can't seek on NULLs).
+    """
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    WatchList.objects.filter(avg_rating__isnull=True).update(avg_rating=0)
+    WatchList.objects.filter(number_ratings__isnull=True).update(number_ratings=0)
+
+
+def has_fts(schema_editor):
+    return fts.FTS_TABLE in schema_editor.connection.introspection.table_names()
+
+
+def drop_fts_triggers(apps, schema_editor):
+    """
+    The AlterFields rebuild the watchlist table on SQLite, which fails while the FTS triggers reference it.
+    """
+    if has_fts(schema_editor):
+        for sql in fts.DROP_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+def create_fts_triggers(apps, schema_editor):
+    if has_fts(schema_editor):
+        for sql in fts.TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+def prepare_forwards(apps, schema_editor):
+    fill_null_ratings(apps, schema_editor)
+    drop_fts_triggers(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0011_watchlist_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(prepare_forwards, create_fts_triggers),
+        migrations.AlterField(
+            model_name='watchlist',
+            name='avg_rating',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='watchlist',
+            name='number_ratings',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+        migrations.RunPython(create_fts_triggers, drop_fts_triggers),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-avg_rating', '-id'], name='watchlist_avg_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-number_ratings', '-id'], name='watchlist_number_ratings_idx'),
+        ),
+    ]
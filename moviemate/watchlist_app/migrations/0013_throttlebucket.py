@@ -0,0 +1,22 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0012_watchlist_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated', models.FloatField()),
+                ('allowed', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
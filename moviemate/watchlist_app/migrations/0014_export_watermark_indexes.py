@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0013_throttlebucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['updated', 'id'], name='review_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['updated', 'id'], name='watchlist_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    The auth_user email index moved to user_app 0001_auth_user_email_index, the
+    migration stays empty so the chain of the databases that already applied it holds.
+    """
+
+    dependencies = [
+        ('watchlist_app', '0014_export_watermark_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = []
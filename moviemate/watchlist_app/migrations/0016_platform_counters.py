@@ -0,0 +1,69 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:11
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+ordering = import_module('watchlist_app.migrations.0012_watchlist_ordering_indexes')
+
+
+def fill_platform_counters(apps, schema_editor):
+    """
+    Compute the counters of every platform from its titles, with the historical models.
+    """
+    StreamPlatform = apps.get_model('watchlist_app', 'StreamPlatform')
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+
+    titles = WatchList.objects.filter(platform=OuterRef('pk')).order_by().values('platform')
+
+    def total(aggregate):
+        return Coalesce(Subquery(titles.annotate(total=aggregate).values('total')), 0)
+
+    StreamPlatform.objects.update(
+        active_titles=total(Count('pk', filter=Q(active=True))),
+        rating_sum=total(Sum('rating_sum')),
+        number_ratings=total(Sum('number_ratings')),
+    )
+    # Second UPDATE: in the first one F('rating_sum') would still read the old sum
+    StreamPlatform.objects.update(avg_rating=Case(
+        When(number_ratings__gt=0, then=Cast(F('rating_sum'), FloatField()) / Cast(F('number_ratings'), FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0015_auth_user_email_index'),
+    ]
+
+    operations = [
+        # The AddFields rebuild the platform table on SQLite, the FTS trigger on platform names references it
+        migrations.RunPython(ordering.drop_fts_triggers, ordering.create_fts_triggers),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='active_titles',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='number_ratings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(ordering.create_fts_triggers, ordering.drop_fts_triggers),
+        migrations.RunPython(fill_platform_counters, migrations.RunPython.noop),
+    ]
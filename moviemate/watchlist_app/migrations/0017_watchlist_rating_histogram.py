@@ -0,0 +1,64 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:35
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+ordering = import_module('watchlist_app.migrations.0012_watchlist_ordering_indexes')
+
+
+def fill_rating_histograms(apps, schema_editor):
+    """
+    Count the reviews of each rating value (1 to 5) of every movie, with the historical models.
+    """
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    Review = apps.get_model('watchlist_app', 'Review')
+
+    reviews = Review.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+    WatchList.objects.update(**{
+        f'ratings_{rating}': Coalesce(Subquery(reviews.filter(rating=rating).annotate(total=Count('pk'))
+                                               .values('total')), 0)
+        for rating in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0016_platform_counters'),
+    ]
+
+    operations = [
+        # The AddFields rebuild the watchlist table on SQLite, the FTS triggers reference it
+        migrations.RunPython(ordering.drop_fts_triggers, ordering.create_fts_triggers),
+        migrations.AddField(
+            model_name='watchlist',
+            name='ratings_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='ratings_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='ratings_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='ratings_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='ratings_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(ordering.create_fts_triggers, ordering.drop_fts_triggers),
+        migrations.RunPython(fill_rating_histograms, migrations.RunPython.noop),
+    ]
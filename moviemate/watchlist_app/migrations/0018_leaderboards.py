@@ -0,0 +1,110 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:46
+
+import datetime
+from importlib import import_module
+
+import django.db.models.deletion
+import watchlist_app.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+
+ordering = import_module('watchlist_app.migrations.0012_watchlist_ordering_indexes')
+
+TRENDING_EPOCH = datetime.date(2026, 1, 1)  # watchlist_app.leaderboards.TRENDING_EPOCH, the rollup rescales after a move
+
+
+def fill_leaderboards(apps, schema_editor):
+    """
+    Count the reviews of the trending window per movie and day, then compute the
+    trending scores from the buckets and the Bayesian ratings from the rating aggregates.
+    """
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    Review = apps.get_model('watchlist_app', 'Review')
+    ReviewDay = apps.get_model('watchlist_app', 'ReviewDay')
+    prior_weight = float(getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', 10))
+    prior_mean = getattr(settings, 'LEADERBOARD_PRIOR_MEAN', 3.0)
+    half_life = getattr(settings, 'LEADERBOARD_TRENDING_HALF_LIFE_DAYS', 7)
+    bucket_days = getattr(settings, 'LEADERBOARD_BUCKET_DAYS', 28)
+
+    first_day = timezone.localdate() - datetime.timedelta(days=bucket_days - 1)
+    days = (Review.objects.filter(created__date__gte=first_day)
+            .annotate(day=TruncDate('created')).order_by()
+            .values('watchlist_id', 'day').annotate(reviews=Count('pk')))
+    ReviewDay.objects.bulk_create([ReviewDay(**row) for row in days], batch_size=1000)
+
+    # Each review weighs 2 ** ((day - epoch) / half-life), one weight per day of the window
+    weighted = Sum(Case(*[When(day=day, then=Cast(F('reviews'), FloatField())
+                                * Value(2.0 ** ((day - TRENDING_EPOCH).days / half_life)))
+                          for day in ReviewDay.objects.order_by('day').values_list('day', flat=True).distinct()],
+                        default=Value(0.0), output_field=FloatField()))
+    buckets = ReviewDay.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+    WatchList.objects.update(
+        trending_score=Coalesce(Subquery(buckets.annotate(total=weighted).values('total')), Value(0.0)),
+        bayesian_rating=((Cast(F('rating_sum'), FloatField()) + Value(prior_weight * prior_mean))
+                         / (Cast(F('number_ratings'), FloatField()) + Value(prior_weight))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0017_watchlist_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reviews', models.IntegerField(default=0)),
+            ],
+        ),
+        # The AddFields rebuild the watchlist table on SQLite, the FTS triggers reference it
+        migrations.RunPython(ordering.drop_fts_triggers, ordering.create_fts_triggers),
+        migrations.AddField(
+            model_name='watchlist',
+            name='bayesian_rating',
+            field=models.FloatField(default=watchlist_app.models.prior_rating),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-bayesian_rating', '-id'], name='watchlist_bayesian_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-trending_score', '-id'], name='watchlist_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['platform', '-bayesian_rating', '-id'], name='watchlist_plat_bayesian_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['platform', '-trending_score', '-id'], name='watchlist_plat_trending_idx'),
+        ),
+        migrations.AddField(
+            model_name='reviewday',
+            name='watchlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='review_days', to='watchlist_app.watchlist'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewday',
+            index=models.Index(fields=['day'], name='review_day_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewday',
+            constraint=models.UniqueConstraint(fields=('watchlist', 'day'), name='review_day_unique_watchlist_day'),
+        ),
+        migrations.RunPython(ordering.create_fts_triggers, ordering.drop_fts_triggers),
+        migrations.RunPython(fill_leaderboards, migrations.RunPython.noop),
+    ]
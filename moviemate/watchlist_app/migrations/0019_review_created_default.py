@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Review.created from auto_now_add to a default, so bulk imports keep their dates.
+    The column doesn't change (Django fills both in Python), only the state does:
+    a plain AlterField would copy the whole review table on SQLite.
+    """
+
+    dependencies = [
+        ('watchlist_app', '0018_leaderboards'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='review',
+                    name='created',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
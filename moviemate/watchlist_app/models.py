@@ -1,6 +1,15 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+MIN_RATING, MAX_RATING = 1, 5  # Bounds of Review.rating
+RATING_VALUES = range(MIN_RATING, MAX_RATING + 1)  # One histogram column per value, WatchList.ratings_<value>
+
+
+def prior_rating():
+    return settings.LEADERBOARD_PRIOR_MEAN  # Bayesian rating of a movie without reviews
 
 
 class StreamPlatform(models.Model):
@@ -8,6 +17,27 @@ class StreamPlatform(models.Model):
     about = models.CharField(max_length=200, blank=True)
     website = models.URLField(max_length=200, blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)  # Last-Modified of the cached responses
+    # Summary of the platform's titles, kept in sync by watchlist_app.ratings (rebuild_platform_counters to check them)
+    # Plain integers: rows written around the signals (raw SQL, bulk_create) must not make deletes fail
+    active_titles = models.IntegerField(default=0)  # Titles with active=True
+    number_ratings = models.IntegerField(default=0)  # Reviews of all the platform's titles
+    rating_sum = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0)  # rating_sum / number_ratings
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created', '-id'], name='platform_created_idx'),  # Keyset pagination
+        ]
+
+    counter_fields = ('active_titles', 'number_ratings', 'rating_sum', 'avg_rating')
+
+    def save(self, *args, **kwargs):
+        # The counters only change through F() UPDATEs, an instance read earlier must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.name)
@@ -19,23 +49,109 @@ class WatchList(models.Model):
     storyline = models.CharField(max_length=50)
     platform = models.ForeignKey(StreamPlatform, related_name='watchlist', on_delete=models.CASCADE)
     active = models.BooleanField(default=True)
-    avg_rating = models.FloatField(default=0, null=True, blank=True)  # Average rating for the watchlist
-    number_ratings = models.IntegerField(default=0, null=True, blank=True)  # Number of ratings received
+    avg_rating = models.FloatField(default=0, blank=True)  # Average rating for the watchlist (not null, it's a keyset ordering)
+    number_ratings = models.IntegerField(default=0, blank=True)  # Number of ratings received
+    rating_sum = models.PositiveIntegerField(default=0)  # Sum of all ratings, kept in sync by watchlist_app.ratings
+    # Reviews with each rating, updated in the same UPDATE as rating_sum (plain integers like the platform counters)
+    ratings_1 = models.IntegerField(default=0)
+    ratings_2 = models.IntegerField(default=0)
+    ratings_3 = models.IntegerField(default=0)
+    ratings_4 = models.IntegerField(default=0)
+    ratings_5 = models.IntegerField(default=0)
+    # Leaderboards (watchlist_app.leaderboards), maintained with the rating aggregates
+    bayesian_rating = models.FloatField(default=prior_rating)  # Mean rating pulled towards LEADERBOARD_PRIOR_MEAN, see leaderboards.bayesian
+    trending_score = models.FloatField(default=0)  # Reviews weighted by their age, in units relative to leaderboards.TRENDING_EPOCH
     created = models.DateTimeField(auto_now_add=True)
-    
-    
+    updated = models.DateTimeField(auto_now=True)  # Also bumped by the rating aggregates
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created', '-id'], name='watchlist_created_idx'),  # Keyset pagination
+            # ?ordering= on the watchlist views, scanned backwards for the ascending orderings
+            models.Index(fields=['-avg_rating', '-id'], name='watchlist_avg_rating_idx'),
+            models.Index(fields=['-number_ratings', '-id'], name='watchlist_number_ratings_idx'),
+            models.Index(fields=['updated', 'id'], name='watchlist_updated_idx'),  # Incremental exports
+            # Leaderboards: the first k entries of the index, overall and per platform
+            models.Index(fields=['-bayesian_rating', '-id'], name='watchlist_bayesian_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='watchlist_trending_idx'),
+            models.Index(fields=['platform', '-bayesian_rating', '-id'], name='watchlist_plat_bayesian_idx'),
+            models.Index(fields=['platform', '-trending_score', '-id'], name='watchlist_plat_trending_idx'),
+        ]
+
+    histogram_fields = tuple(f'ratings_{value}' for value in RATING_VALUES)
+    leaderboard_fields = ('bayesian_rating', 'trending_score')
+    # Columns that only change through the F() UPDATEs of watchlist_app.ratings and watchlist_app.leaderboards
+    maintained_fields = ('avg_rating', 'number_ratings', 'rating_sum') + histogram_fields + leaderboard_fields
+
+    def save(self, *args, **kwargs):
+        # Like StreamPlatform.save: an instance read before a review must not write the old aggregates back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.maintained_fields]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return str(self.title)
     
     
 class Review(models.Model):
-    review_user = models.ForeignKey(User, related_name='reviews', on_delete=models.CASCADE)
-    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    review_user = models.ForeignKey(User, related_name='reviews', on_delete=models.CASCADE, db_index=False)  # Covered by the composite indexes in Meta
+    rating = models.PositiveIntegerField(validators=[MinValueValidator(MIN_RATING), MaxValueValidator(MAX_RATING)])
     description = models.CharField(max_length=200, null=True)
-    watchlist = models.ForeignKey(WatchList, related_name='reviews', on_delete=models.CASCADE)
+    watchlist = models.ForeignKey(WatchList, related_name='reviews', on_delete=models.CASCADE, db_index=False)  # Covered by the composite indexes in Meta
     active = models.BooleanField(default=True)
-    created = models.DateTimeField(auto_now_add=True)
+    created = models.DateTimeField(default=timezone.now, editable=False)  # Not auto_now_add, which would overwrite the dates of imported reviews
     updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # One review per user and movie, lets ReviewCreateView insert without a previous exists() query
+            models.UniqueConstraint(fields=['watchlist', 'review_user'], name='review_unique_watchlist_user'),
+        ]
+        indexes = [
+            # ReviewListView: watchlist + ?rating= + ?active= (a boolean filter compiles to a bare
+            # column check that can't seek, so it goes last and is checked inside the index)
+            models.Index(fields=['watchlist', 'rating', 'active'], name='review_watchlist_rating_idx'),
+            # Keyset pagination of ReviewListView, UserReviewView (?username=) and the unfiltered list
+            models.Index(fields=['watchlist', '-created', '-id'], name='review_watchlist_created_idx'),
+            models.Index(fields=['review_user', '-created', '-id'], name='review_user_created_idx'),
+            models.Index(fields=['-created', '-id'], name='review_created_idx'),
+            models.Index(fields=['updated', 'id'], name='review_updated_idx'),  # Incremental exports
+        ]
     
     def __str__(self):
-        return str(self.rating)+" - " + str(self.watchlist.title) + " - " + str(self.review_user)
\ No newline at end of file
+        return str(self.rating)+" - " + str(self.watchlist.title) + " - " + str(self.review_user)
+
+class ReviewDay(models.Model):
+    """
+    Reviews of a movie on one day, the rollup buckets of the trending leaderboard.
+    Only the last LEADERBOARD_BUCKET_DAYS are kept, see watchlist_app.leaderboards.
+    """
+    watchlist = models.ForeignKey(WatchList, related_name='review_days', on_delete=models.CASCADE, db_index=False)  # Covered by the unique constraint
+    day = models.DateField()
+    reviews = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['watchlist', 'day'], name='review_day_unique_watchlist_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='review_day_day_idx'),  # Pruning of the expired buckets
+        ]
+
+    def __str__(self):
+        return f'{self.watchlist_id} {self.day}: {self.reviews}'
+
+
+class ThrottleBucket(models.Model):
+    """
+    Token bucket of a throttle key (e.g. 'throttle_review-create_3'), shared by every worker.
+    Constant size per key, see watchlist_app.api.throttling.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()  # Tokens left after the last check
+    updated = models.FloatField()  # Unix time of the last check, the refill is computed from it
+    allowed = models.BooleanField(default=True)  # Result of the last check
+
+    def __str__(self):
+        return f'{self.key}: {self.tokens:.2f}'
@@ -0,0 +1,319 @@
+"""
+    Incremental rating aggregates for WatchList and StreamPlatform.
+
+    Every review write applies its delta to `rating_sum` and `number_ratings` with a
+    single conditional UPDATE built from F() expressions, so concurrent reviews can't
+    lose updates and reading a movie's rating never scans the Review table.
+    Callers run these functions inside the same transaction.atomic() block as the
+    Review write: the Review signals (watchlist_app.signals) for single reviews,
+    the bulk import for add_ratings, since bulk_create sends no signals.
+
+    The platform summary (active titles, ratings of all its titles and their mean)
+    follows the same deltas: the review functions update the movie's platform too and
+    the WatchList signals (watchlist_app.signals) add, move and remove titles.
+    `rebuild_platform_counters` recomputes them from the tables.
+
+    The leaderboard columns (watchlist_app.leaderboards) ride on the same UPDATE:
+    bayesian_rating follows the new sum and count, and trending_score gets the
+    weight of the reviews counted in the day buckets.
+
+    The same UPDATE keeps the movie's histogram: one column per rating value
+    (WatchList.histogram_fields), so its median and percentiles are a walk over five
+    counters instead of a GROUP BY over the reviews.
+"""
+
+import math
+from collections import Counter, defaultdict
+
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Now
+from django.db.models.lookups import GreaterThan
+
+from watchlist_app import leaderboards
+from watchlist_app.models import RATING_VALUES, Review, StreamPlatform, WatchList
+
+PLATFORM_DELTAS_BATCH = 500  # Platforms per UPDATE in apply_platform_deltas, ~7 parameters each
+
+
+def mean(rating_sum, number_ratings):
+    """
+    rating_sum / number_ratings as an expression, 0 without ratings.
+    """
+    return Case(
+        When(GreaterThan(number_ratings, 0),
+             then=Cast(rating_sum, FloatField()) / Cast(number_ratings, FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def histogram_field(rating):
+    return f'ratings_{rating}'
+
+
+def apply_rating_delta(watchlist_id, rating_delta, count_delta, platform=True, histogram=None, trending_delta=0.0):
+    """
+    Add `rating_delta` to the rating sum and `count_delta` to the number of ratings
+    of a WatchList and recompute avg_rating and bayesian_rating in the same UPDATE statement.
+    `histogram` maps rating values to the change of their review counts and
+    `trending_delta` is added to trending_score.
+    With `platform` the movie's platform gets the same delta.
+    """
+    number_ratings = Coalesce(F('number_ratings'), 0) + count_delta
+    rating_sum = F('rating_sum') + rating_delta
+    buckets = {histogram_field(rating): F(histogram_field(rating)) + delta
+               for rating, delta in (histogram or {}).items() if delta}
+    if trending_delta:
+        buckets['trending_score'] = F('trending_score') + trending_delta
+    updated = WatchList.objects.filter(pk=watchlist_id).update(
+        rating_sum=rating_sum,
+        number_ratings=number_ratings,
+        # All the expressions read the old row, so the mean uses the new sum and count
+        avg_rating=mean(rating_sum, number_ratings),
+        bayesian_rating=leaderboards.bayesian(rating_sum, number_ratings),
+        updated=Now(),
+        **buckets,
+    )
+    if platform:
+        platform_id = Subquery(WatchList.objects.filter(pk=watchlist_id).values('platform_id')[:1])
+        apply_platform_delta(platform_id, rating_delta=rating_delta, count_delta=count_delta)
+    return updated
+
+
+def apply_platform_delta(platform_id, titles_delta=0, rating_delta=0, count_delta=0):
+    """
+    Add the deltas to the summary of a StreamPlatform and recompute its avg_rating,
+    in one UPDATE like apply_rating_delta.
+    """
+    if not (titles_delta or rating_delta or count_delta):
+        return 0
+    number_ratings = F('number_ratings') + count_delta
+    rating_sum = F('rating_sum') + rating_delta
+    return StreamPlatform.objects.filter(pk=platform_id).update(
+        active_titles=F('active_titles') + titles_delta,
+        rating_sum=rating_sum,
+        number_ratings=number_ratings,
+        avg_rating=mean(rating_sum, number_ratings),
+        updated=Now(),
+    )
+
+
+def apply_platform_deltas(deltas):
+    """
+    apply_platform_delta for many platforms in one UPDATE, `deltas` maps platform ids
+    to (titles_delta, rating_delta, count_delta).
+    """
+    deltas = [(pk, values) for pk, values in deltas.items() if any(values)]
+    updated = 0
+    for start in range(0, len(deltas), PLATFORM_DELTAS_BATCH):
+        batch = deltas[start:start + PLATFORM_DELTAS_BATCH]
+
+        def delta(index):
+            return Case(*[When(pk=pk, then=Value(values[index])) for pk, values in batch], default=Value(0))
+
+        number_ratings = F('number_ratings') + delta(2)
+        rating_sum = F('rating_sum') + delta(1)
+        updated += StreamPlatform.objects.filter(pk__in=[pk for pk, values in batch]).update(
+            active_titles=F('active_titles') + delta(0),
+            rating_sum=rating_sum,
+            number_ratings=number_ratings,
+            avg_rating=mean(rating_sum, number_ratings),
+            updated=Now(),
+        )
+    return updated
+
+
+def add_rating(watchlist_id, rating, created=None):
+    """
+    Account for a new review, written at `created` (now by default).
+    """
+    trending = leaderboards.count_reviews(watchlist_id, leaderboards.review_day(created), 1)
+    return apply_rating_delta(watchlist_id, rating, 1, histogram={rating: 1}, trending_delta=trending)
+
+
+def change_rating(watchlist_id, old_rating, new_rating):
+    """
+    Account for a review whose rating changed.
+    """
+    if old_rating == new_rating:
+        return 0
+    return apply_rating_delta(watchlist_id, new_rating - old_rating, 0, histogram={old_rating: -1, new_rating: 1})
+
+
+def remove_rating(watchlist_id, rating, created=None):
+    """
+    Account for a deleted review written at `created` (its trending weight is taken back
+    while its day is in the buckets).
+    """
+    trending = leaderboards.count_reviews(watchlist_id, leaderboards.review_day(created), -1) if created else 0.0
+    return apply_rating_delta(watchlist_id, -rating, -1, histogram={rating: -1}, trending_delta=trending)
+
+
+def add_ratings(reviews):
+    """
+    Account for many new reviews (bulk imports) with one UPDATE per movie and one for the platforms.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    histograms = defaultdict(Counter)
+    days = Counter()
+    for review in reviews:
+        totals[review.watchlist_id][0] += review.rating
+        totals[review.watchlist_id][1] += 1
+        histograms[review.watchlist_id][review.rating] += 1
+        days[review.watchlist_id, leaderboards.review_day(review.created)] += 1
+    trending = defaultdict(float)
+    for (watchlist_id, day), count in days.items():
+        trending[watchlist_id] += leaderboards.count_reviews(watchlist_id, day, count)
+    for watchlist_id, (rating_sum, count) in totals.items():
+        apply_rating_delta(watchlist_id, rating_sum, count, platform=False, histogram=histograms[watchlist_id],
+                           trending_delta=trending[watchlist_id])
+
+    platform_totals = defaultdict(lambda: [0, 0, 0])
+    for watchlist_id, platform_id in watchlist_platforms(reviews).items():
+        platform_totals[platform_id][1] += totals[watchlist_id][0]
+        platform_totals[platform_id][2] += totals[watchlist_id][1]
+    apply_platform_deltas(platform_totals)
+    return len(totals)
+
+
+def watchlist_platforms(reviews):
+    """
+    {watchlist_id: platform_id} of the reviews' movies, from the loaded movies when
+    the reviews have them (the import serializer does) and a query for the rest.
+    """
+    platforms = {review.watchlist_id: review.watchlist.platform_id
+                 for review in reviews if Review.watchlist.is_cached(review)}
+    missing = {review.watchlist_id for review in reviews} - set(platforms)
+    if missing:
+        platforms.update(WatchList.objects.filter(pk__in=missing).values_list('pk', 'platform_id'))
+    return platforms
+
+
+def add_title(platform_id, active, rating_sum=0, number_ratings=0):
+    """
+    Account for a title joining a platform (created or moved there) with its ratings.
+    """
+    return apply_platform_delta(platform_id, int(active), rating_sum, number_ratings)
+
+
+def remove_title(platform_id, active, rating_sum=0, number_ratings=0):
+    """
+    Account for a title leaving a platform (deleted or moved away) with its ratings.
+    """
+    return apply_platform_delta(platform_id, -int(active), -rating_sum, -number_ratings)
+
+
+def add_titles(movies):
+    """
+    Account for many new titles (bulk imports) with one UPDATE for all their platforms.
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for movie in movies:
+        totals[movie.platform_id][0] += int(movie.active)
+        totals[movie.platform_id][1] += movie.rating_sum
+        totals[movie.platform_id][2] += movie.number_ratings
+    apply_platform_deltas(totals)
+    return len(totals)
+
+
+def platform_totals(watchlist_model=WatchList):
+    """
+    Subqueries computing the platform counters from the titles. The model is a
+    parameter so migrations can pass their historical WatchList.
+    """
+    titles = watchlist_model.objects.filter(platform=OuterRef('pk')).order_by().values('platform')
+
+    def total(aggregate):
+        return Coalesce(Subquery(titles.annotate(total=aggregate).values('total')), 0)
+
+    return {
+        'active_titles': total(Count('pk', filter=Q(active=True))),
+        'rating_sum': total(Sum('rating_sum')),
+        'number_ratings': total(Sum('number_ratings')),
+    }
+
+
+def platform_counter_mismatches(platforms=None):
+    """
+    Return the platforms (values() dicts) whose counters differ from the tables, with the expected values.
+    """
+    platforms = StreamPlatform.objects.all() if platforms is None else platforms
+    expected = {f'expected_{name}': expression for name, expression in platform_totals().items()}
+    platforms = platforms.annotate(**expected).annotate(
+        expected_avg_rating=mean(F('expected_rating_sum'), F('expected_number_ratings')))
+    return list(
+        platforms.exclude(
+            active_titles=F('expected_active_titles'),
+            rating_sum=F('expected_rating_sum'),
+            number_ratings=F('expected_number_ratings'),
+            avg_rating=F('expected_avg_rating'),
+        ).order_by('pk').values('pk', 'name', 'active_titles', 'rating_sum', 'number_ratings', 'avg_rating', *expected,
+                                'expected_avg_rating')
+    )
+
+
+def rebuild_platform_counters(platforms=None, platform_model=StreamPlatform, watchlist_model=WatchList):
+    """
+    Recompute the counters of `platforms` (a StreamPlatform queryset, all by default) from the titles.
+    """
+    platforms = platform_model.objects.all() if platforms is None else platforms
+    updated = platforms.update(**platform_totals(watchlist_model))
+    # Second UPDATE: in the first one F('rating_sum') would still read the old sum
+    platforms.update(avg_rating=mean(F('rating_sum'), F('number_ratings')))
+    return updated
+
+
+def histogram_totals(review_model=Review):
+    """
+    Subqueries counting the reviews of each rating value of a WatchList, like
+    platform_totals for the histogram columns.
+    """
+    reviews = review_model.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+    return {
+        histogram_field(rating): Coalesce(Subquery(reviews.filter(rating=rating).annotate(total=Count('pk'))
+                                                   .values('total')), 0)
+        for rating in RATING_VALUES
+    }
+
+
+def rebuild_rating_histograms(watchlists=None, watchlist_model=WatchList, review_model=Review):
+    """
+    Recompute the histogram of `watchlists` (a WatchList queryset, all by default) from the reviews.
+    """
+    watchlists = watchlist_model.objects.all() if watchlists is None else watchlists
+    return watchlists.update(**histogram_totals(review_model))
+
+
+def rating_at_rank(histogram, rank):
+    """
+    Rating of the `rank`-th review (from 1) with the reviews sorted by rating.
+    """
+    seen = 0
+    for rating in sorted(histogram):
+        seen += histogram[rating]
+        if seen >= rank:
+            return rating
+    return None
+
+
+def histogram_percentile(histogram, percent):
+    """
+    Nearest-rank percentile of a histogram ({rating: count}): the lowest rating with at
+    least `percent`% of the reviews at or below it. None without reviews.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    return rating_at_rank(histogram, max(1, math.ceil(percent * total / 100)))
+
+
+def histogram_median(histogram):
+    """
+    Median of a histogram, the mean of the two middle ratings for an even number of reviews.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    if total % 2:
+        return rating_at_rank(histogram, total // 2 + 1)
+    return (rating_at_rank(histogram, total // 2) + rating_at_rank(histogram, total // 2 + 1)) / 2
@@ -0,0 +1,283 @@
+"""
+    "Similar titles" from the reviews: item-item cosine similarity over the
+    user x WatchList rating matrix.
+
+    `build_similar_titles` computes the top SIMILAR_TITLES_K neighbours of every
+    reviewed title and writes them to SIMILAR_TITLES_PATH, a flat array file:
+
+        header   magic, k, number of titles, build time (unix seconds)
+        ids      int64[titles]      the titles, sorted
+        similar  int64[titles * k]  their neighbours, best first, 0 padded
+        scores   float32[titles * k]
+
+    (64-bit ids like the BigAutoField primary keys). A file of another format or
+    version is treated as missing until the next build replaces it.
+
+    in the machine's byte order. Workers map it read-only (get_index) and a lookup
+    is a binary search over `ids`, so the file is shared through the page cache
+    instead of being loaded by every process. A rebuild writes a new file and
+    renames it over the old one, the workers notice the new inode on their next
+    lookup.
+
+    With NumPy and SciPy installed the matrix is a scipy.sparse CSR matrix and the
+    similarities of `batch_size` titles come from one sparse product per batch.
+    Without them the same neighbours are computed in Python from per-user lists.
+    Both paths compute the dot products of the integer ratings exactly and divide
+    by the norms in the same order, so they give the same scores.
+
+    Incremental builds only recompute the titles whose neighbour lists may have
+    changed: the titles updated since the last build (ratings.py bumps `updated`
+    on every review write, including the reviews deleted along with their user),
+    the titles sharing a reviewer with them and the titles that listed them as
+    neighbours.
+"""
+
+import bisect
+import heapq
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from watchlist_app.models import Review, WatchList
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Optional, the Python build gives the same neighbours
+    np = sparse = None
+
+
+MAGIC = b'MMSIM\x00\x02\x00'  # Version 2: 64-bit ids
+HEADER = struct.Struct('=8sIId')  # magic, k, titles, built_at, 24 bytes so the ids stay 8-byte aligned
+ID_TYPE, SCORE_TYPE = 'q', 'f'  # int64, float32
+ID_SIZE, SCORE_SIZE = array(ID_TYPE).itemsize, array(SCORE_TYPE).itemsize
+WATERMARK_OVERLAP = timedelta(seconds=60)  # Reviews committed while the last build read the table
+
+
+class SimilarityIndex:
+    """
+    Read-only view over a similar titles file mapped in memory.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.stat = os.fstat(file.fileno())
+        magic, self.k, count, self.built_at = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a similar titles file of this version.')
+        self._view = view = memoryview(self._mmap)
+        offset = HEADER.size
+        self.ids = view[offset:offset + ID_SIZE * count].cast(ID_TYPE)
+        offset += ID_SIZE * count
+        self.similar = view[offset:offset + ID_SIZE * count * self.k].cast(ID_TYPE)
+        offset += ID_SIZE * count * self.k
+        self.scores = view[offset:offset + SCORE_SIZE * count * self.k].cast(SCORE_TYPE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def close(self):
+        for view in (self.ids, self.similar, self.scores, self._view):
+            view.release()
+        self._mmap.close()
+
+    def neighbours(self, watchlist_id, limit=None):
+        """
+        [(watchlist_id, score)] of the most similar titles, best first.
+        """
+        position = bisect.bisect_left(self.ids, watchlist_id)
+        if position == len(self.ids) or self.ids[position] != watchlist_id:
+            return []
+        return self._row(position, limit)
+
+    def rows(self):
+        for position, watchlist_id in enumerate(self.ids):
+            yield watchlist_id, self._row(position)
+
+    def _row(self, position, limit=None):
+        start = position * self.k
+        stop = start + min(limit or self.k, self.k)
+        return [(self.similar[index], self.scores[index]) for index in range(start, stop) if self.similar[index]]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path=None):
+    """
+    Return the SimilarityIndex of `path` (SIMILAR_TITLES_PATH by default), None until it's built.
+    Each process maps the file once and again after a rebuild replaced it.
+    """
+    path = str(path or settings.SIMILAR_TITLES_PATH)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    index = _indexes.get(path)
+    if index is None or (index.stat.st_ino, index.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None or (index.stat.st_ino, index.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+                try:
+                    index = _indexes[path] = SimilarityIndex(path)
+                except ValueError:
+                    return None  # Written by an older version, not available until the next build
+    return index
+
+
+def write_index(path, k, rows, built_at):
+    """
+    Write {watchlist_id: [(neighbour_id, score)]} and replace `path` atomically.
+    """
+    ids = array(ID_TYPE, sorted(rows))
+    similar = array(ID_TYPE)
+    scores = array(SCORE_TYPE)
+    for watchlist_id in ids:
+        neighbours = rows[watchlist_id][:k]
+        similar.extend([neighbour for neighbour, score in neighbours] + [0] * (k - len(neighbours)))
+        scores.extend([score for neighbour, score in neighbours] + [0.0] * (k - len(neighbours)))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(prefix='.similar-', dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, k, len(ids), built_at))
+            ids.tofile(file)
+            similar.tofile(file)
+            scores.tofile(file)
+        os.replace(temporary, path)  # The mapped copies of the old file stay valid
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load_ratings():
+    """
+    The review matrix as three parallel lists: users, titles and ratings.
+    """
+    users, items, ratings = array(ID_TYPE), array(ID_TYPE), array('i')
+    for user_id, watchlist_id, rating in (Review.objects.order_by()
+                                          .values_list('review_user_id', 'watchlist_id', 'rating')
+                                          .iterator(chunk_size=10000)):
+        users.append(user_id)
+        items.append(watchlist_id)
+        ratings.append(rating)
+    return users, items, ratings
+
+
+def compute_neighbours(users, items, ratings, targets, k, batch_size=256):
+    """
+    Return {watchlist_id: [(neighbour_id, score)]} with the top `k` cosine neighbours
+    of the `targets` titles, ties broken by the lower id.
+    """
+    if np is not None:
+        return _sparse_neighbours(users, items, ratings, targets, k, batch_size)
+    return _python_neighbours(users, items, ratings, targets, k)
+
+
+def _sparse_neighbours(users, items, ratings, targets, k, batch_size):
+    item_ids, item_index = np.unique(np.asarray(items, dtype=np.int64), return_inverse=True)
+    user_ids, user_index = np.unique(np.asarray(users, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix((np.asarray(ratings, dtype=np.float64), (user_index, item_index)),
+                               shape=(len(user_ids), len(item_ids)))
+    by_item = matrix.T.tocsr()  # titles x users
+    norms = np.sqrt(np.asarray(by_item.multiply(by_item).sum(axis=1)).ravel())
+
+    neighbours = {}
+    positions = np.searchsorted(item_ids, np.asarray(sorted(targets), dtype=np.int64))
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        dots = (by_item[batch] @ matrix).tocsr()  # batch x titles, exact sums of integer products
+        for row, position in enumerate(batch):
+            columns = dots.indices[dots.indptr[row]:dots.indptr[row + 1]]
+            values = dots.data[dots.indptr[row]:dots.indptr[row + 1]]
+            keep = columns != position
+            columns, values = columns[keep], values[keep]
+            scores = values / (norms[position] * norms[columns])
+            best = np.lexsort((item_ids[columns], -scores))[:k]
+            neighbours[int(item_ids[position])] = list(zip(item_ids[columns[best]].tolist(), scores[best].tolist()))
+    return neighbours
+
+
+def _python_neighbours(users, items, ratings, targets, k):
+    by_item = defaultdict(dict)
+    by_user = defaultdict(list)
+    for user_id, watchlist_id, rating in zip(users, items, ratings):
+        by_item[watchlist_id][user_id] = rating
+        by_user[user_id].append((watchlist_id, rating))
+    norms = {watchlist_id: math.sqrt(sum(rating * rating for rating in column.values()))
+             for watchlist_id, column in by_item.items()}
+
+    neighbours = {}
+    for watchlist_id in sorted(targets):
+        dots = defaultdict(int)
+        for user_id, rating in by_item[watchlist_id].items():
+            for other_id, other_rating in by_user[user_id]:
+                dots[other_id] += rating * other_rating
+        dots.pop(watchlist_id, None)
+        scores = [(dot / (norms[watchlist_id] * norms[other_id]), other_id) for other_id, dot in dots.items()]
+        best = heapq.nsmallest(k, scores, key=lambda item: (-item[0], item[1]))
+        neighbours[watchlist_id] = [(other_id, score) for score, other_id in best]
+    return neighbours
+
+
+def dirty_titles(previous, users, items):
+    """
+    Titles of `previous` (the last SimilarityIndex) whose neighbours may have changed since it was built.
+    """
+    since = datetime.fromtimestamp(previous.built_at, tz=timezone.utc) - WATERMARK_OVERLAP
+    changed = set(WatchList.objects.filter(updated__gt=since).values_list('pk', flat=True))
+    changed |= set(previous.ids) - set(items)  # Deleted, or without reviews now
+
+    reviewers = {user_id for user_id, watchlist_id in zip(users, items) if watchlist_id in changed}
+    dirty = changed | {watchlist_id for user_id, watchlist_id in zip(users, items) if user_id in reviewers}
+    dirty |= {watchlist_id for watchlist_id, neighbours in previous.rows()
+              if any(neighbour in changed for neighbour, score in neighbours)}  # Neighbour through a deleted review
+    return dirty
+
+
+def build_similar_titles(path=None, k=None, full=False, batch_size=256):
+    """
+    Build the similar titles file, incrementally from the previous one unless `full`.
+    Return the number of titles, of recomputed titles and whether it was a full build.
+    """
+    path = str(path or settings.SIMILAR_TITLES_PATH)
+    k = k or settings.SIMILAR_TITLES_K
+    built_at = time.time()  # Reviews written from now on are picked up by the next build
+    users, items, ratings = load_ratings()
+    rated = set(items)
+
+    previous = None
+    if not full and os.path.exists(path):
+        try:
+            previous = SimilarityIndex(path)
+        except ValueError:
+            pass  # File of an older version, rebuild everything
+        else:
+            if previous.k != k:
+                previous.close()  # Windows can't replace a mapped file
+                previous = None  # Rows of another length, rebuild everything
+
+    if previous is None:
+        targets, rows = rated, {}
+    else:
+        dirty = dirty_titles(previous, users, items)
+        targets = rated & dirty
+        rows = {watchlist_id: neighbours for watchlist_id, neighbours in previous.rows()
+                if watchlist_id in rated and watchlist_id not in dirty}
+        previous.close()  # Windows can't replace a mapped file
+    rows.update(compute_neighbours(users, items, ratings, targets, k, batch_size))
+    write_index(path, k, rows, built_at)
+    return {'titles': len(rows), 'recomputed': len(targets), 'full': previous is None}
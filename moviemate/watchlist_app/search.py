@@ -0,0 +1,180 @@
+"""
+    Full-text search over WatchList titles and platform names for ?search=.
+
+    Two backends share the same interface, `search(queryset, terms)` returns the
+    queryset restricted to the matching movies and annotated with `search_rank`
+    (lower is better):
+
+    - FTS5SearchBackend: SQLite FTS5 virtual table kept in sync by triggers
+      (migration 0011), ranked with bm25() and prefix matching on every term.
+    - InvertedIndexSearchBackend: in-process inverted index, used when FTS5 isn't
+      available (other databases or SQLite builds without FTS5).
+
+    Terms are AND-ed and each term matches as a prefix, like a search-as-you-type box.
+"""
+
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from watchlist_app.models import WatchList
+
+
+FTS_TABLE = 'watchlist_app_watchlist_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class BaseSearchBackend:
+    """
+    Interface of the search backends.
+    """
+
+    def is_available(self, using):
+        return True
+
+    def search(self, queryset, terms):
+        raise NotImplementedError('search() must be implemented.')
+
+
+class FTS5SearchBackend(BaseSearchBackend):
+    """
+    Search through the FTS5 table, ranked by bm25() in the database.
+    """
+    _available = {}
+
+    def is_available(self, using):
+        if using not in self._available:
+            connection = connections[using]
+            self._available[using] = (connection.vendor == 'sqlite'
+                                      and FTS_TABLE in connection.introspection.table_names())
+        return self._available[using]
+
+    @staticmethod
+    def build_match(terms):
+        """
+        Turn search terms into an FTS5 query: every token matched as a prefix, the
+        exact phrase is OR-ed in so bm25() scores whole words above prefixes.
+        """
+        tokens = [token for term in terms for token in tokenize(term)]
+        return ' AND '.join(f'("{token}" OR "{token}"*)' for token in tokens)
+
+    def search(self, queryset, terms):
+        match = self.build_match(terms)
+        if not match:
+            return queryset
+        table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+        # A join lets SQLite start from the MATCH and rank every hit once, the ORM has
+        # no other way to join a table without a model
+        return queryset.extra(
+            select={'search_rank': f'{FTS_TABLE}.rank'},  # bm25() unless the table sets another rank function
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        )
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    In-process inverted index (token -> movie ids) with a sorted vocabulary for prefix lookups.
+
+    The index is rebuilt lazily when the 'watchlist' or 'platform' response cache
+    tags change, so every worker notices writes made by the others.
+    """
+    max_results = 1000  # Ranking is materialized as a CASE, keep it bounded
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._vocabulary = []
+        self._size = 0
+
+    def _current_version(self):
+        from watchlist_app.api.caching import get_tag_versions
+        versions = get_tag_versions(['watchlist', 'platform'])
+        return (versions['watchlist'], versions['platform'])
+
+    def build(self):
+        postings = defaultdict(set)
+        rows = WatchList.objects.values_list('pk', 'title', 'platform__name').iterator(chunk_size=2000)
+        size = 0
+        for pk, title, platform_name in rows:
+            size += 1
+            for token in set(tokenize(title) + tokenize(platform_name)):
+                postings[token].add(pk)
+        return dict(postings), sorted(postings), size
+
+    def ensure_fresh(self):
+        version = self._current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._postings, self._vocabulary, self._size = self.build()
+                    self._version = version
+
+    def ranked_ids(self, terms):
+        """
+        Return the ids matching every token (as a prefix), best match first.
+        """
+        self.ensure_fresh()
+        scores = None
+        for token in [token for term in terms for token in tokenize(term)]:
+            token_scores = defaultdict(float)
+            start = bisect.bisect_left(self._vocabulary, token)
+            for word in self._vocabulary[start:]:
+                if not word.startswith(token):
+                    break
+                ids = self._postings[word]
+                idf = math.log(1 + self._size / len(ids))
+                weight = idf if word == token else idf / 2  # Whole words rank above prefixes
+                for pk in ids:
+                    token_scores[pk] += weight
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+        if not scores:
+            return []
+        return sorted(scores, key=lambda pk: (-scores[pk], pk))[:self.max_results]
+
+    def search(self, queryset, terms):
+        if not any(tokenize(term) for term in terms):
+            return queryset
+        ids = self.ranked_ids(terms)
+        if not ids:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        # One raw CASE instead of a When() per id, building hundreds of expressions costs more than the query
+        table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+        whens = ' '.join(['WHEN %s THEN %s'] * len(ids))
+        params = [value for position, pk in enumerate(ids) for value in (pk, position)]
+        rank = RawSQL(f'CASE {table}.id {whens} END', params, output_field=FloatField())
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank)
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    """
+    Return the configured backend (settings.WATCHLIST_SEARCH_BACKEND), or the
+    in-process index when it isn't available on this database.
+    """
+    path = getattr(settings, 'WATCHLIST_SEARCH_BACKEND', 'watchlist_app.search.FTS5SearchBackend')
+    for candidate in (path, 'watchlist_app.search.InvertedIndexSearchBackend'):
+        if candidate not in _backends:
+            _backends[candidate] = import_string(candidate)()
+        if _backends[candidate].is_available(using):
+            return _backends[candidate]
+    return _backends[candidate]
@@ -0,0 +1,166 @@
+"""
+    Signal receivers that keep the cached API responses fresh.
+    Each write only invalidates the tags of the rows it touched (see watchlist_app.api.caching).
+
+    The WatchList receivers also keep the platform counters (watchlist_app.ratings)
+    in step with titles created, moved, (de)activated or deleted, and the Review
+    receivers keep the rating aggregates of the movies in step with every review
+    written through the ORM (views, admin, shell, cascades from a deleted user).
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from watchlist_app import ratings
+from watchlist_app.api.caching import fragment_cache, invalidate
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+
+@receiver(pre_save, sender=WatchList)
+def remember_previous_platform(sender, instance, **kwargs):
+    # A movie moved to another platform also changes the old platform's responses and counters
+    instance._previous_platform_id = instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (WatchList.objects.filter(pk=instance.pk)
+                                    .values_list('platform_id', 'active', 'rating_sum', 'number_ratings').first())
+        if instance._previous_state:
+            instance._previous_platform_id = instance._previous_state[0]
+
+
+@receiver(post_save, sender=WatchList)
+def count_title(sender, instance, created, update_fields=None, **kwargs):
+    # The row went from the state read in pre_save to the instance's platform and active flag,
+    # an update leaves the stored ratings as they were (WatchList.save skips the maintained columns)
+    previous = getattr(instance, '_previous_state', None)
+    current = (instance.platform_id, instance.active, instance.rating_sum, instance.number_ratings)
+    if previous is not None and not created and 'rating_sum' not in (update_fields or ()):
+        current = (*current[:2], *previous[2:])
+    if previous != current:
+        if previous is not None:
+            ratings.remove_title(*previous)
+        ratings.add_title(*current)
+
+
+def deleted_with(origin, *models):
+    # origin is the instance or queryset whose delete() was called
+    return isinstance(origin, models) or getattr(origin, 'model', None) in models
+
+
+def deleted_with_platform(origin):
+    return deleted_with(origin, StreamPlatform)
+
+
+@receiver(pre_delete, sender=WatchList)
+def remember_deleted_ratings(sender, instance, origin=None, **kwargs):
+    # The instance may predate the latest reviews, the counters need the stored ratings
+    if not deleted_with_platform(origin):
+        instance._previous_state = (WatchList.objects.filter(pk=instance.pk)
+                                    .values_list('platform_id', 'active', 'rating_sum', 'number_ratings').first())
+
+
+@receiver(post_delete, sender=WatchList)
+def uncount_title(sender, instance, origin=None, **kwargs):
+    if deleted_with_platform(origin):
+        return  # Deleted with its platform, there are no counters left to update
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None:
+        ratings.remove_title(*previous)
+
+
+def stored_review(review):
+    return Review.objects.filter(pk=review.pk).values_list('watchlist_id', 'rating', 'created').first()
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_review(sender, instance, **kwargs):
+    # The deltas are taken from the stored row, the instance may be stale.
+    # The views set _stored_review from their locked read, saving this query
+    if not instance._state.adding and not hasattr(instance, '_stored_review'):
+        instance._stored_review = stored_review(instance)
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, update_fields=None, **kwargs):
+    previous = instance.__dict__.pop('_stored_review', None)
+    current = (instance.watchlist_id, instance.rating, instance.created)
+    if created or previous is None:
+        ratings.add_rating(*current)
+        return
+    if update_fields is not None:  # Only these columns were written
+        current = tuple(value if name in update_fields else stored
+                        for name, value, stored in zip(('watchlist', 'rating', 'created'), current, previous))
+    if (current[0], current[2]) != (previous[0], previous[2]):  # Another movie or day bucket
+        ratings.remove_rating(*previous)
+        ratings.add_rating(*current)
+    else:
+        ratings.change_rating(current[0], previous[1], current[1])
+
+
+@receiver(pre_delete, sender=Review)
+def remember_deleted_review(sender, instance, origin=None, **kwargs):
+    if deleted_with(origin, WatchList, StreamPlatform):
+        return  # The movie goes too, uncount_title takes its ratings off the platform
+    if origin is instance and not hasattr(instance, '_stored_review'):
+        instance._stored_review = stored_review(instance)  # A cascade or queryset delete has just loaded the rows
+    elif origin is not instance:
+        instance._stored_review = (instance.watchlist_id, instance.rating, instance.created)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    previous = instance.__dict__.pop('_stored_review', None)
+    if previous is not None:
+        ratings.remove_rating(*previous)
+
+
+@receiver(post_save, sender=WatchList)
+@receiver(post_delete, sender=WatchList)
+def invalidate_watchlist(sender, instance, **kwargs):
+    tags = {'watchlist', f'watchlist:{instance.pk}', f'reviews:{instance.pk}', 'platform', f'platform:{instance.platform_id}'}
+    previous_platform_id = getattr(instance, '_previous_platform_id', None)
+    if previous_platform_id:
+        tags.add(f'platform:{previous_platform_id}')
+    invalidate(*tags)
+
+
+@receiver(post_save, sender=StreamPlatform)
+@receiver(post_delete, sender=StreamPlatform)
+def invalidate_platform(sender, instance, **kwargs):
+    # Movies show the platform name, so their detail responses change too
+    movie_ids = WatchList.objects.filter(platform_id=instance.pk).values_list('pk', flat=True)
+    invalidate('platform', f'platform:{instance.pk}', 'watchlist', *[f'watchlist:{pk}' for pk in movie_ids])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, **kwargs):
+    # The review changes the movie's rating, shown in the movie and platform responses
+    platform_id = WatchList.objects.filter(pk=instance.watchlist_id).values_list('platform_id', flat=True).first()
+    tags = {f'reviews:{instance.watchlist_id}', f'watchlist:{instance.watchlist_id}', 'watchlist', 'platform'}
+    if platform_id:
+        tags.add(f'platform:{platform_id}')
+    invalidate(*tags)
+
+
+@receiver(post_save, sender=WatchList)
+@receiver(post_delete, sender=WatchList)
+@receiver(post_save, sender=StreamPlatform)
+@receiver(post_delete, sender=StreamPlatform)
+def evict_fragments(sender, instance, **kwargs):
+    # Stale entries are never used (they are checked against the row), this frees them now
+    fragment_cache.evict(sender._meta.label, instance.pk)
+
+
+# bulk_create sends no signals, the bulk endpoints invalidate with these
+
+def invalidate_watchlists(movies):
+    platform_ids = {movie.platform_id for movie in movies}
+    invalidate('watchlist', 'platform', *[f'platform:{pk}' for pk in platform_ids],
+               *[f'watchlist:{movie.pk}' for movie in movies])
+
+
+def invalidate_reviews(watchlist_ids, platform_ids=None):
+    if platform_ids is None:
+        platform_ids = set(WatchList.objects.filter(pk__in=watchlist_ids).values_list('platform_id', flat=True))
+    invalidate('watchlist', 'platform', *[f'platform:{pk}' for pk in platform_ids],
+               *[tag for pk in watchlist_ids for tag in (f'watchlist:{pk}', f'reviews:{pk}')])
@@ -1,11 +1,64 @@
+import base64
+import json
+import math
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
+from rest_framework.request import Request
+
+from watchlist_app import leaderboards, ratings, recommendations
+from watchlist_app.models import WatchList, StreamPlatform, Review, ReviewDay, ThrottleBucket
+from watchlist_app.api import renderers, serializers
+from watchlist_app.api.caching import check_shared_cache, fragment_cache
+from watchlist_app.api.throttling import take_token
+from moviemate.metrics import registry
+from moviemate.middleware import RequestMetricsMiddleware
+from moviemate.routers import ReadReplicaRouter, ReplicaPinMiddleware
+from watchlist_app.search import FTS5SearchBackend, InvertedIndexSearchBackend, get_search_backend
+
+class QueryCountMixin:
+    """
+    Helper to check that an endpoint runs the same number of queries no matter how many rows it returns.
+    """
+
+    def assertConstantQueries(self, url, add_rows):
+        """
+        Request `url`, call `add_rows()` to grow the data set and request it again.
+        Both requests must run the same number of queries.
+        """
+        with CaptureQueriesContext(connection) as before:
+            first = self.client.get(url, format='json')
+        add_rows()
+        with CaptureQueriesContext(connection) as after:
+            second = self.client.get(url, format='json')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(first.content, second.content)  # The new rows must be part of the response
+        self.assertEqual(
+            len(before), len(after),
+            'Query count grew with the number of rows:\n' + '\n'.join(q['sql'] for q in after.captured_queries)
+        )
 
-from watchlist_app.models import WatchList, StreamPlatform, Review
-from watchlist_app.api import serializers
 
 # Create your tests here.
 class WatchListTests(APITestCase):
@@ -40,7 +93,7 @@ class WatchListTests(APITestCase):
     def test_watchlist_list(self):
         response = self.client.get(reverse('watchlist-list'), format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        self.assertIsInstance(response.data['results'], list)  # Keyset paginated: next, previous, results
         
     def test_watchlist_detail(self):
         response = self.client.get(reverse('watchlist-detail', args=[self.watchlist.id]), format='json')
@@ -81,7 +134,7 @@ class StreamPlatformTests(APITestCase):
     def test_streamplatform_list(self):
         response = self.client.get(reverse('streamplatform-list'), format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list) # Se verifica que el response sea una lista
+        self.assertIsInstance(response.data['results'], list) # Se verifica que el response sea una lista paginada
         
     def test_streamplatform_detail(self):
         # Para enviar argumentos a la url, se usa el reverse con el nombre de la vista y los argumentos necesarios en args
@@ -91,10 +144,28 @@ class StreamPlatformTests(APITestCase):
         self.assertEqual(response.data['name'], self.platform.name)
         self.assertEqual(response.data['about'], self.platform.about)
         self.assertEqual(response.data['website'], self.platform.website)
+        self.assertNotIn('watchlist', response.data)  # Nested titles are opt-in with ?expand=watchlist
+        self.assertEqual(response.data['watchlist_count'], 0)
+
+    def test_streamplatform_expand_watchlist(self):
+        for number in range(7):
+            WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform, avg_rating=number)
+
+        response = self.client.get(reverse('streamplatform-list'), {'expand': 'watchlist'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        platform = response.data['results'][0]
+        self.assertEqual(platform['watchlist_count'], 7)
+        self.assertEqual(len(platform['watchlist']), 5)  # Capped to the default limit
+        self.assertEqual(platform['watchlist'][0]['title'], 'Movie 6')  # Top rated first
+
+        response = self.client.get(reverse('streamplatform-detail', args=[self.platform.id]),
+                                   {'expand': 'watchlist', 'watchlist_limit': 2}, format='json')
+        self.assertEqual([movie['title'] for movie in response.data['watchlist']], ['Movie 6', 'Movie 5'])
 
 
 class ReviewTests(APITestCase):
     def setUp(self):
+        cache.clear()  # Cached responses live in the cache, don't carry them over from other tests
         # Se crea un usuario para poder autenticar las peticiones
         self.user = User.objects.create_user(username='testuser', password='testpassword')
         self.jwt_token = self.client.post(reverse('token_obtain_pair'), {
@@ -124,7 +195,7 @@ class ReviewTests(APITestCase):
     def test_review_list(self):
         response = self.client.get(reverse('review-list', args=[self.watchlist.id]), format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        self.assertIsInstance(response.data['results'], list)
         
     def test_review_detail(self):
         response = self.client.get(reverse('review-detail', args=[self.review.id]), format='json')
@@ -136,4 +207,1227 @@ class ReviewTests(APITestCase):
     def test_user_review_detail(self):
         # response = self.client.get(reverse('user-review-detail'), {'username': self.user.username}, format='json')
         response = self.client.get(f'/watchlist/reviews/?username={self.user.username}', format='json') #No se puede usar reverse ya que usamos query parameters
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RatingAggregationTests(APITestCase):
+    """
+    avg_rating, number_ratings and rating_sum follow review create, update and delete.
+    """
+
+    def setUp(self):
+        cache.clear()  # Cached responses live in the cache
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.watchlist = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        self.users = [User.objects.create_user(username=f'reviewer{number}', password='testpassword') for number in range(3)]
+
+    def post_review(self, user, rating):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('review-create', args=[self.watchlist.id]),
+                                    {'rating': rating, 'description': 'Review'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def assertRating(self, avg_rating, number_ratings, rating_sum):
+        self.watchlist.refresh_from_db()
+        self.assertAlmostEqual(self.watchlist.avg_rating, avg_rating)
+        self.assertEqual(self.watchlist.number_ratings, number_ratings)
+        self.assertEqual(self.watchlist.rating_sum, rating_sum)
+
+    def test_running_mean_on_create(self):
+        for user, rating in zip(self.users, [5, 4, 1]):
+            self.post_review(user, rating)
+        self.assertRating(10 / 3, 3, 10)
+
+    def test_update_and_delete_adjust_the_mean(self):
+        first = self.post_review(self.users[0], 5)
+        self.post_review(self.users[1], 3)
+
+        self.client.force_authenticate(self.users[0])
+        response = self.client.put(reverse('review-detail', args=[first]), {'rating': 1, 'description': 'Changed my mind'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRating(2.0, 2, 4)
+
+        response = self.client.delete(reverse('review-detail', args=[first]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertRating(3.0, 1, 3)
+
+    def test_ratings_are_read_only(self):
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', password='testpassword'))
+        response = self.client.put(reverse('watchlist-detail', args=[self.watchlist.id]), {
+            'title': 'Inception', 'storyline': 'Dreams', 'platform': self.platform.id,
+            'avg_rating': 5, 'number_ratings': 100,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRating(0.0, 0, 0)
+
+    def test_stale_instance_keeps_the_aggregates(self):
+        stale = WatchList.objects.get(pk=self.watchlist.pk)  # Read before the review lands
+        self.post_review(self.users[0], 4)
+
+        stale.title = 'Inception (2010)'
+        stale.save()
+        self.assertRating(4.0, 1, 4)
+        self.assertEqual(self.watchlist.title, 'Inception (2010)')
+        self.assertEqual(self.watchlist.ratings_4, 1)
+        self.assertAlmostEqual(self.watchlist.bayesian_rating, (settings.LEADERBOARD_PRIOR_WEIGHT * settings.LEADERBOARD_PRIOR_MEAN + 4)
+                               / (settings.LEADERBOARD_PRIOR_WEIGHT + 1))
+        self.assertGreater(self.watchlist.trending_score, 0)
+        self.assertEqual(ratings.platform_counter_mismatches(), [])
+
+    def test_orm_writes_and_cascades(self):
+        # Admin, shell or cascades: no view involved
+        other = WatchList.objects.create(title='Memento', storyline='Backwards', platform=self.platform)
+        review = Review.objects.create(review_user=self.users[0], watchlist=self.watchlist, rating=5)
+        Review.objects.create(review_user=self.users[1], watchlist=self.watchlist, rating=3)
+        self.assertRating(4.0, 2, 8)
+
+        stale = Review.objects.get(pk=review.pk)
+        review.rating = 1
+        review.save()
+        self.assertRating(2.0, 2, 4)
+        stale.description = 'Only the text'
+        stale.save(update_fields=['description'])  # The stored rating stays
+        self.assertRating(2.0, 2, 4)
+        self.assertEqual((self.watchlist.ratings_1, self.watchlist.ratings_5), (1, 0))
+
+        review.watchlist = other
+        review.save()
+        self.assertRating(3.0, 1, 3)
+        other.refresh_from_db()
+        self.assertEqual((other.number_ratings, other.rating_sum), (1, 1))
+
+        self.users[1].delete()  # Cascades to their review
+        self.assertRating(0.0, 0, 0)
+        self.assertEqual(self.watchlist.ratings_3, 0)
+        other.delete()  # With its reviews, the platform loses the title's ratings once
+        self.assertEqual(ratings.platform_counter_mismatches(), [])
+
+    def test_histogram_follows_the_reviews(self):
+        first = self.post_review(self.users[0], 5)
+        self.post_review(self.users[1], 5)
+        self.post_review(self.users[2], 2)
+
+        self.client.force_authenticate(self.users[0])
+        self.client.put(reverse('review-detail', args=[first]), {'rating': 4, 'description': 'Less'}, format='json')
+        url = reverse('review-histogram', args=[self.watchlist.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['histogram'], {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1})
+        self.assertEqual(response.data['number_ratings'], 3)
+        self.assertAlmostEqual(response.data['avg_rating'], 11 / 3)
+        self.assertEqual(response.data['median'], 4)
+        self.assertEqual(response.data['percentiles'], {'25': 2, '50': 4, '75': 5, '90': 5})
+
+        self.client.delete(reverse('review-detail', args=[first]))
+        response = self.client.get(url, {'percentiles': '10,99.5'})
+        self.assertEqual(response.data['histogram'], {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1})
+        self.assertEqual(response.data['median'], 3.5)  # Mean of the two middle ratings
+        self.assertEqual(response.data['percentiles'], {'10': 2, '99.5': 5})
+
+        self.assertEqual(self.client.get(url, {'percentiles': '0,50'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('review-histogram', args=[999])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ratings_5', self.client.get(reverse('watchlist-detail', args=[self.watchlist.id])).data)
+
+    def test_rebuild_matches_the_maintained_histogram(self):
+        for user, rating in zip(self.users, [1, 3, 3]):
+            self.post_review(user, rating)
+        maintained = WatchList.objects.values_list(*WatchList.histogram_fields).get(pk=self.watchlist.pk)
+        self.assertEqual(maintained, (1, 0, 2, 0, 0))
+
+        WatchList.objects.update(ratings_1=0, ratings_3=0)
+        ratings.rebuild_rating_histograms()
+        self.assertEqual(WatchList.objects.values_list(*WatchList.histogram_fields).get(pk=self.watchlist.pk), maintained)
+        self.assertIsNone(ratings.histogram_median({1: 0, 5: 0}))
+
+
+class ReviewIndexTests(APITestCase):
+    """
+    EXPLAIN the queries that the review endpoints send to the database, none of them may scan the review table.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.watchlist = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        Review.objects.create(review_user=self.user, rating=5, description='Great movie!', watchlist=self.watchlist)
+
+    def assertReviewQueriesUseIndex(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        review_queries = [query['sql'] for query in queries if 'FROM "watchlist_app_review"' in query['sql']]
+        self.assertTrue(review_queries)
+        with connection.cursor() as cursor:
+            for sql in review_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+                self.assertNotIn('SCAN watchlist_app_review', plan)
+                self.assertRegex(plan, r'SEARCH watchlist_app_review USING (COVERING )?INDEX')
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_review_list_uses_index(self):
+        url = reverse('review-list', args=[self.watchlist.id])
+        self.assertReviewQueriesUseIndex(url)
+        self.assertReviewQueriesUseIndex(url + '?rating=5&active=true')
+        self.assertReviewQueriesUseIndex(url + '?review_user__username=testuser')
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_user_review_list_uses_index(self):
+        self.assertReviewQueriesUseIndex(reverse('user-review-detail') + '?username=testuser')
+
+    def test_duplicate_review_is_rejected_by_the_constraint(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('review-create', args=[self.watchlist.id]),
+                                        {'rating': 4, 'description': 'Again'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # No SELECT ... exists() before the INSERT
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT') and 'watchlist_app_review' in query['sql']])
+        self.assertEqual(Review.objects.filter(watchlist=self.watchlist).count(), 1)
+
+
+class ThrottleTests(APITestCase):
+    """
+    Token bucket throttles shared through the database.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.watchlist = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        self.review = Review.objects.create(review_user=self.user, rating=5, description='Great movie!', watchlist=self.watchlist)
+
+    def test_bucket_refills_at_the_rate(self):
+        # 3 requests per minute: a burst of 3, then one more every 20 seconds
+        with self.assertNumQueries(1):
+            self.assertEqual(take_token('key', 3, 3 / 60, now=1000), (True, 2))
+        self.assertTrue(take_token('key', 3, 3 / 60, now=1000)[0])
+        self.assertTrue(take_token('key', 3, 3 / 60, now=1000)[0])
+        self.assertFalse(take_token('key', 3, 3 / 60, now=1010)[0])
+        self.assertTrue(take_token('key', 3, 3 / 60, now=1021)[0])
+        self.assertFalse(take_token('key', 3, 3 / 60, now=1022)[0])
+        # Never more than the capacity after a long idle time
+        for allowed in (True, True, True, False):
+            self.assertEqual(take_token('key', 3, 3 / 60, now=5000)[0], allowed)
+        self.assertEqual(ThrottleBucket.objects.count(), 1)  # Constant state per key
+
+    def test_scoped_throttle(self):
+        url = reverse('review-detail', args=[self.review.id])
+        for _ in range(3):  # 'review-detail': '3/day'
+            self.assertEqual(self.client.get(url, format='json').status_code, status.HTTP_200_OK)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_review_create_throttle(self):
+        other = WatchList.objects.create(title='Memento', storyline='Backwards', platform=self.platform)
+        self.client.force_authenticate(User.objects.create_user(username='reviewer', password='testpassword'))
+        response = self.client.post(reverse('review-create', args=[self.watchlist.id]), {'rating': 4, 'description': 'Good'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('review-create', args=[other.id]), {'rating': 4, 'description': 'Good'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)  # 'review-create': '1/day'
+
+
+class BulkImportTests(APITestCase):
+    """
+    Bulk catalog and review imports: per-row errors, one query per batch for lookups and ratings per movie.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username='admin', is_staff=True)  # force_authenticate, no password hashing
+        self.users = [User.objects.create(username=f'user{number}') for number in range(4)]
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movie = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        self.other = WatchList.objects.create(title='Memento', storyline='Backwards', platform=self.platform)
+        Review.objects.create(review_user=self.users[0], rating=1, description='Meh', watchlist=self.movie)
+        self.client.force_authenticate(self.admin)
+
+    def movies(self, count):
+        return [{'title': f'Movie {number}', 'storyline': 'Storyline', 'platform': self.platform.id} for number in range(count)]
+
+    def test_watchlist_bulk_create(self):
+        rows = self.movies(3) + [
+            {'title': 'Up', 'storyline': 'Balloons', 'platform': self.platform.id},  # Title too short
+            {'title': 'Missing platform', 'storyline': 'Storyline', 'platform': 999},
+        ]
+        response = self.client.post(reverse('watchlist-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 4])
+        self.assertIn('platform', response.data['errors'][1]['errors'])
+        self.assertEqual(set(WatchList.objects.filter(pk__in=response.data['ids']).values_list('title', flat=True)),
+                         {'Movie 0', 'Movie 1', 'Movie 2'})
+
+    def test_watchlist_bulk_queries_dont_grow(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse('watchlist-bulk'), self.movies(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(reverse('watchlist-bulk'), self.movies(20), format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_watchlist_bulk_platforms_in_one_update(self):
+        platforms = [StreamPlatform.objects.create(name=f'Platform {number}', about='About', website='https://example.com')
+                     for number in range(3)]
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(reverse('watchlist-bulk'), self.movies(3), format='json')
+        rows = [dict(movie, platform=platform.id) for movie, platform in zip(self.movies(3), platforms)]
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(reverse('watchlist-bulk'), rows, format='json')
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(ratings.platform_counter_mismatches(), [])
+
+    def test_review_ndjson_import(self):
+        lines = [
+            {'watchlist': self.movie.id, 'review_user': 'user1', 'rating': 5},
+            {'watchlist': self.movie.id, 'review_user': 'user2', 'rating': 3},
+            {'watchlist': self.other.id, 'review_user': 'user1', 'rating': 4},
+            {'watchlist': self.movie.id, 'review_user': 'user0', 'rating': 5},  # Already reviewed
+            {'watchlist': self.movie.id, 'review_user': 'user2', 'rating': 2},  # Twice in the batch
+            {'watchlist': self.movie.id, 'review_user': 'nobody', 'rating': 2},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n'
+        response = self.client.post(reverse('review-bulk'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 4, 5, 6])
+
+        self.movie.refresh_from_db()  # With the review from setUp
+        self.assertEqual((self.movie.number_ratings, self.movie.rating_sum, self.movie.avg_rating), (3, 9, 3.0))
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.number_ratings, self.other.avg_rating), (1, 4.0))
+
+    def test_review_import_keeps_the_date(self):
+        rows = [
+            {'watchlist': self.other.id, 'review_user': 'user1', 'rating': 5, 'created': '2015-01-01T00:00:00Z'},
+            {'watchlist': self.other.id, 'review_user': 'user2', 'rating': 3,
+             'created': (timezone.now() + timedelta(days=1)).isoformat()},  # In the future
+        ]
+        response = self.client.post(reverse('review-bulk'), rows, format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        review = Review.objects.get(pk=response.data['ids'][0])
+        self.assertEqual(review.created.isoformat(), '2015-01-01T00:00:00+00:00')
+
+        # Counted in the rating, too old for the trending buckets
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.number_ratings, self.other.trending_score), (1, 0.0))
+        self.assertFalse(ReviewDay.objects.filter(watchlist=self.other).exists())
+
+    def test_all_rows_invalid(self):
+        response = self.client.post(reverse('review-bulk'), [{'rating': 9}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+
+    def test_bulk_requires_admin(self):
+        self.client.force_authenticate(self.users[1])
+        response = self.client.post(reverse('watchlist-bulk'), self.movies(1), format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ExportTests(APITestCase):
+    """
+    Streaming NDJSON/CSV exports with incremental watermarks.
+    """
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movie = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        for number in range(3):
+            user = User.objects.create(username=f'user{number}')
+            Review.objects.create(review_user=user, rating=number + 1, description='Review', watchlist=self.movie)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_in_one_query(self):
+        with self.assertNumQueries(1):  # The usernames come with the same JOIN
+            response, body = self.export('review-export')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['review_user__username'] for row in rows], ['user0', 'user1', 'user2'])
+        self.assertEqual(rows[0]['watchlist_id'], self.movie.id)
+
+    def test_csv_export(self):
+        response, body = self.export('watchlist-export', output='csv')
+        lines = body.splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(lines[0].startswith('id,title,storyline,platform_id,platform__name'))
+        self.assertIn('Inception', lines[1])
+        self.assertEqual(len(lines), 2)
+
+    def test_export_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.export('review-export', fields='rating,id')
+        self.assertEqual(json.loads(body.splitlines()[0]), {'id': Review.objects.get(rating=1).id, 'rating': 1})
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertEqual(self.client.get(reverse('review-export'), {'fields': 'email'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incremental_export(self):
+        response, _ = self.export('review-export')
+        watermark = response['X-Export-Watermark']
+
+        review = Review.objects.get(rating=2)
+        review.description = 'Edited'
+        review.save()
+        _, body = self.export('review-export', since=watermark)
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [review.id])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('review-export'), {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('review-export'), {'output': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(User.objects.create(username='analyst'))
+        self.assertEqual(self.client.get(reverse('review-export')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AsyncViewTests(APITestCase):
+    """
+    The async read endpoints return the same JSON as their sync counterparts.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='testuser')
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        for number in range(6):
+            movie = WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform)
+        self.movie = movie
+        Review.objects.create(review_user=self.user, rating=5, description='Great movie!', watchlist=self.movie)
+
+    def assertSameResponse(self, sync_url, async_url):
+        sync_response = self.client.get(sync_url)
+        async_response = self.client.get(async_url)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Same body, the pagination links point to the async endpoint
+        self.assertEqual(async_response.content.replace(b'/watchlist/async/', b'/watchlist/'), sync_response.content)
+        return async_response
+
+    def test_same_responses(self):
+        pk = self.movie.id
+        self.assertSameResponse(reverse('watchlist-list') + '?page_size=2&ordering=-avg_rating',
+                                reverse('async-watchlist-list') + '?page_size=2&ordering=-avg_rating')
+        self.assertSameResponse(reverse('watchlist-detail', args=[pk]), reverse('async-watchlist-detail', args=[pk]))
+        self.assertSameResponse(reverse('watchlist-detail', args=[999]), reverse('async-watchlist-detail', args=[999]))
+        self.assertSameResponse(reverse('review-list', args=[pk]) + '?rating=5', reverse('async-review-list', args=[pk]) + '?rating=5')
+        self.assertSameResponse(reverse('streamplatform-list') + '?expand=watchlist',
+                                reverse('async-streamplatform-list') + '?expand=watchlist')
+        self.assertSameResponse(reverse('streamplatform-detail', args=[self.platform.id]),
+                                reverse('async-streamplatform-detail', args=[self.platform.id]))
+        self.assertSameResponse(reverse('streamplatform-detail', args=[999]), reverse('async-streamplatform-detail', args=[999]))
+
+    def test_cursor_links(self):
+        response = self.client.get(reverse('async-watchlist-list') + '?page_size=4').json()
+        second = self.client.get(response['next']).json()
+        self.assertEqual(len(response['results']) + len(second['results']), 6)
+        self.assertIsNone(second['next'])
+
+    async def test_served_by_the_event_loop(self):
+        url = reverse('async-watchlist-detail', args=[self.movie.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Movie 5')
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class PaginationTests(APITestCase):
+    """
+    Keyset cursors walk every row exactly once, also when `created` ties.
+    """
+
+    def setUp(self):
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        for number in range(10):
+            WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform)
+        # Same timestamp for half of the rows, the id breaks the tie
+        WatchList.objects.filter(title__in=[f'Movie {number}' for number in range(5)]).update(created=self.platform.created)
+
+    def collect(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(movie['id'] for movie in response.data['results'])
+            last = response
+            url = response.data[link]
+        return ids, last
+
+    def test_cursor_walks_forward_and_back(self):
+        expected = list(WatchList.objects.order_by('-created', '-id').values_list('id', flat=True))
+
+        ids, last_page = self.collect(reverse('watchlist-list') + '?page_size=3', 'next')
+        self.assertEqual(ids, expected)
+
+        # Walking back from the last page visits the same rows page by page
+        previous_ids, _ = self.collect(last_page.data['previous'], 'previous')
+        self.assertEqual(sorted(previous_ids), sorted(expected[:-len(last_page.data['results'])]))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('watchlist-list'), {'cursor': 'not-a-cursor'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Decodable cursors with a position that doesn't fit the ordering
+        movie = WatchList.objects.first()
+        for position in ([], ['abc', 1], [{'a': 1}, 1], [None, 1], [movie.created.isoformat()]):
+            cursor = base64.b64encode(json.dumps({'p': position, 'o': ['-created', '-id']}).encode()).decode()
+            for url in (reverse('watchlist-list'), reverse('review-list', args=[movie.pk])):
+                response = self.client.get(url, {'cursor': cursor}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, (url, position))
+
+        # Numbers out of the range of the id column, 1e400 is parsed as inf
+        for payload in ('{"p":["2020-01-01T00:00:00",1e400],"o":["-created","-id"]}',
+                        '{"p":["2020-01-01T00:00:00",%d],"o":["-created","-id"]}' % 2 ** 70):
+            cursor = base64.b64encode(payload.encode()).decode()
+            response = self.client.get(reverse('watchlist-list'), {'cursor': cursor}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, payload)
+
+    def test_page_number_without_count(self):
+        response = self.client.get(reverse('watchlist-filter'), {'count': 'false', 'page_size': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['count'])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(reverse('watchlist-filter'), {'count': 'false', 'page_size': 4, 'page': 3}, format='json')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(reverse('watchlist-filter'), format='json')
+        self.assertEqual(response.data['count'], 10)
+
+
+class OrderingTests(APITestCase):
+    """
+    ?ordering= on the watchlist views, with an id tiebreak and keyset cursors on the chosen ordering.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        for number, rating in enumerate([4.5, 3.0, 4.5, 0, 5.0, 3.0, 0, 4.5]):
+            WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform,
+                                     avg_rating=rating, number_ratings=number)
+        self.top_rated = list(WatchList.objects.order_by('-avg_rating', '-id').values_list('id', flat=True))
+
+    def test_filter_view_ordering(self):
+        response = self.client.get(reverse('watchlist-filter'), {'ordering': '-avg_rating', 'page_size': 20}, format='json')
+        self.assertEqual([movie['id'] for movie in response.data['results']], self.top_rated)
+
+        response = self.client.get(reverse('watchlist-filter'), {'ordering': 'avg_rating', 'page_size': 20}, format='json')
+        self.assertEqual([movie['id'] for movie in response.data['results']], self.top_rated[::-1])
+
+        # Fields without an index are ignored
+        response = self.client.get(reverse('watchlist-filter'), {'ordering': 'storyline', 'page_size': 20}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cursor_follows_ordering(self):
+        ids = []
+        url = reverse('watchlist-list') + '?ordering=-avg_rating&page_size=3'
+        while url:
+            response = self.client.get(url, format='json')
+            ids.extend(movie['id'] for movie in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, self.top_rated)
+
+        # A cursor can't be reused with another ordering
+        first_page = self.client.get(reverse('watchlist-list') + '?ordering=-avg_rating&page_size=3', format='json')
+        response = self.client.get(first_page.data['next'].replace('ordering=-avg_rating', 'ordering=-number_ratings'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_orderings_use_index(self):
+        for ordering in ('-avg_rating', 'avg_rating', '-number_ratings', 'created'):
+            first_page = self.client.get(reverse('watchlist-list'), {'ordering': ordering, 'page_size': 3}, format='json')
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(first_page.data['next'], format='json')
+            sql = [query['sql'] for query in queries if 'FROM "watchlist_app_watchlist"' in query['sql']][0]
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertRegex(plan, r'SEARCH watchlist_app_watchlist USING INDEX watchlist_\w+_idx', ordering)
+            self.assertNotIn('TEMP B-TREE', plan, ordering)
+
+
+class ResponseCacheTests(APITestCase):
+    """
+    Cached catalog responses, tag invalidation and conditional requests.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movie = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        self.other = WatchList.objects.create(title='Memento', storyline='Backwards', platform=self.platform)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['watchlist_app.E001'])  # LocMemCache
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                   'LOCATION': 'redis://localhost:6379'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_hit_runs_no_queries(self):
+        url = reverse('watchlist-detail', args=[self.movie.id])
+        first = self.client.get(url, format='json')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url, format='json')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    @override_settings(ALLOWED_HOSTS=['internal.local', 'api.example.com'])
+    def test_links_follow_the_host(self):
+        url = reverse('streamplatform-detail', args=[self.platform.id])
+        internal = self.client.get(url, format='json', HTTP_HOST='internal.local:8000')
+        self.assertEqual(internal['X-Cache'], 'MISS')
+        public = self.client.get(url, format='json', HTTP_HOST='api.example.com', secure=True)
+        self.assertEqual(public['X-Cache'], 'MISS')
+        self.assertEqual(public.data['url'], f'https://api.example.com{url}')
+        self.assertEqual(self.client.get(url, format='json', HTTP_HOST='internal.local:8000').data['url'],
+                         f'http://internal.local:8000{url}')
+
+    def test_review_only_evicts_its_movie(self):
+        movie_url = reverse('watchlist-detail', args=[self.movie.id])
+        other_url = reverse('watchlist-detail', args=[self.other.id])
+        reviews_url = reverse('review-list', args=[self.movie.id])
+        for url in (movie_url, other_url, reviews_url):
+            self.client.get(url, format='json')
+
+        self.client.force_authenticate(self.user)
+        self.client.post(reverse('review-create', args=[self.movie.id]), {'rating': 4, 'description': 'Good'}, format='json')
+        self.client.force_authenticate(None)
+
+        movie = self.client.get(movie_url, format='json')
+        self.assertEqual(movie['X-Cache'], 'MISS')
+        self.assertEqual(movie.data['number_ratings'], 1)
+        self.assertEqual(len(self.client.get(reviews_url, format='json').data['results']), 1)
+        self.assertEqual(self.client.get(other_url, format='json')['X-Cache'], 'HIT')
+
+    def test_conditional_requests(self):
+        url = reverse('watchlist-list')
+        response = self.client.get(url, format='json')
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        last_modified = self.client.get(url, format='json')['Last-Modified']
+        response = self.client.get(url, format='json', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = response['ETag']
+        WatchList.objects.create(title='Tenet', storyline='Inverted', platform=self.platform)
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class SearchTests(APITestCase):
+    """
+    ?search= on the watchlist filter view, answered by both search backends.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.netflix = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.hulu = StreamPlatform.objects.create(name='Hulu', about='Streaming service', website='https://www.hulu.com')
+        self.star_wars = WatchList.objects.create(title='Star Wars', storyline='Space opera', platform=self.netflix)
+        self.star_trek = WatchList.objects.create(title='Star Trek', storyline='Space exploration', platform=self.hulu)
+        self.stardust = WatchList.objects.create(title='Stardust', storyline='Fantasy', platform=self.hulu)
+
+    def find(self, query):
+        response = self.client.get(reverse('watchlist-filter'), {'search': query}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [movie['id'] for movie in response.data['results']]
+
+    def check_backend(self):
+        # Terms are AND-ed and match as prefixes, in the title or the platform name
+        self.assertEqual(self.find('star netf'), [self.star_wars.id])
+        self.assertEqual(set(self.find('sta')), {self.star_wars.id, self.star_trek.id, self.stardust.id})
+        self.assertEqual(self.find('hulu trek'), [self.star_trek.id])
+        self.assertEqual(self.find('dune'), [])
+        # The whole word ranks above titles where it is only a prefix
+        self.assertEqual(self.find('star')[-1], self.stardust.id)
+
+        # Writes are visible to the next search
+        self.star_trek.title = 'Deep Space Nine'
+        self.star_trek.save()
+        self.hulu.name = 'Disney'
+        self.hulu.save()
+        self.assertEqual(self.find('trek'), [])
+        self.assertEqual(self.find('disney deep'), [self.star_trek.id])
+        self.stardust.delete()
+        self.assertEqual(self.find('stardust'), [])
+
+    def test_fts5_backend(self):
+        if not FTS5SearchBackend().is_available('default'):
+            self.skipTest('FTS5 not available')
+        self.assertIsInstance(get_search_backend(), FTS5SearchBackend)
+        self.check_backend()
+
+    def test_inverted_index_backend(self):
+        with self.settings(WATCHLIST_SEARCH_BACKEND='watchlist_app.search.InvertedIndexSearchBackend'):
+            self.assertIsInstance(get_search_backend(), InvertedIndexSearchBackend)
+            self.check_backend()
+
+
+class QueryCountTests(QueryCountMixin, APITestCase):
+    """
+    Every list endpoint in watchlist_app/api/urls.py must run a fixed number of queries.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.watchlist = WatchList.objects.create(title='Inception', storyline='A mind-bending thriller', platform=self.platform)
+        Review.objects.create(review_user=self.user, rating=5, description='Great movie!', watchlist=self.watchlist)
+
+    def add_movies(self):
+        for number in range(3):
+            platform = StreamPlatform.objects.create(name=f'Platform {number}', about='Streaming', website='https://example.com')
+            WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=platform)
+
+    def add_reviews(self):
+        for number in range(3):
+            user = User.objects.create_user(username=f'reviewer{number}', password='testpassword')
+            Review.objects.create(review_user=user, rating=4, description='Good', watchlist=self.watchlist)
+
+    def test_watchlist_list_queries(self):
+        self.assertConstantQueries(reverse('watchlist-list'), self.add_movies)
+
+    def test_watchlist_filter_queries(self):
+        self.assertConstantQueries(reverse('watchlist-filter'), self.add_movies)
+
+    def test_streamplatform_list_queries(self):
+        self.assertConstantQueries(reverse('streamplatform-list'), self.add_movies)
+
+    def test_streamplatform_expanded_list_queries(self):
+        self.assertConstantQueries(reverse('streamplatform-list') + '?expand=watchlist', self.add_movies)
+
+    def test_review_list_queries(self):
+        self.assertConstantQueries(reverse('review-list', args=[self.watchlist.id]), self.add_reviews)
+
+    def test_user_review_list_queries(self):
+        self.assertConstantQueries(reverse('user-review-detail'), self.add_reviews)
+
+
+class RequestMetricsTests(APITestCase):
+    """
+    The metrics middleware reports queries and phases, flags N+1 and aggregates per view.
+    """
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        for number in range(6):
+            WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('watchlist-list'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="\d+ queries"')
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+        self.assertNotIn('n-plus-one', timing)
+
+    def test_n_plus_one(self):
+        def view(request):
+            # platform_name without select_related runs one platform query per movie
+            data = serializers.WatchListSerializer(WatchList.objects.all(), many=True).data
+            return HttpResponse(json.dumps(data, default=str))
+
+        with self.assertLogs('moviemate.middleware', 'WARNING') as logs:
+            response = RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('n-plus-one;desc="6 identical statements"', response['Server-Timing'])
+        self.assertIn('watchlist_app_streamplatform', logs.output[0])
+
+    async def test_async_requests(self):
+        def query():
+            try:
+                with connection.cursor() as cursor:  # This thread's own connection
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()
+
+        async def view(request):
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse('ok')
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))  # No thread hop under ASGI
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('watchlist-list'))
+        self.client.get(reverse('watchlist-list'))
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('moviemate_request_duration_ms_count{view="watchlist-list",method="GET"} 2', text)
+        self.assertIn('moviemate_responses_total{view="watchlist-list",method="GET",status="200"} 2', text)
+
+        data = self.client.get(reverse('metrics') + '?format=json').json()
+        self.assertEqual(data['GET watchlist-list']['queries']['count'], 2)
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PlatformCounterTests(APITestCase):
+    """
+    The platform counters follow titles and reviews, the summary endpoint reads only them.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.netflix = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.prime = StreamPlatform.objects.create(name='Prime', about='Streaming service', website='https://www.primevideo.com')
+        self.movies = [WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.netflix)
+                       for number in range(3)]
+        self.users = [User.objects.create(username=f"reviewer{number}") for number in range(3)]
+
+    def post_review(self, user, movie, rating):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('review-create', args=[movie.id]), {'rating': rating, 'description': 'Review'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def assertCounters(self, platform, active_titles, number_ratings, avg_rating):
+        platform.refresh_from_db()
+        self.assertEqual((platform.active_titles, platform.number_ratings), (active_titles, number_ratings))
+        self.assertAlmostEqual(platform.avg_rating, avg_rating)
+
+    def test_counters_follow_writes(self):
+        self.post_review(self.users[0], self.movies[0], 5)
+        self.post_review(self.users[1], self.movies[0], 2)
+        self.post_review(self.users[2], self.movies[1], 5)
+        self.assertCounters(self.netflix, 3, 3, 4.0)
+
+        # Moved and deactivated: the ratings go with the title, the active count doesn't
+        movie = WatchList.objects.get(pk=self.movies[0].pk)
+        movie.platform, movie.active = self.prime, False
+        movie.save()
+        self.assertCounters(self.netflix, 2, 1, 5.0)
+        self.assertCounters(self.prime, 0, 2, 3.5)
+
+        self.netflix.name = 'Netflix US'
+        self.netflix.save()  # An instance read before the reviews doesn't write its counters back
+        self.movies[1].delete()
+        self.assertCounters(self.netflix, 1, 0, 0.0)
+        self.assertEqual(ratings.platform_counter_mismatches(), [])
+
+    def test_summary_endpoint(self):
+        self.post_review(self.users[0], self.movies[0], 4)
+        self.client.force_authenticate(None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('streamplatform-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('watchlist_app_watchlist', queries[0]['sql'])
+        netflix = next(row for row in response.data['results'] if row['id'] == self.netflix.id)
+        self.assertEqual((netflix['active_titles'], netflix['number_ratings'], netflix['avg_rating']), (3, 1, 4.0))
+
+    def test_verify_and_rebuild(self):
+        StreamPlatform.objects.filter(pk=self.netflix.pk).update(active_titles=10)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_platform_counters', '--verify', stdout=StringIO())
+        call_command('rebuild_platform_counters', stdout=StringIO())
+        self.assertCounters(self.netflix, 3, 0, 0.0)
+        call_command('rebuild_platform_counters', '--verify', stdout=StringIO())
+
+
+class ValuesSerializationTests(APITestCase):
+    """
+    Lists rendered from values() rows are byte-identical to the instance serializers.
+    """
+
+    def setUp(self):
+        self.netflix = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.prime = StreamPlatform.objects.create(name='Prime', about='', website='')
+        self.movies = [WatchList.objects.create(title=title, storyline='Storyline', platform=platform)
+                       for title, platform in (('Inception', self.netflix), ('Amélie ☕', self.prime), ('Heat', self.prime))]
+        for number, (movie, description) in enumerate(((self.movies[0], 'Great'), (self.movies[0], None), (self.movies[1], 'Ok'))):
+            user = User.objects.create(username=f'reviewer{number}')
+            Review.objects.create(review_user=user, rating=number + 3, description=description, watchlist=movie)
+        ratings.rebuild_platform_counters()
+        self.request = Request(APIRequestFactory().get('/watch/stream/'))
+
+    def assertSameOutput(self, serializer_class, queryset, context=None):
+        serializer = serializer_class(context=context or {})
+        self.assertTrue(serializer.can_serialize_values())
+        rows = serializer.values_representation(serializer.values_queryset(queryset.order_by('id')))
+        instances = serializer.optimize_queryset(queryset.order_by('id'))
+        expected = serializer_class(instances, many=True, context=context or {}).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_watchlist_rows(self):
+        self.assertSameOutput(serializers.WatchListSerializer, WatchList.objects.all())
+
+    def test_review_rows(self):
+        self.assertSameOutput(serializers.ReviewSerializer, Review.objects.all())
+
+    def test_streamplatform_rows(self):
+        self.assertSameOutput(serializers.StreamPlatformSerializer, StreamPlatform.objects.all(), {'request': self.request})
+
+    def test_nested_fields_keep_the_instances(self):
+        request = Request(APIRequestFactory().get('/watch/stream/', {'expand': 'watchlist'}))
+        self.assertFalse(serializers.StreamPlatformSerializer(context={'request': request}).can_serialize_values())
+
+    def test_list_endpoints_skip_the_models(self):
+        response = self.client.get(reverse('watchlist-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['len_title'] for movie in response.data['results']], [4, 8, 9])
+        self.assertEqual(response.data['results'][1]['platform_name'], 'Prime')
+
+
+class SparseFieldsetTests(APITestCase):
+    """
+    ?fields= and ?exclude= shrink the responses and the queries behind them.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movies = [WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform)
+                       for number in range(5)]
+        user = User.objects.create(username='reviewer')
+        Review.objects.create(review_user=user, rating=4, description='Great', watchlist=self.movies[0])
+        ratings.rebuild_platform_counters()
+
+    def get_with_queries(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, '\n'.join(query['sql'] for query in queries)
+
+    def test_fields_select_only_their_columns(self):
+        response, sql = self.get_with_queries(reverse('watchlist-list'), {'fields': 'id,title,avg_rating'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title', 'avg_rating'])
+        self.assertNotIn('storyline', sql)
+        self.assertNotIn('JOIN', sql)  # No platform_name
+        self.assertNotIn('LENGTH', sql)  # No len_title
+
+        response, sql = self.get_with_queries(reverse('user-review-detail'), {'exclude': 'review_user'})
+        self.assertNotIn('review_user', response.data['results'][0])
+        self.assertNotIn('JOIN', sql)
+
+    def test_cursor_without_the_ordering_fields(self):
+        ids, url = [], reverse('watchlist-list') + '?fields=title&ordering=-avg_rating&page_size=2'
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(list(response.data['results'][0]), ['title'])
+            ids.extend(movie['title'] for movie in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, list(WatchList.objects.order_by('-avg_rating', '-id').values_list('title', flat=True)))
+
+    def test_nested_fields(self):
+        response, sql = self.get_with_queries(reverse('streamplatform-list'), {'fields': 'name'})
+        self.assertEqual(response.data['results'], [{'name': 'Netflix'}])
+        self.assertNotIn('COUNT', sql)  # No watchlist_count
+
+        response, sql = self.get_with_queries(reverse('streamplatform-list'),
+                                              {'expand': 'watchlist', 'fields': 'name,watchlist.title'})
+        self.assertEqual(response.data['results'][0]['watchlist'][0], {'title': 'Movie 0'})
+        self.assertNotIn('storyline', sql)
+
+    def test_detail_and_write_responses(self):
+        response = self.client.get(reverse('watchlist-detail', args=[self.movies[0].pk]), {'exclude': 'storyline,len_title'})
+        self.assertNotIn('storyline', response.data)
+        self.assertEqual(response.data['title'], 'Movie 0')
+
+        # Writes validate and return every field
+        self.client.force_authenticate(User.objects.create(username='writer'))
+        response = self.client.post(reverse('watchlist-list') + '?fields=id',
+                                    {'title': 'New movie', 'storyline': 'Plot', 'platform': self.platform.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['storyline'], 'Plot')
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse('watchlist-list'), {'fields': 'id,budget'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('budget', response.data['fields'][0])
+
+        response = self.client.get(reverse('streamplatform-list'), {'exclude': 'name.first'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('async-watchlist-list'), {'fields': 'budget'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FastJSONRendererTests(APITestCase):
+    """
+    FastJSONRenderer writes JSONRenderer's JSON, list pages reuse the encoded rows until they change.
+    """
+
+    def setUp(self):
+        cache.clear()
+        fragment_cache.clear()
+        self.platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movies = [WatchList.objects.create(title=f'Movie {number}', storyline='Storyline', platform=self.platform)
+                       for number in range(3)]
+
+    def test_same_bytes_as_json_renderer(self):
+        from datetime import datetime, timezone
+        from decimal import Decimal
+        data = {'title': 'Amélie \u2028 ☕', 'when': datetime(2024, 5, 1, 12, 30, 15, 120, tzinfo=timezone.utc),
+                'price': Decimal('1.50'), 'ids': (1, 2), 'big': 2 ** 70, 'nested': [{'avg': 3.75, 'none': None}]}
+        expected = JSONRenderer().render(data)
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        orjson, renderers.orjson = renderers.orjson, None  # Without orjson the standard library writes them
+        try:
+            self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        finally:
+            renderers.orjson = orjson
+
+    @skipUnless(renderers.orjson, 'orjson is not installed')
+    def test_orjson_differences(self):
+        data = {'big': 1e16, 'small': 0.00001}
+        content = renderers.FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(content), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(renderers.FastJSONRenderer().render({'avg': float('nan')}), b'{"avg":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'avg': float('nan')})
+
+    def test_fragments_are_joined(self):
+        fragments = [renderers.Fragment({'id': pk}, renderers.dumps({'id': pk})) for pk in (1, 2)]
+        content = renderers.FastJSONRenderer().render({'next': None, 'results': fragments})
+        self.assertEqual(content, JSONRenderer().render({'next': None, 'results': [{'id': 1}, {'id': 2}]}))
+
+    def test_cached_rows_follow_writes(self):
+        url = reverse('watchlist-list')
+        first = self.client.get(url)
+        self.assertEqual(first.content, JSONRenderer().render(first.data))
+        self.assertTrue(all(isinstance(movie, renderers.Fragment) for movie in first.data['results']))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'page_size': 4})  # Another response, the same rows
+        self.assertEqual(len(queries), 1)  # The page, no reload of missing rows
+        self.assertEqual(second.content, first.content)
+
+        self.assertEqual(len(fragment_cache), 3)
+
+        # The movies' own rows don't change, their fragments are checked against the platform name they show
+        StreamPlatform.objects.filter(pk=self.platform.pk).update(name='Netflix US')
+        third = self.client.get(url, {'page_size': 3})
+        self.assertEqual({movie['platform_name'] for movie in third.data['results']}, {'Netflix US'})
+
+        self.movies[0].delete()
+        self.assertEqual(len(fragment_cache), 2)
+
+
+class ReadReplicaRouterTests(APITestCase):
+    """
+    GETs of watchlist_app views read from the replica, a client that just wrote reads from the primary.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def run_view(self, middleware, request, view_module='watchlist_app.api.views', status_code=200):
+        seen = {}
+
+        def view(request):
+            seen['alias'] = ReadReplicaRouter().db_for_read(WatchList)
+            return HttpResponse(status=status_code)
+        view.__module__ = view_module
+
+        def get_response(request):
+            return middleware.process_view(request, view, (), {}) or view(request)
+
+        middleware.get_response = get_response
+        middleware(request)
+        return seen['alias']
+
+    def middleware(self):
+        middleware = ReplicaPinMiddleware(None)
+        middleware.enabled = True  # The test database has no 'replica' alias, the views here don't query
+        return middleware
+
+    def test_reads_go_to_the_replica(self):
+        middleware = self.middleware()
+        self.assertEqual(self.run_view(middleware, self.factory.get('/watchlist/list/')), 'replica')
+        self.assertIsNone(self.run_view(middleware, self.factory.get('/account/login/'), 'user_app.api.views'))
+        self.assertIsNone(ReadReplicaRouter().db_for_read(WatchList))  # Reset after the request
+        self.assertEqual(ReadReplicaRouter().db_for_write(WatchList), 'default')
+
+    def test_writer_is_pinned_to_the_primary(self):
+        middleware = self.middleware()
+        token = {'HTTP_AUTHORIZATION': 'Bearer writer'}
+        self.assertIsNone(self.run_view(middleware, self.factory.post('/watchlist/1/reviews/create/', **token), status_code=201))
+        self.assertIsNone(self.run_view(middleware, self.factory.get('/watchlist/list/', **token)))
+        # Other clients still read from the replica
+        self.assertEqual(self.run_view(middleware, self.factory.get('/watchlist/list/', HTTP_AUTHORIZATION='Bearer reader')), 'replica')
+
+    def test_disabled_without_replica_alias(self):
+        self.assertFalse(ReplicaPinMiddleware(None).enabled)
+        self.assertFalse(ReadReplicaRouter().allow_migrate('replica', 'watchlist_app'))
+
+
+
+class SimilarTitlesTests(APITestCase):
+    """
+    Item-item cosine neighbours from the reviews, served from the mapped file.
+    """
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'similar.bin')
+        settings_override = override_settings(SIMILAR_TITLES_PATH=self.path, SIMILAR_TITLES_K=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        platform = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.movies = [WatchList.objects.create(title=f'Movie {number}', storyline='Story', platform=platform)
+                       for number in range(7)]
+        self.users = [User.objects.create_user(username=f'fan{number}', password='testpassword') for number in range(5)]
+        # Movies 0 and 1 are rated alike, movie 2 by other users, movie 4 by nobody, 5 and 6 by a fan of their own
+        for user, scores in zip(self.users, [(5, 5, 1, 2), (4, 5, 0, 3), (0, 1, 5, 0), (1, 0, 4, 4), (0, 0, 0, 0, 0, 3, 4)]):
+            for movie, rating in zip(self.movies, scores):
+                if rating:
+                    Review.objects.create(review_user=user, watchlist=movie, rating=rating, description='Review')
+
+    def test_similar_titles_endpoint(self):
+        url = reverse('watchlist-similar', args=[self.movies[0].pk])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        call_command('build_similar_titles', stdout=StringIO())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['id'] for movie in response.data['results']],
+                         [self.movies[1].pk, self.movies[3].pk, self.movies[2].pk])
+        self.assertEqual(response.data['results'][0]['title'], 'Movie 1')
+        self.assertAlmostEqual(response.data['results'][0]['similarity'], 45 / math.sqrt(42 * 51), places=4)
+
+        self.assertEqual(len(self.client.get(url, {'limit': 1}).data['results']), 1)
+        self.assertEqual(self.client.get(url, {'limit': 4}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('watchlist-similar', args=[self.movies[4].pk])).data['results'], [])
+        self.assertEqual(self.client.get(reverse('watchlist-similar', args=[999])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_incremental_build_matches_a_full_build(self):
+        WatchList.objects.update(updated=timezone.now() - timedelta(hours=1))
+        recommendations.build_similar_titles()
+
+        # A new review on movie 4 and a deleted one on movie 2 (the API bumps the movies' updated)
+        self.client.force_authenticate(self.users[2])
+        self.client.post(reverse('review-create', args=[self.movies[4].pk]), {'rating': 5, 'description': 'New'}, format='json')
+        review = Review.objects.get(review_user=self.users[3], watchlist=self.movies[2])
+        self.client.force_authenticate(self.users[3])
+        self.assertEqual(self.client.delete(reverse('review-detail', args=[review.pk])).status_code, status.HTTP_204_NO_CONTENT)
+
+        with mock.patch.object(recommendations, 'WATERMARK_OVERLAP', timedelta(0)):
+            result = recommendations.build_similar_titles()
+        self.assertFalse(result['full'])
+        self.assertEqual((result['recomputed'], result['titles']), (5, 7))  # Movies 5 and 6 share no reviewer, kept as is
+        incremental = list(recommendations.get_index().rows())
+
+        full_path = self.path + '.full'
+        recommendations.build_similar_titles(full_path, full=True)
+        self.assertEqual(incremental, list(recommendations.SimilarityIndex(full_path).rows()))
+
+    def test_64_bit_ids(self):
+        big = 2 ** 40
+        recommendations.write_index(self.path, 3, {big: [(big + 1, 0.5)], big + 1: [(big, 0.5)]}, 0.0)
+        index = recommendations.SimilarityIndex(self.path)
+        self.addCleanup(index.close)
+        self.assertEqual(index.neighbours(big + 1), [(big, 0.5)])
+
+    def test_other_k_or_version_rebuilds(self):
+        recommendations.build_similar_titles()
+        with mock.patch.object(recommendations.SimilarityIndex, 'close', autospec=True,
+                               side_effect=recommendations.SimilarityIndex.close) as close:
+            self.assertTrue(recommendations.build_similar_titles(k=2)['full'])
+        close.assert_called_once()  # The old mapping is released before the file is replaced
+
+        with open(self.path, 'r+b') as file:
+            file.write(b'MMSIM\x00\x01\x00')  # Version 1, 32-bit ids
+        self.assertIsNone(recommendations.get_index())
+        self.assertTrue(recommendations.build_similar_titles()['full'])
+        self.assertEqual(len(recommendations.get_index()), 6)
+
+    @skipUnless(recommendations.np is not None, 'NumPy and SciPy are optional')
+    def test_sparse_and_python_builds_agree(self):
+        users, items, ratings_ = recommendations.load_ratings()
+        targets = set(items)
+        sparse = recommendations._sparse_neighbours(users, items, ratings_, targets, 3, batch_size=2)
+        self.assertEqual(sparse, recommendations._python_neighbours(users, items, ratings_, targets, 3))
+
+
+class LeaderboardTests(APITestCase):
+    """
+    Top rated by Bayesian average and trending by decayed review counts, from the indexed columns.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.netflix = StreamPlatform.objects.create(name='Netflix', about='Streaming service', website='https://www.netflix.com')
+        self.hulu = StreamPlatform.objects.create(name='Hulu', about='Streaming service', website='https://www.hulu.com')
+        self.lucky = WatchList.objects.create(title='One Review', storyline='Story', platform=self.netflix)
+        self.solid = WatchList.objects.create(title='Many Reviews', storyline='Story', platform=self.netflix)
+        self.other = WatchList.objects.create(title='Hulu Movie', storyline='Story', platform=self.hulu)
+        self.users = [User.objects.create(username=f'critic{number}') for number in range(10)]
+
+    def review(self, user, movie, rating, created=None):
+        dated = {'created': created} if created is not None else {}
+        return Review.objects.create(review_user=user, watchlist=movie, rating=rating, description='Review', **dated)
+
+    def board(self, board, **params):
+        response = self.client.get(reverse('watchlist-leaderboard', args=[board]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(movie['title'], round(movie['score'], 3)) for movie in response.data['results']]
+
+    def test_bayesian_average_needs_more_than_one_review(self):
+        self.review(self.users[0], self.lucky, 5)
+        for user, rating in zip(self.users, [5, 4] * 5):
+            self.review(user, self.solid, rating)
+        self.assertEqual(self.board('top-rated'), [('Many Reviews', 3.75), ('One Review', 3.182), ('Hulu Movie', 3.0)])
+        self.assertEqual(self.board('top-rated', platform=self.hulu.pk, limit=1), [('Hulu Movie', 3.0)])
+
+        WatchList.objects.filter(pk=self.solid.pk).update(active=False)
+        cache.clear()
+        self.assertEqual(self.board('top-rated', limit=1), [('One Review', 3.182)])
+        self.assertEqual(self.client.get(reverse('watchlist-leaderboard', args=['popular'])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('watchlist-leaderboard', args=['trending']), {'limit': 0}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_trending_decays_with_the_age_of_the_reviews(self):
+        today = timezone.now()
+        for user in self.users[:3]:
+            self.review(user, self.lucky, 3, created=today - timedelta(days=7))  # Half a review each
+        for user in self.users[:2]:
+            self.review(user, self.solid, 3)
+        self.assertEqual(self.board('trending'), [('Many Reviews', 2.0), ('One Review', 1.5), ('Hulu Movie', 0.0)])
+
+        # Deleted reviews take their weight back from the bucket of their day
+        self.client.force_authenticate(self.users[0])
+        review = Review.objects.get(review_user=self.users[0], watchlist=self.solid)
+        self.assertEqual(self.client.delete(reverse('review-detail', args=[review.pk])).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.board('trending', limit=2), [('One Review', 1.5), ('Many Reviews', 1.0)])
+        self.assertEqual(sorted(ReviewDay.objects.values_list('watchlist_id', 'reviews')), [(self.lucky.pk, 3), (self.solid.pk, 1)])
+
+        # The rollup recomputes the same scores from the buckets and drops the days out of the window
+        WatchList.objects.update(trending_score=0)
+        call_command('rollup_leaderboards', stdout=StringIO())
+        self.assertEqual(self.board('trending', limit=2), [('One Review', 1.5), ('Many Reviews', 1.0)])
+        leaderboards.rollup(today=timezone.localdate() + timedelta(days=settings.LEADERBOARD_BUCKET_DAYS - 7))
+        self.assertEqual(list(ReviewDay.objects.values_list('watchlist_id', flat=True)), [self.solid.pk])
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_boards_read_the_index(self):
+        for board in leaderboards.BOARDS:
+            for platform_id in (None, self.netflix.pk):
+                queryset = leaderboards.board_queryset(board, platform_id)[:10]
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + str(queryset.query))
+                    plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+                self.assertNotIn('TEMP B-TREE', plan)  # No sort of the table
+                self.assertIn('INDEX watchlist_', plan)